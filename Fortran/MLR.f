@@ -40,6 +40,19 @@
 ! Following section is revision history
 !
 !=========================================================================
+! 18.10.26 Scan of the steric grid parallelized with OpenMP in ScanGrid,
+!          compiled with: sh ./link.sh openmp
+!
+!=========================================================================
+! 18.10.26 Added server mode, run as: MLR.x myfile.matrix server
+!          The matrix is read once, then jobs (skipped systems, rows and
+!          experimental data of the job matrix) are read from stdin and
+!          one result record per job is written, see mlr_server.f
+!          The scan of the steric grid is moved to ScanGrid, scan_grid.f
+!          Added quiet mode, run as: MLR.x myfile.matrix quiet
+!          Only the result record of the input matrix is written
+!
+!=========================================================================
 ! 30.03.22 Added labels at the beginning of the electronic descriptor lines
 !
 !=========================================================================
@@ -133,6 +146,8 @@
       Real*8, Allocatable :: Skip_Ele(:)    ! Skipped system Electronic Parameters
       Real*8, Allocatable :: Skip_Vb(:,:)   ! Skipped system Vbur
       Real*8, Allocatable :: Coef(:)   ! MLR coefficients array
+      Real*8, Allocatable :: R2(:)     ! R2 of each grid point
+      Real*8, Allocatable :: CoefGrid(:,:)  ! MLR coefficients of each grid point
 
       Real*8              :: Exp_AV         ! Experimental average
       Real*8              :: Exp_SD         ! Experimental standard deviation
@@ -150,6 +165,7 @@ c     Real*8              :: SSE            ! S
 c     Real*8              :: tmp, tmp1, tmp2
 
       Character*150  InputFile                   ! matrix file name
+      Character*10   RunMode                     ! 'server' or 'quiet' mode
       Character*153  MatrixOutFile               ! matrix output file name with best radius only
       Character*200  Title                       ! matrix title line
       Character*12   Lab_Exp                     ! Experimental data labels
@@ -163,6 +179,8 @@ c     Real*8              :: tmp, tmp1, tmp2
 !=========================================================================
       Integer :: NormalizeFlag                  ! = 1, normalize the variables
       Integer :: key_warn                       ! = 1, key setting a warn on unreliable fitting
+      Logical :: Server                         ! = .true., run as server, see mlr_server.f
+      Logical :: Quiet                          ! = .true., write the result record only
 
 !=========================================================================
 ! variables for the mkl library
@@ -191,6 +209,9 @@ c     Real*8 :: Rs, Rl, dum1, dum2
 
 
       call getarg(1,InputFile)
+      call getarg(2,RunMode)
+      Server = RunMode .eq. 'server'
+      Quiet  = RunMode .eq. 'quiet'
 
 !=========================================================================
 ! Reading the control part
@@ -227,14 +248,16 @@ c     Real*8 :: Rs, Rl, dum1, dum2
 ! IShift = 1 : Y = c0 + c1*factor1 + c2*factor2 + ...
 ! IShift = 0 : Y = c1*factor1 + c2*factor2 + ...
 !=========================================================================
-		  write(6,*)'  ISh000  ',Ishift, nVariables
+      if (.not.(Server.or.Quiet))
+     x   write(6,*)'  ISh000  ',Ishift, nVariables
       if (IShift .eq. 0) n = nVariables 
       if (IShift .eq. 1) then
          n = nVariables + 1
          nVariables  = nVariables + 1
       endif
 
-		  write(6,*)'  ISh111  ',Ishift, nVariables
+      if (.not.(Server.or.Quiet))
+     x   write(6,*)'  ISh111  ',Ishift, nVariables
 !=========================================================================
 ! Allocate memory
 !=========================================================================
@@ -248,6 +271,8 @@ c     Real*8 :: Rs, Rl, dum1, dum2
       Allocate (Electronic(nSystem,nElectronics))
       Allocate (temp(nSystem*2))
       Allocate (Coef(nVariables))
+      Allocate (R2(nPoints))
+      Allocate (CoefGrid(nVariables,nPoints))
 
       Allocate (Skip_Ele(nElectronics))
       Allocate (Skip_Vb(nPoints,nSteric))
@@ -285,6 +310,17 @@ c     Real*8 :: Rs, Rl, dum1, dum2
         enddo
       enddo
 
+!=========================================================================
+! Server mode: the matrix is kept in memory, and jobs are read from stdin
+! Quiet mode: only the result record of the input matrix is written
+!=========================================================================
+      if (Server .or. Quiet) then
+         call MLRServer(Experiments, Electronic, Vb, Rv, Rr,
+     +        nSystem, nElectronics, nSteric, nPoints, n,
+     +        NormalizeFlag, IShift, Quiet, nSkip, indSkip)
+         stop
+      endif
+
 !=========================================================================
 ! Write out header and input data
 !=========================================================================
@@ -529,84 +565,35 @@ c     Real*8 :: Rs, Rl, dum1, dum2
          enddo
       enddo
 !=========================================================================
-! solve the linear equation systems
+! solve the linear equation systems, on OMP_NUM_THREADS threads if MLR.x
+! is compiled with OpenMP. Best point is selected after the scan, as the
+! first one with max R2, whatever the number of threads
 !=========================================================================
+      call ScanGrid(WK_Experiments, WK_Electronic, WK_Vb,
+     +     WK_nSystem, nSystem, nElectronics, nSteric, nPoints,
+     +     IShift, n, R2, CoefGrid)
+
       std1 = 0.0
       do i = 1, WK_nSystem
         std1 = std1 + WK_Experiments(i)
-        B(i,1) = WK_Experiments(i)
       enddo
       std1 = std1 / dble(WK_nSystem)
 
       std2 = 0.0
       do i = 1, WK_nSystem
-        std2 = std2 + (B(i,1) - std1)**2.
+        std2 = std2 + (WK_Experiments(i) - std1)**2.
       enddo
 
       R2Max = 0.0
       nMax = 0
       do i = 1, nPoints
-        ! convert variables to A and B
-        do j = 1, WK_nSystem
-          B(j,1) = WK_Experiments(j)
-
-          if (IShift .eq. 0) then
-            do k = 1, nElectronics ! c1...cn-2 for electronics
-              A(j,k) = WK_Electronic(j,k)
-            enddo
-            l = 1 + nElectronics 
-          end if
-          if (IShift .eq. 1) then
-            A(j,1) = 1.0      ! shift: c0
-            do k = 1, nElectronics ! c1...cn-2 for electronics
-              l  = k  + 1
-              A(j,l) = WK_Electronic(j,k)
-            enddo
-            l = 1 + nElectronics + 1
-          end if
-          if (IShift .eq. 0)then
-            do l = nElectronics + 1, nElectronics + nSteric
-              k = l - nElectronics
-              A(j,l) = WK_Vb(j,i,k)
-            enddo
-          endif
-          if (Ishift .eq. 1)then
-            do l = nElectronics + 2, nElectronics + nSteric + 1
-              k = l - nElectronics - 1
-              A(j,l) = WK_Vb(j,i,k)
-            enddo 
-          endif
-        enddo
-
-       lwork = -1
-       call dgels( 'No transpose', WK_nSystem, N, NRHS, A, LDA, 
-     x                B, LDB, WORK, LWORK, INFO)
-       lwork = MIN( LWMAX, INT( WORK( 1 ) ) )
-       call dgels( 'No transpose', WK_nSystem, N, NRHS, A, LDA, 
-     x                B, LDB, WORK, LWORK, INFO )
-
-c      write(6,*)' Coef ', n, Coef
-c      write(6,*)' B ', n, B
-
-       do l = 1, n
-         Coef(l) = B(l,1)
-       enddo
-       std = 0.0
-       do l = 1, WK_NSystem-n
-         std = std + B(n+l,1)*B(n+l,1)
-       enddo
-c      write(6,'(a10,2i5,9f12.4)')'dbg',WK_NSystem,n,std,std2,
-c    x      1.0 - std/std2, Rv(i), Rr(i) 
-       if (1.0-std/std2 .gt. R2max) then
-         R2max = 1.0-std/std2
+       if (R2(i) .gt. R2max) then
+         R2max = R2(i)
          nMax = i
        endif
        write(6,*)"NP " 
-     x         ,i,nMax,Rv(i),Rr(i),1.0-std/std2,R2max
-     x         ,(B(k,1),k=1,n)
-c      write(6,'(a3,2i5,2f6.2,20e12.4)')"NP " 
-c    x         ,i,nMax,Rv(i),Rr(i),1.0-std/std2,R2max
-c    x         ,(B(k,1),k=1,n)
+     x         ,i,nMax,Rv(i),Rr(i),R2(i),R2max
+     x         ,(CoefGrid(k,i),k=1,n)
       enddo
 
 !=========================================================================
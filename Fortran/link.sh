@@ -1,2 +1,10 @@
+# sh ./link.sh          serial MLR.x
+# sh ./link.sh openmp   MLR.x scanning the steric grid on OMP_NUM_THREADS threads
+
+FLAGS=""
+if [ "$1" = "openmp" ]; then
+   FLAGS="-fopenmp"
+fi
+
 echo "compiling....."
-gfortran -o MLR.x MLR.f normalization*f dnormal*f -lblas -llapack
+gfortran $FLAGS -o MLR.x MLR.f mlr_server.f scan_grid.f normalization*f dnormal*f -lblas -llapack
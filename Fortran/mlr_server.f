@@ -0,0 +1,362 @@
+!=========================================================================
+! Subroutine MLRServer
+!
+! Server mode of MLR.x, run as:   MLR.x myfile.matrix server
+!
+! The matrix is read once by the main program, then jobs are read from
+! stdin until end of file. Each job is a MLR run on a matrix derived from
+! the input one, and it is described by three lines:
+!
+!  Line 1 : nSkip and index of the nSkip systems to be skipped
+!  Line 2 : nRows and index of the input systems making the rows of the
+!           job matrix, i.e. the bootstrap bags. nRows = 0 takes all the
+!           input systems in input order
+!  Line 3 : nExp and index of the input systems whose experimental value
+!           is taken for each row, i.e. the y-randomization shuffles.
+!           nExp = 0 takes the experimental values of the rows
+!
+! For each job one record is written to stdout, on a single line:
+!
+!  MLR  job  nMax  nRows  n  R2  Rv  Rr  n coefficients  and for each
+!  row: normalized experimental value, normalized fitted value and
+!  fitted value in input units
+!
+! Values are written with the same number of digits as in the Max R2,
+! LOO and Fit/Pre lines of a standard run. A job that cannot be run
+! gives the record:   ERR  job  message
+! Rm- matrix files are never written in server mode.
+!
+! Quiet mode, run as:   MLR.x myfile.matrix quiet
+!
+! A single job is run, on the input matrix with its own skipped systems,
+! and its record is the only output.
+!=========================================================================
+      subroutine MLRServer(Experiments, Electronic, Vb, Rv, Rr,
+     +           nSystem, nElectronics, nSteric, nPoints, n,
+     +           NormalizeFlag, IShift, Quiet, nSkip0, indSkip0)
+
+      IMPLICIT NONE
+
+      Integer nSystem                        ! # of systems
+      Integer nElectronics                   ! # of electronic parameters
+      Integer nSteric                        ! # of steric parameters
+      Integer nPoints                        ! # of points in the steric grid
+      Integer n                              ! # of coefficients
+      Integer NormalizeFlag                  ! normalization protocol
+      Integer IShift                         ! key to force fitting through origin
+      Logical Quiet                          ! = .true., single job from the input matrix
+      Integer nSkip0                         ! # of systems skipped in the input matrix
+      Integer indSkip0(nSkip0)               ! index of systems skipped in the input matrix
+
+      Real*8  Experiments(nSystem)                ! experimental values
+      Real*8  Electronic(nSystem,nElectronics)    ! Electronic Parameters
+      Real*8  Vb(nSystem,nPoints,nSteric)         ! % buried volume descriptors
+      Real*8  Rv(nPoints)                         ! Vicinal radius
+      Real*8  Rr(nPoints)                         ! Remote radius
+
+!=========================================================================
+! local variables
+!=========================================================================
+      Integer i, j, k, l, iErr
+      Integer nJob                           ! # of current job
+      Integer nSkip                          ! # of systems to be skipped
+      Integer nRows                          ! # of systems in the job matrix
+      Integer nExp                           ! # of experimental values reordered
+      Integer nSys                           ! # of systems in the job matrix
+      Integer WK_nSystem                     ! # of systems fitted
+      Integer nMax                           ! # of point with max R2
+      Integer key_warn                       ! = 1, unreliable fitting
+
+      Integer, Allocatable :: indSkip(:)     ! index of systems to be skipped
+      Integer, Allocatable :: Rows(:)        ! input system of each row
+      Integer, Allocatable :: ExpRows(:)     ! input experimental value of each row
+      Integer, Allocatable :: iSkip(:)       ! tag indicating a system to be skipped
+
+      Real*8, Allocatable :: J_Experiments(:)     ! job experimental values
+      Real*8, Allocatable :: J_Electronic(:,:)    ! job Electronic Parameters
+      Real*8, Allocatable :: J_Vb(:,:,:)          ! job % buried volumes
+      Real*8, Allocatable :: WK_Experiments(:)    ! work array experimental values
+      Real*8, Allocatable :: WK_Electronic(:,:)   ! work array Electronic Parameters
+      Real*8, Allocatable :: WK_Vb(:,:,:)         ! work array % buried volumes
+      Real*8, Allocatable :: Fit(:)               ! Fitted experimental values
+      Real*8, Allocatable :: Ele_AV(:)            ! Electronic averages
+      Real*8, Allocatable :: Ele_SD(:)            ! Electronic standard deviations
+      Real*8, Allocatable :: Vb_AV(:,:)           ! Steric averages
+      Real*8, Allocatable :: Vb_SD(:,:)           ! Steric standard deviations
+      Real*8, Allocatable :: R2(:)                ! R2 of each grid point
+      Real*8, Allocatable :: CoefGrid(:,:)        ! coefficients of each grid point
+      Real*8, Allocatable :: Coef(:)              ! coefficients of the best point
+
+      Real*8  Exp_AV, Exp_SD, R2max, RvMax, RrMax
+
+      Character*100000 aLine                 ! job line read from stdin
+
+      Allocate (Ele_AV(nElectronics))
+      Allocate (Ele_SD(nElectronics))
+      Allocate (Vb_AV(nPoints,nSteric))
+      Allocate (Vb_SD(nPoints,nSteric))
+      Allocate (R2(nPoints))
+      Allocate (CoefGrid(n,nPoints))
+      Allocate (Coef(n))
+
+      if(NormalizeFlag.lt.0 .or. NormalizeFlag.gt.4) then
+         write(6,'(a3,i8,2x,a)')'ERR',0,
+     x        'NormalizeFlag key out of allowed range 0-4'
+         return
+      endif
+      if(IShift.lt.0 .or. IShift.gt.1) then
+         write(6,'(a3,i8,2x,a)')'ERR',0,
+     x        'IShift key out of allowed range 0-1'
+         return
+      endif
+
+      nJob = 0
+      do
+
+!=========================================================================
+! Read the job, stop at end of file. Quiet mode: the input matrix only
+!=========================================================================
+        if (Quiet) then
+           if (nJob.gt.0) goto 900
+           nJob = 1
+           nSkip = nSkip0
+           allocate(indSkip(nSkip), Rows(0), ExpRows(0))
+           indSkip(1:nSkip) = indSkip0(1:nSkip)
+           nRows = 0
+           nExp = 0
+           iErr = 0
+        else
+           read(5,'(a)',end=900)aLine
+           nJob = nJob + 1
+           call ReadList(aLine, nSkip, indSkip, iErr)
+           read(5,'(a)',end=900)aLine
+           if (iErr.eq.0) call ReadList(aLine, nRows, Rows, iErr)
+           read(5,'(a)',end=900)aLine
+           if (iErr.eq.0) call ReadList(aLine, nExp, ExpRows, iErr)
+        endif
+
+        if (iErr.ne.0) then
+           write(6,'(a3,i8,2x,a)')'ERR',nJob,'Job lines not readable'
+           flush(6)
+           cycle
+        endif
+
+        nSys = nSystem
+        if (nRows.gt.0) nSys = nRows
+
+        if (nRows.eq.0) then
+           deallocate(Rows)
+           allocate(Rows(nSys))
+           do i = 1, nSys
+              Rows(i) = i
+           enddo
+        endif
+        if (nExp.eq.0) then
+           deallocate(ExpRows)
+           allocate(ExpRows(nSys))
+           ExpRows(1:nSys) = Rows(1:nSys)
+        endif
+
+!=========================================================================
+! Sanity check on job indices
+!=========================================================================
+        iErr = 0
+        if (nExp.ne.0 .and. nExp.ne.nSys) iErr = 1
+        do i = 1, nSys
+           if (Rows(i).lt.1 .or. Rows(i).gt.nSystem) iErr = 1
+           if (ExpRows(i).lt.1 .or. ExpRows(i).gt.nSystem) iErr = 1
+        enddo
+        do j = 1, nSkip
+           if (indSkip(j).lt.1 .or. indSkip(j).gt.nSys) iErr = 1
+        enddo
+        if (iErr.ne.0) then
+           write(6,'(a3,i8,2x,a)')'ERR',nJob,
+     x          'ID of system out of allowed range'
+           flush(6)
+           cycle
+        endif
+
+        if ((nSys - nSkip).lt.n) then
+           write(6,'(a3,i8,2x,a)')'ERR',nJob,
+     x          'You remove too many systems'
+           flush(6)
+           cycle
+        endif
+
+!=========================================================================
+! Assemble the job matrix and tag systems to be skipped
+!=========================================================================
+        Allocate (J_Experiments(nSys))
+        Allocate (J_Electronic(nSys,nElectronics))
+        Allocate (J_Vb(nSys,nPoints,nSteric))
+        Allocate (WK_Experiments(nSys))
+        Allocate (WK_Electronic(nSys,nElectronics))
+        Allocate (WK_Vb(nSys,nPoints,nSteric))
+        Allocate (Fit(nSys))
+        Allocate (iSkip(nSys))
+
+        do i = 1, nSys
+           J_Experiments(i) = Experiments(ExpRows(i))
+           do k = 1, nElectronics
+              J_Electronic(i,k) = Electronic(Rows(i),k)
+           enddo
+           do k = 1, nPoints
+              do l = 1, nSteric
+                 J_Vb(i,k,l) = Vb(Rows(i),k,l)
+              enddo
+           enddo
+        enddo
+
+        do i = 1, nSys
+           iSkip(i) = 0
+           do j = 1, nSkip
+              if(i.eq.indSkip(j))iSkip(i)=1
+           enddo
+        enddo
+
+!=========================================================================
+! Normalization protocol, as in the main program
+!=========================================================================
+        if(NormalizeFlag.eq.0) then
+           call normalization0(J_Experiments, J_Electronic, J_Vb,
+     +          Exp_AV, Exp_SD, Ele_AV, Ele_SD, Vb_AV, Vb_SD,
+     +          nSys, nSteric, nElectronics, nPoints)
+        endif
+        if(NormalizeFlag.eq.1) then
+           call normalization1(J_Experiments, J_Electronic, J_Vb,
+     +          Exp_AV, Exp_SD, Ele_AV, Ele_SD, Vb_AV, Vb_SD,
+     +          nSys, nSteric, nElectronics, nPoints)
+        endif
+        if(NormalizeFlag.eq.2) then
+           call normalization2(J_Experiments, J_Electronic, J_Vb,
+     +          Exp_AV, Exp_SD, Ele_AV, Ele_SD, Vb_AV, Vb_SD,
+     +          nSys, nSteric, nElectronics, nPoints, iSkip)
+        endif
+        if(NormalizeFlag.eq.3) then
+           call normalization3(J_Experiments, J_Electronic, J_Vb,
+     +          Exp_AV, Exp_SD, Ele_AV, Ele_SD, Vb_AV, Vb_SD,
+     +          nSys, nSteric, nElectronics, nPoints)
+        endif
+        if(NormalizeFlag.eq.4) then
+           call normalization4(J_Experiments, J_Electronic, J_Vb,
+     +          Exp_AV, Exp_SD, Ele_AV, Ele_SD, Vb_AV, Vb_SD,
+     +          nSys, nSteric, nElectronics, nPoints, iSkip)
+        endif
+
+!=========================================================================
+! Transfer systems not skipped into work arrays
+!=========================================================================
+        WK_nSystem = 0
+        do i = 1, nSys
+           if (iSkip(i).eq.0) then
+              WK_nSystem = WK_nSystem + 1
+              WK_Experiments(WK_nSystem) = J_Experiments(i)
+              do k = 1, nElectronics
+                 WK_Electronic(WK_nSystem,k) = J_Electronic(i,k)
+              enddo
+              do k = 1, nPoints
+                 do l = 1, nSteric
+                    WK_Vb(WK_nSystem,k,l) = J_Vb(i,k,l)
+                 enddo
+              enddo
+           endif
+        enddo
+
+!=========================================================================
+! Scan the grid, best point is the first one with max R2
+!=========================================================================
+        call ScanGrid(WK_Experiments, WK_Electronic, WK_Vb,
+     +       WK_nSystem, nSys, nElectronics, nSteric, nPoints,
+     +       IShift, n, R2, CoefGrid)
+
+        R2max = 0.0
+        nMax = 0
+        do i = 1, nPoints
+           if (R2(i) .gt. R2max) then
+              R2max = R2(i)
+              nMax = i
+           endif
+        enddo
+
+        if (nMax.eq.0) then
+           write(6,'(a3,i8,2x,a)')'ERR',nJob,
+     x          'No grid point with positive R2'
+           flush(6)
+        else
+
+!=========================================================================
+! Sanity check on coefficients, then fitted values
+!=========================================================================
+           RvMax = Rv(nMax)
+           RrMax = Rr(nMax)
+           do l = 1, n
+              Coef(l) = CoefGrid(l,nMax)
+           enddo
+
+           key_warn = 0
+           do l = 1, n
+              if (abs(Coef(l)) .gt. 10e+6)  key_warn = 1
+           enddo
+           if (key_warn .eq. 1) then
+              do l = 1, n
+                 Coef(l) = 0.0
+              enddo
+              RvMax = 0.0
+              RrMax = 0.0
+           endif
+
+           do i = 1, nSys
+              Fit(i) = 0.0
+              if (IShift.eq.1) Fit(i) = Coef(1)
+              do j = 1, nElectronics
+                 Fit(i) = Fit(i) + Coef(j+IShift)*J_Electronic(i,j)
+              enddo
+              do j = 1, nSteric
+                 Fit(i) = Fit(i)
+     x                  + Coef(nElectronics+j+IShift)*J_Vb(i,nMax,j)
+              enddo
+           enddo
+
+           write(6,'(a3,i8,3i6,f10.4,2f7.1,*(e15.5))')'MLR',
+     x          nJob, nMax, nSys, n, R2max, RvMax, RrMax,
+     x          (Coef(l),l=1,n),
+     x          (J_Experiments(i), Fit(i), Exp_AV+Exp_SD*Fit(i),
+     x          i=1,nSys)
+           flush(6)
+        endif
+
+        Deallocate (J_Experiments, J_Electronic, J_Vb)
+        Deallocate (WK_Experiments, WK_Electronic, WK_Vb)
+        Deallocate (Fit, iSkip)
+      enddo
+
+ 900  continue
+      return
+
+      contains
+
+!=========================================================================
+! Read a list of indices, given as No of indices followed by the indices
+!=========================================================================
+      subroutine ReadList(aLine, nList, List, iErr)
+
+      Character*(*) aLine
+      Integer nList, iErr, i
+      Integer, Allocatable :: List(:)
+
+      if (allocated(List)) deallocate(List)
+      read(aLine,*,iostat=iErr)nList
+      if (iErr.eq.0 .and. nList.lt.0) iErr = 1
+      if (iErr.ne.0) then
+         nList = 0
+         allocate(List(0))
+         return
+      endif
+
+      allocate(List(nList))
+      if (nList.gt.0) read(aLine,*,iostat=iErr)nList,(List(i),i=1,nList)
+
+      return
+      end subroutine ReadList
+
+      end
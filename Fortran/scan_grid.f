@@ -0,0 +1,125 @@
+!=========================================================================
+! Subroutine ScanGrid
+! Least squares fit of the experimental data at every point of the steric
+! grid. Returns R2 and coefficients of each point, best point is selected
+! by the caller.
+!
+! Points are independent. Compiled with OpenMP (sh ./link.sh openmp) they
+! are shared among threads, each one with its own A, B and Work arrays.
+! Each point is solved as in the serial loop, so that R2 and coefficients,
+! and the best point selected from them, do not depend on the number of
+! threads, set with OMP_NUM_THREADS.
+!=========================================================================
+      subroutine ScanGrid(WK_Experiments, WK_Electronic, WK_Vb,
+     +           WK_nSystem, nSystem, nElectronics, nSteric, nPoints,
+     +           IShift, n, R2, CoefGrid)
+
+      IMPLICIT NONE
+
+      Integer WK_nSystem                     ! # of systems fitted
+      Integer nSystem                        ! # of systems, leading dimension
+      Integer nElectronics                   ! # of electronic parameters
+      Integer nSteric                        ! # of steric parameters
+      Integer nPoints                        ! # of points in the steric grid
+      Integer IShift                         ! key to force fitting through origin
+      Integer n                              ! # of coefficients
+
+      Real*8  WK_Experiments(nSystem)                ! work array experimental values
+      Real*8  WK_Electronic(nSystem,nElectronics)    ! work array Electronic Parameters
+      Real*8  WK_Vb(nSystem,nPoints,nSteric)         ! work array % buried volumes
+      Real*8  R2(nPoints)                            ! R2 of each grid point
+      Real*8  CoefGrid(n,nPoints)                    ! coefficients of each grid point
+
+!=========================================================================
+! local variables
+!=========================================================================
+      Integer, Parameter :: lwmax = 100
+      Integer i, j, k, l
+      Integer Info, lwork
+
+      Real*8  std, std1, std2
+      Real*8  Work(lwmax)
+      Real*8, Allocatable :: A(:,:)
+      Real*8, Allocatable :: B(:,:)
+
+      EXTERNAL         DGELS
+      INTRINSIC        INT, MIN
+
+!=========================================================================
+! total sum of squares of the fitted systems
+!=========================================================================
+      std1 = 0.0
+      do i = 1, WK_nSystem
+        std1 = std1 + WK_Experiments(i)
+      enddo
+      std1 = std1 / dble(WK_nSystem)
+
+      std2 = 0.0
+      do i = 1, WK_nSystem
+        std2 = std2 + (WK_Experiments(i) - std1)**2.
+      enddo
+
+!=========================================================================
+! solve the linear equation systems, one per grid point
+!=========================================================================
+!$omp parallel default(shared)
+!$omp& private(i, j, k, l, Info, lwork, std, Work, A, B)
+      Allocate (A(nSystem,n))
+      Allocate (B(nSystem,1))
+
+!$omp do schedule(static)
+      do i = 1, nPoints
+        ! convert variables to A and B
+        do j = 1, WK_nSystem
+          B(j,1) = WK_Experiments(j)
+
+          if (IShift .eq. 0) then
+            do k = 1, nElectronics ! c1...cn-2 for electronics
+              A(j,k) = WK_Electronic(j,k)
+            enddo
+          end if
+          if (IShift .eq. 1) then
+            A(j,1) = 1.0      ! shift: c0
+            do k = 1, nElectronics ! c1...cn-2 for electronics
+              l  = k  + 1
+              A(j,l) = WK_Electronic(j,k)
+            enddo
+          end if
+          if (IShift .eq. 0)then
+            do l = nElectronics + 1, nElectronics + nSteric
+              k = l - nElectronics
+              A(j,l) = WK_Vb(j,i,k)
+            enddo
+          endif
+          if (Ishift .eq. 1)then
+            do l = nElectronics + 2, nElectronics + nSteric + 1
+              k = l - nElectronics - 1
+              A(j,l) = WK_Vb(j,i,k)
+            enddo
+          endif
+        enddo
+
+        lwork = -1
+        call dgels( 'No transpose', WK_nSystem, N, 1, A, nSystem,
+     x                B, nSystem, WORK, LWORK, INFO)
+        lwork = MIN( LWMAX, INT( WORK( 1 ) ) )
+        call dgels( 'No transpose', WK_nSystem, N, 1, A, nSystem,
+     x                B, nSystem, WORK, LWORK, INFO )
+
+        do l = 1, n
+          CoefGrid(l,i) = B(l,1)
+        enddo
+        std = 0.0
+        do l = 1, WK_NSystem-n
+          std = std + B(n+l,1)*B(n+l,1)
+        enddo
+        R2(i) = 1.0-std/std2
+      enddo
+!$omp end do
+
+      Deallocate (A)
+      Deallocate (B)
+!$omp end parallel
+
+      return
+      end
@@ -13,6 +13,13 @@ generate a new matrix, the first Nsys colomns contains randomly picked
 To be run as:
    python run_bootstrap.py -m/--matrix  sys08.matrix  -n/ncycles 10 -p/percentage 0.1
 
+Completed cycles are saved in myfile.boot_ckpt while running. After a crash,
+run again with -r/--resume to skip the cycles already done.
+
+Bags of all cycles are drawn at once from np.random.default_rng(42). With
+-g/--legacy_rng they are drawn cycle by cycle from np.random with seed 42,
+as in previous versions, to reproduce published results.
+
 Input:
    MatrixFile : = myfile.matrix    Matrix with the dataset to be learned.
    ncycles    : = integer          Runtime parameter with number of 
@@ -33,6 +40,7 @@ Output:
 --------------------------------------------------------------------------- """
 
 import argparse
+import functools
 import numpy as np
 import sys
 import os
@@ -40,6 +48,12 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from Utilities.set_variables import *
 from Utilities.matrix_operation import *
+from Utilities.mlr_engine import *
+from Utilities.mlr_server import *
+from Utilities.parallel import *
+from Utilities.checkpoint import *
+from Utilities.profiling import *
+from Utilities.scratch import *
 
 
 # ---------------------
@@ -62,6 +76,10 @@ def GetFiles():
     parser.add_argument("-m", "--matrix",  help = "Missing Matrix file") 
     parser.add_argument("-n", "--ncycles", help = "Missing Number of Bootstrap cycles")
     parser.add_argument("-b", "--boot_percentage", help = "Missing Percentage")
+    parser.add_argument("-e", "--engine", default = "fortran", help = "MLR engine: fortran (MLR.x) or numpy")
+    parser.add_argument("-j", "--jobs",   default = "1",       help = "Number of worker processes")
+    parser.add_argument("-r", "--resume", action = "store_true", help = "Skip cycles saved in the checkpoint file")
+    parser.add_argument("-g", "--legacy_rng", action = "store_true", help = "Draw the bags with the random sequence of previous versions")
 
     args            = parser.parse_args()
 
@@ -70,15 +88,30 @@ def GetFiles():
     or (not args.boot_percentage) :
        print(' Usage:  run_bootstrap.py -m/--matrix file.matrix       \
                                         -n/--ncycles integer          \
-                                        -b/--boot_percentage float'   )
+                                        -b/--boot_percentage float    \
+                                        -e/--engine fortran/numpy     \
+                                        -j/--jobs integer             \
+                                        -r/--resume                   \
+                                        -g/--legacy_rng'              )
+       exit()
+
+    if (args.engine != 'fortran') and (args.engine != 'numpy'):
+       print(' Error:  -e/--engine flag must be fortran/numpy')
        exit()
 
+    if (not args.jobs.isdigit()) or (int(args.jobs) < 1):
+       print(' Error:  -j/--jobs flag must be a positive integer')
+       exit()
 
 
 
     MatrixFile      = args.matrix
     no_of_bootstrap = int(args.ncycles)
     percentage      = float(args.boot_percentage)
+    Engine          = args.engine
+    no_of_jobs      = int(args.jobs)
+    resume          = args.resume
+    legacy_rng      = args.legacy_rng
     
     TempFile  = MatrixFile.replace("matrix", "tmp")
     BOOT_File = MatrixFile.replace("matrix", "boot_dat")
@@ -86,13 +119,15 @@ def GetFiles():
     CFF_File  = MatrixFile.replace("matrix", "boot_coef")
     R2_File   = MatrixFile.replace("matrix", "boot_r2")
     MAE_File  = MatrixFile.replace("matrix", "boot_mae")
+    CheckFile = MatrixFile.replace("matrix", "boot_ckpt")
 
     return (MatrixFile, TempFile, BOOT_File, PRED_File, CFF_File, R2_File, MAE_File,
-            no_of_bootstrap, percentage)
+            CheckFile, no_of_bootstrap, percentage, Engine, no_of_jobs, resume, legacy_rng)
 
 
 # ---------------------
 
+@profiled("analysis")
 def analysis_boot_cff(CFF_File, no_of_bootstrap, no_of_coef, reference_cff, boot_cff):
 
   # analyzes coefficients from bootstrap run and writes out MAE_boot_cff
@@ -111,21 +146,20 @@ def analysis_boot_cff(CFF_File, no_of_bootstrap, no_of_coef, reference_cff, boot
   # ---------------------
 
 
-    MAE_boot_cff   = 0.0
-    difference_cff = []
+  # differences of all cycles and coefficients at once, written in one call,
+  # one line per cycle and coefficient
 
-    with open(CFF_File, "w") as f:
-         for b in range(no_of_bootstrap):
-             for c in range(no_of_coef):
+    reference_cff  = np.asarray(reference_cff, dtype=float)
+    boot_cff       = np.asarray(boot_cff, dtype=float)
+    difference_cff = boot_cff - reference_cff
 
-                 difference_cff.append(np.abs(boot_cff[b][c] - reference_cff[c]))
-                 f.write("{:8.3f}".format(reference_cff[c]) + '  '
-                       + "{:8.3f}".format(boot_cff[b][c])   + '  '
-                       + "{:8.3f}".format(boot_cff[b][c] - reference_cff[c]) +  '\n')
+    with open(CFF_File, "w") as f:
+         np.savetxt(f, np.column_stack((np.tile(reference_cff, no_of_bootstrap), boot_cff.ravel(),
+                                        difference_cff.ravel())),
+                    fmt = "%8.3f  %8.3f  %8.3f")
 
-         difference_cff = np.array(difference_cff)
-         MAE_boot_cff = np.mean(difference_cff)
-         MAE_boot_cff_std = np.std(difference_cff, ddof=1)
+    MAE_boot_cff     = np.mean(np.abs(difference_cff).ravel())
+    MAE_boot_cff_std = np.std(np.abs(difference_cff).ravel(), ddof=1)
   
 
     return(MAE_boot_cff, MAE_boot_cff_std)
@@ -133,6 +167,7 @@ def analysis_boot_cff(CFF_File, no_of_bootstrap, no_of_coef, reference_cff, boot
 
 # ---------------------
 
+@profiled("analysis")
 def analysis_boot_r2(R2_File, no_of_bootstrap, reference_R2, boot_r2):
 
   # analyzes R2 from bootstrap run and writes out MAE_boot_r2
@@ -150,32 +185,26 @@ def analysis_boot_r2(R2_File, no_of_bootstrap, reference_R2, boot_r2):
   # ---------------------
 
 
-  # analyzes R2 from bootstrap run
-
-    MAE_boot_r2   = 0.0
-    difference_r2 = []
+  # analyzes R2 from bootstrap run, all cycles at once
 
+    boot_r2       = np.asarray(boot_r2, dtype=float)
+    difference_r2 = boot_r2 - reference_R2
 
     with open(R2_File, "w") as f:
-         for b in range(no_of_bootstrap):
-
-             difference_r2.append(np.abs(boot_r2[b] - reference_R2))
+         np.savetxt(f, np.column_stack((np.full(no_of_bootstrap, reference_R2), boot_r2, difference_r2)),
+                    fmt = "%8.3f  %8.3f  %8.3f")
 
-             f.write("{:8.3f}".format(reference_R2) + '  '
-                    + "{:8.3f}".format(boot_r2[b])  + '  '
-                    + "{:8.3f}".format(boot_r2[b] - reference_R2) + '\n')
-
-         difference_r2 = np.array(difference_r2)
-         MAE_boot_r2   = np.mean(difference_r2)
-         MAE_boot_r2_std = np.std(difference_r2, ddof=1)
+    MAE_boot_r2     = np.mean(np.abs(difference_r2))
+    MAE_boot_r2_std = np.std(np.abs(difference_r2), ddof=1)
  
     return(MAE_boot_r2, MAE_boot_r2_std)
 
 
 # ---------------------
 
+@profiled("analysis")
 def analysis_boot_pred(PRED_File, no_of_bootstrap, no_of_prediction, system_tags, 
-                      experimental_data, reference_fit, boot_tag, boot_pred):
+                      experimental_data, reference_fit, boot_tag, boot_pred, boot_ids):
 
   # analyzes predicted experimental values from bootstrap run and writes out MAE_boot_exp
   # MAE_boot_fit.  MAEs are calculated from experimental_data and reference_fit, which 
@@ -187,56 +216,56 @@ def analysis_boot_pred(PRED_File, no_of_bootstrap, no_of_prediction, system_tags
     # no_of_prediction  := No of systems predicted in the bootstrap cycles
     # experimental_data := Fitted values from MLR training on the whoe dataset.
     # reference_fit     := Fitted values from MLR training on the whoe dataset.
+    # boot_tag          := Tags of the predicted systems, as written by MLR.x
     # boot_pred         := Predictions from MLR training during the bootstrap cycles
     #                     - array size no_of_bootstrap*no_of_prediction.
+    # boot_ids          := Indices of the predicted systems in system_tags, i.e.
+    #                      prediction bags of bootstrap_indices.
 
   # Output:            := results are written in file PRED_File
   # ---------------------
 
 
-    MAE_boot_exp= 0.0
-    MAE_boot_fit= 0.0
-    difference_exp = []
-    difference_fit = []
+  # predicted systems are taken as the first system with their tag, as found by
+  # system_tags.index, i.e. the same system for systems with the same tag
+
+    first_ids = {}
+    for i in reversed(range(len(system_tags))):
+        first_ids[system_tags[i]] = i
+    first_ids = np.array([first_ids[tag] for tag in system_tags], dtype=int)
 
+    ids       = first_ids[np.asarray(boot_ids, dtype=int).ravel()]
+    boot_pred = np.asarray(boot_pred, dtype=float)
+    exp_data  = np.asarray(experimental_data, dtype=float)[ids]
+    fit_data  = np.asarray(reference_fit, dtype=float)[ids]
+
+    difference_exp = boot_pred - exp_data
+    difference_fit = boot_pred - fit_data
+
+
+  # one line per predicted system of each cycle, written in one call
+
+    line = "{:8s}  {:8s}  {:8.3f}{:8.3f}{:8.3f}{:8.3f}{:8.3f}\n"
 
     with open(PRED_File, "w") as f:
-         for b in range(no_of_bootstrap):
-             for c in range(no_of_prediction):
- 
-               # find which system is predicted
-                 id_predicted_system = system_tags.index(boot_tag[b*no_of_prediction+c])
-
-                 difference_exp.append(np.abs(boot_pred[b*no_of_prediction+c] 
-                                            - experimental_data[id_predicted_system]))
-                 difference_fit.append(np.abs(boot_pred[b*no_of_prediction+c] 
-                                            - reference_fit[id_predicted_system]))
-
-                 f.write("{:8s}  ".format(system_tags[id_predicted_system]) 
-                        +"{:8s}  ".format(boot_tag[b*no_of_prediction+c])  
-                        +"{:8.3f}".format(experimental_data[id_predicted_system])  
-                        +"{:8.3f}".format(reference_fit[id_predicted_system])  
-                        +"{:8.3f}".format(boot_pred[b*no_of_prediction+c])  
-                        +"{:8.3f}".format(boot_pred[b*no_of_prediction+c] 
-                                        - experimental_data[id_predicted_system])
-                        +"{:8.3f}".format(boot_pred[b*no_of_prediction+c] 
-                                        - reference_fit[id_predicted_system]) + '\n')
-
-         difference_exp = np.array(difference_exp)
-         MAE_boot_exp   = np.mean(difference_exp)
-         MAE_boot_exp_std = np.std(difference_exp, ddof=1)
-
-         difference_fit = np.array(difference_fit)
-         MAE_boot_fit   = np.mean(difference_fit)
-         MAE_boot_fit_std = np.std(difference_fit, ddof=1)
+         f.write("".join([line.format(system_tags[ids[p]], boot_tag[p], exp_data[p], fit_data[p],
+                                      boot_pred[p], difference_exp[p], difference_fit[p])
+                          for p in range(len(ids))]))
+
+    MAE_boot_exp     = np.mean(np.abs(difference_exp))
+    MAE_boot_exp_std = np.std(np.abs(difference_exp), ddof=1)
+
+    MAE_boot_fit     = np.mean(np.abs(difference_fit))
+    MAE_boot_fit_std = np.std(np.abs(difference_fit), ddof=1)
 
  
     return(MAE_boot_exp, MAE_boot_exp_std, MAE_boot_fit, MAE_boot_fit_std)
 
 
 # ---------------------
+@profiled("matrix assembly")
 def prepare_bootstrap_indices(BOOT_File, no_of_bootstrap, no_of_systems, no_of_prediction, 
-                              bootstrap_indices):
+                              bootstrap_indices, legacy_rng = False):
 
   # prepare bootstrap_indices defining which systems are in the training bag and which in the 
   # prediction bag.
@@ -246,6 +275,10 @@ def prepare_bootstrap_indices(BOOT_File, no_of_bootstrap, no_of_systems, no_of_p
     #    no_of_bootstrap  := Number of bootstrap cycles to be considered.
     #    no_of_system     := Number of systems in the original dataset.
     #    no_of_prediction := Number of systems to be included in the prediction bag.
+    #    legacy_rng       := if True, bags are drawn cycle by cycle from np.random with
+    #                        seed 42, giving the bags of previous versions and of
+    #                        published results. Otherwise all bags are drawn at once
+    #                        from np.random.default_rng(42).
   
   # Output:   
     #    bootstrap_indices := matrix [no_of_bootstrap][no_of_systems+no_of_prediction]
@@ -255,35 +288,40 @@ def prepare_bootstrap_indices(BOOT_File, no_of_bootstrap, no_of_systems, no_of_p
   # ---------------------
 
 
-  # looping over the numer of bootstrap cycles 
-  # start filling prediction bag, then training bag
+  # the prediction bag is drawn first, then the training bag from a training pool
+  # including two times each system not in the prediction bag. Picking randomly
+  # no_of_systems from the doubled training pool, no replica, will allow each
+  # system to be present maximum two times in the training bag.
 
     ntotal  = no_of_systems + no_of_prediction
     indices = np.arange(no_of_systems, dtype=int)
 
-    np.random.seed(42)
-    for b in range(no_of_bootstrap):
-        prediction_bag = np.random.choice(indices, no_of_prediction, replace=False)
+    if legacy_rng:
 
-      # build a training pool from which extract the training set, including 
-      # two times each system not in the prediction bag.
+     # np.random.choice(pool, n, replace=False) takes the first n of a permutation
+     # of pool, permutations are drawn here in the same order of the loop of
+     # previous versions
 
-        training_pool = []
-        for i in range(no_of_systems):
-            if not (i in prediction_bag):
-               training_pool.append(i)
-               training_pool.append(i)
+       np.random.seed(42)
+       for b in range(no_of_bootstrap):
+           prediction_bag = indices[np.random.permutation(no_of_systems)[:no_of_prediction]]
+           training_pool  = np.repeat(np.delete(indices, prediction_bag), 2)
+           training_bag   = training_pool[np.random.permutation(len(training_pool))[:no_of_systems]]
 
-      # picking randomly no_of_systems from the doubled training pool, no replica, 
-      # will allow each system to be present maximum two times in the training bag.
+           bootstrap_indices[b][:no_of_systems]       = training_bag[:]
+           bootstrap_indices[b][no_of_systems:ntotal] = prediction_bag[:]
 
-        training_pool = np.array(training_pool, dtype=int)
-        training_bag  = np.random.choice(training_pool, no_of_systems, replace=False)
-        
-      # transferring training and prediciton bags to bootstrap_indices
+    else:
+
+     # one permutation of the systems per cycle: the first no_of_prediction are the
+     # prediction bag, the others make the training pool of the cycle
+
+       rng            = np.random.default_rng(42)
+       permutations   = rng.permuted(np.tile(indices, (no_of_bootstrap, 1)), axis=1)
+       training_pools = np.repeat(permutations[:, no_of_prediction:], 2, axis=1)
 
-        bootstrap_indices[b][:no_of_systems]       = training_bag[:]
-        bootstrap_indices[b][no_of_systems:ntotal] = prediction_bag[:]
+       bootstrap_indices[:, :no_of_systems]       = rng.permuted(training_pools, axis=1)[:, :no_of_systems]
+       bootstrap_indices[:, no_of_systems:ntotal] = permutations[:, :no_of_prediction]
 
       
   # printing the BootFile to store indices of systems in training and prediction bags
@@ -294,61 +332,137 @@ def prepare_bootstrap_indices(BOOT_File, no_of_bootstrap, no_of_systems, no_of_p
                    + "{:28s}".format("  are those to be predicted" 
                    + "\n"))
 
-         for b in range(no_of_bootstrap):
-             boot.write("{:4d}".format(b) + "   ")
-
-             for i in range(ntotal):
-                 boot.write( "{:4d}".format(bootstrap_indices[b][i]))
-             boot.write('\n')
+         np.savetxt(boot, np.column_stack((np.arange(no_of_bootstrap), bootstrap_indices)),
+                    fmt = "%4d   " + "%4d" * ntotal)
 
 
     return (bootstrap_indices)
 # ---------------------
-def assemble_bootstrap_matrix(b                   , ntotal                , no_of_electronics, 
-                              no_of_sterics       , no_of_buried_volumes  , bootstrap_indices, 
-                              system_tags         , experimental_data     , electronic_descriptors, 
-                              buried_volumes      , boot_system_tag       , boot_experimental, 
-                              boot_electronics    , boot_volumes):
-  # assemble bootstrap matrix
-
-    for n in range(ntotal):
-        boot_system_tag[n]   = system_tags[bootstrap_indices[b][n]]
-        boot_experimental[n] = experimental_data[bootstrap_indices[b][n]]
-    
-    for e in range(no_of_electronics):
-        for n in range(ntotal):
-            boot_electronics[e][n] = electronic_descriptors[e][bootstrap_indices[b][n]]
-
-    for v in range(no_of_buried_volumes):
-        for n in range(ntotal):
-            n1 = no_of_sterics*n
-            b1 = no_of_sterics*bootstrap_indices[b][n]
-            boot_volumes[v][n1]   = buried_volumes[v][b1]
-          
-            if no_of_sterics == 2:
-               boot_volumes[v][n1+1] = buried_volumes[v][b1+1]
+def run_bootstrap_cycle(b, TempFile, MLRBinary, system_tags, bootstrap_indices, boot_skipped_systems):
+
+  # runs MLR.x on the bootstrap matrix of cycle b. The original matrix in TempFile
+  # is kept in memory by MLR.x in server mode, and only the bags of the cycle are
+  # sent. Each worker process has its own server.
+
+  # Input:
+    # b                    := bootstrap cycle
+    # TempFile             := original matrix, as read by MLR.x
+    # system_tags          := tags of the systems in the original matrix
+    # bootstrap_indices    := training and prediction bags, from prepare_bootstrap_indices
+    # boot_skipped_systems := skipped systems of the bootstrap matrix, i.e. the prediction bag
+
+  # Output:
+    # boot_tag, boot_pre   := tags and predicted values of systems in the prediction bag
+    # boot_r2, boot_cff    := R2 and coefficients of the cycle, as strings from MLR.x
+  # ---------------------
+
+    with span("cycle", cycle = b):
+         R2, point, rv, rr, coefficients, experiments, fitted, fitted_data = run_job(
+             get_server(MLRBinary, TempFile), boot_skipped_systems, rows=bootstrap_indices[b])
+
+
+  # predicted values of the prediction bag, as in the Pre lines. MLR.x reads
+  # tags of 12 characters at most
+
+    prediction_rows = skipped_ids(boot_skipped_systems)
+    boot_tag = [system_tags[bootstrap_indices[b][i]][:12] for i in prediction_rows]
+    boot_pre = [fitted_data[i] for i in prediction_rows]
+
+
+    return (boot_tag, boot_pre, R2, coefficients)
 
 
-    return()
 # ---------------------
 
-def main():
-    
-  # get input and output files
+def solve_bootstrap_block(cycles, matrix, bootstrap_indices):
 
-    (MatrixFile, TempFile, BOOT_File, PRED_File, CFF_File, R2_File, MAE_File,
-                no_of_bootstrap, percentage) = GetFiles()
-    MLRBinary, PYTHONHOME = GetVariables()
+  # solves a block of bootstrap cycles with the in-memory engine, each cycle being
+  # the number of times every system is in the training bag plus the prediction bag.
+  # Values are rounded as written by MLR.x in the Max R2 and Pre lines.
+
+  # Input:
+    # cycles               := bootstrap cycles of this block
+    # matrix               := tuple with the original matrix, as returned by read_matrix
+    # bootstrap_indices    := training and prediction bags, from prepare_bootstrap_indices
 
+  # Output:
+    # one (boot_tag, boot_pre, boot_r2, boot_cff) tuple per cycle, as run_bootstrap_cycle
+  # ---------------------
+
+    title             , print_flag             , normalization_flag   , \
+    shift_flag        , skipped_systems        , no_of_systems        , \
+    no_of_electronics , no_of_sterics          , no_of_buried_volumes , \
+    system_tags       , experimental_tag       , experimental_data    , \
+    electronic_tags   , electronic_descriptors , radius_proximal      , \
+    radius_distal     , buried_volumes         = matrix
+
+    cycles    = list(cycles)
+    weights   = np.zeros((len(cycles), no_of_systems), dtype=int)
+    predicted = np.zeros((len(cycles), no_of_systems), dtype=bool)
+    for c, b in enumerate(cycles):
+        weights[c]   = np.bincount(bootstrap_indices[b][:no_of_systems], minlength=no_of_systems)
+        predicted[c][bootstrap_indices[b][no_of_systems:]] = True
+
+    with span("cycle", "cycles", first = cycles[0], no_of_cycles = len(cycles)):
+         R2, points, coefficients, values = run_mlr_weighted(
+             normalization_flag , shift_flag        , no_of_systems          ,
+             no_of_sterics      , experimental_data , electronic_descriptors ,
+             radius_proximal    , radius_distal     , buried_volumes         ,
+             weights            , predicted         )
+
+    results = []
+    for c, b in enumerate(cycles):
+        prediction_bag = bootstrap_indices[b][no_of_systems:]
+        results.append(([system_tags[i] for i in prediction_bag],
+                        list(round_significant(values[c][prediction_bag])),
+                        round_decimals(R2[c], 4),
+                        round_significant(coefficients[c])))
+
+
+    return results
+# ---------------------
+
+def solve_bootstrap_cycles(cycles, matrix, bootstrap_indices, no_of_jobs):
+
+  # solves a list of bootstrap cycles with the in-memory engine, split in
+  # no_of_jobs blocks, one per worker process
+
+    blocks = map_cycles(functools.partial(solve_bootstrap_block, matrix=matrix,
+                                          bootstrap_indices=bootstrap_indices),
+                        [cycles[r.start:r.stop] for r in split_cycles(len(cycles), no_of_jobs)],
+                        no_of_jobs)
 
-  # call read_matrix to read matrix_file
+    return [r for block in blocks for r in block]
+# ---------------------
+
+def run_bootstrap(matrix          , MatrixFile , TempFile  , BOOT_File , PRED_File ,
+                  CFF_File        , R2_File    , MAE_File  , CheckFile , no_of_bootstrap ,
+                  percentage      , Engine     , no_of_jobs, MLRBinary , resume    ,
+                  legacy_rng = False):
+
+  # runs the bootstrap test on matrix and writes the analysis files.
+  # MatrixFile is read by MLR.x for the reference run, and it is not used by the
+  # in-memory engine, which works on matrix only.
+
+  # Input:
+    # matrix          := tuple with the matrix, as returned by read_matrix
+    # TempFile        := name of the matrix read by the MLR.x servers, written
+    #                    in a scratch directory removed at the end
+    # no_of_bootstrap := No of bootstrap cycles
+    # percentage      := fraction of systems in the prediction bag
+    # no_of_jobs      := No of worker processes
+    # CheckFile       := checkpoint file with the results of completed cycles
+    # resume          := if True, cycles saved in CheckFile are not run again
+    # legacy_rng      := if True, bags are drawn with the random sequence of previous
+    #                    versions, see prepare_bootstrap_indices
+  # ---------------------
 
     title             , print_flag             , normalization_flag   , \
     shift_flag        , skipped_systems        , no_of_systems        , \
     no_of_electronics , no_of_sterics          , no_of_buried_volumes , \
     system_tags       , experimental_tag       , experimental_data    , \
     electronic_tags   , electronic_descriptors , radius_proximal      , \
-    radius_distal     , buried_volumes         = read_matrix(MatrixFile) 
+    radius_distal     , buried_volumes         = matrix
 
 
   # initialize arrays
@@ -358,35 +472,36 @@ def main():
     
 #   indices              = np.arange(no_of_systems, dtype=int)
     bootstrap_indices    = np.zeros ((no_of_bootstrap, ntotal), dtype=int)
-
-    boot_system_tag      = [' ']*ntotal
-    boot_experimental    = np.zeros (ntotal)
-    boot_electronics     = np.zeros ((no_of_electronics, ntotal))
-    boot_volumes         = np.zeros ((no_of_buried_volumes, 2*ntotal))
     boot_skipped_systems = np.zeros(no_of_prediction+1, dtype=int)
 
 
   # running MLR on the input matrix to get reference values and coefficients
 
-    run = MLRBinary  + " " + MatrixFile + " > tempo-fit.out"
-    os.system(run)
+    if Engine == "numpy":
+       R2, point, rv, rr, coefficients, fitted, experiments, exp_av, exp_sd = run_mlr_cached(
+           normalization_flag     , shift_flag      , skipped_systems   ,
+           no_of_systems          , no_of_sterics   , experimental_data ,
+           electronic_descriptors , radius_proximal , radius_distal     ,
+           buried_volumes         )
+
+       fit_mask      = ~skipped_mask(skipped_systems, no_of_systems)
+       reference_fit = list(round_significant(exp_av + exp_sd*fitted[fit_mask]))
+       reference_cff = round_significant(coefficients)
+       reference_R2  = round_decimals(R2, 4)
+       no_of_coef    = len(coefficients)
 
-  # from temp.out get reference fitted values and coefficients
+    else:
 
-    reference_fit = []
-    reference_cff = []
+     # MLR.x in quiet mode writes only the result record: get reference fitted
+     # values of the systems not skipped, coefficients and R2
 
-    with open('tempo-fit.out', "r") as f:
-         lines = f.readlines()
-         for line in lines:
-             if (line[-4:-1] == "Fit"):
-                reference_fit.append(float(line.split()[6]))
+       R2, point, rv, rr, coefficients, experiments, fitted, fitted_data = run_quiet(MLRBinary, MatrixFile)
 
-             if (line[0:6] == "Max R2"):
-                words = line.split()[:-1]
-                no_of_coef = len(words) - 4
-                reference_cff = np.array(line.split()[5:]).astype(np.float)
-                reference_R2 = float(words[2])
+       fit_mask      = ~skipped_mask(skipped_systems, no_of_systems)
+       reference_fit = [float(fitted_data[i]) for i in range(no_of_systems) if fit_mask[i]]
+       reference_cff = np.array(coefficients).astype(float)
+       reference_R2  = float(R2)
+       no_of_coef    = len(coefficients)
 
 
   # End of reference MLR run - start the bootstrap procedure
@@ -399,9 +514,8 @@ def main():
 
   # fill training and prediction bags, store them into bootstrap_indices
 
-    np.random.seed(42)
     prepare_bootstrap_indices(BOOT_File, no_of_bootstrap, no_of_systems, no_of_prediction, 
-                              bootstrap_indices ) 
+                              bootstrap_indices, legacy_rng ) 
 
 
   # run MLR on all the training and prediciton bags.
@@ -412,49 +526,50 @@ def main():
     boot_tag = []
     boot_pre = []
 
-    for b in range (no_of_bootstrap):
-
-      # assemble bootstrap matrix
-        assemble_bootstrap_matrix(b                   , ntotal                , no_of_electronics, 
-                                  no_of_sterics       , no_of_buried_volumes  , bootstrap_indices, 
-                                  system_tags         , experimental_data     , electronic_descriptors, 
-                                  buried_volumes      , boot_system_tag       , boot_experimental, 
-                                  boot_electronics    , boot_volumes)
-
-
-      # call write_matrix to write matrix_file for loo calculation
+  # cycles are independent and are distributed over no_of_jobs worker processes.
+  # Bags are all defined above, so results do not depend on the number of workers,
+  # and they are merged back in cycle order.
+  # in-memory engine: each worker solves a block of cycles by weighted least squares,
+  # without assembling the bootstrap matrices.
+  # MLR.x: the original matrix is written once in a scratch file and kept in
+  # memory by MLR.x in server mode, one server per worker.
+  # cycles are run in chunks, and results of completed cycles are saved in CheckFile
+  # after each chunk.
+
+    with scratch_file(TempFile) as ScratchFile:
+         if Engine == "numpy":
+            solve_cycles = functools.partial(solve_bootstrap_cycles, matrix=matrix,
+                                             bootstrap_indices=bootstrap_indices,
+                                             no_of_jobs=no_of_jobs)
+         else:
+            with span("matrix write"):
+                 write_matrix(ScratchFile, *matrix)
+            solve_cycles = functools.partial(map_cycles,
+                                             functools.partial(run_bootstrap_cycle, TempFile=ScratchFile,
+                                                               MLRBinary=MLRBinary, system_tags=system_tags,
+                                                               bootstrap_indices=bootstrap_indices,
+                                                               boot_skipped_systems=boot_skipped_systems),
+                                             no_of_jobs=no_of_jobs)
+
+         key     = checkpoint_key("bootstrap", matrix, no_of_bootstrap, percentage, Engine,
+                                  legacy_rng)
+         results = run_checkpointed(solve_cycles, no_of_bootstrap, CheckFile, key, resume)
+
+         if Engine == "fortran":
+            stop_servers()
 
-        write_matrix(TempFile             , title             , print_flag           ,
-                     normalization_flag   , shift_flag        , boot_skipped_systems ,
-                     ntotal               , no_of_electronics , no_of_sterics        ,
-                     no_of_buried_volumes , boot_system_tag   , experimental_tag     ,
-                     boot_experimental    , electronic_tags   , boot_electronics     ,
-                     radius_proximal      , radius_distal     , boot_volumes         ) 
-
-        run = MLRBinary + " " + TempFile + " > temp.out"
-        os.system(run)
-
-      # from temp.out get predicted value for this bootstrap 
-
-        with open('temp.out', "r") as f:
-             lines = f.readlines()
-             for line in lines:
-                 if (line[-4:-1] == "Pre"):
-                    boot_tag.append(line.split()[1])
-                    boot_pre.append(line.split()[6])
-
-                 if (line[0:6] == "Max R2"):
-                    boot_r2[b]     = line.split()[2]
-                    boot_cff[b][:] = line.split()[5:]
- 
+    for b in range(no_of_bootstrap):
+        boot_tag.extend(results[b][0])
+        boot_pre.extend(results[b][1])
+        boot_r2[b]     = results[b][2]
+        boot_cff[b][:] = results[b][3]
 
-        #os.system('rm temp.out')
 
   # bootstrap cycles done - start analysis writing files
 
-    boot_r2  = np.array(boot_r2).astype(np.float)
-    boot_pre = np.array(boot_pre).astype(np.float)
-    boot_cff = np.array(boot_cff).astype(np.float)
+    boot_r2  = np.array(boot_r2).astype(float)
+    boot_pre = np.array(boot_pre).astype(float)
+    boot_cff = np.array(boot_cff).astype(float)
 
 
     MAE_boot_fit = 0.0
@@ -464,7 +579,8 @@ def main():
   # analyze and print bootstrap data
 
     (MAE_boot_exp, MAE_boot_exp_std, MAE_boot_fit, MAE_boot_fit_std) = analysis_boot_pred(PRED_File, no_of_bootstrap, no_of_prediction, system_tags, 
-                       experimental_data, reference_fit, boot_tag, boot_pre) 
+                       experimental_data, reference_fit, boot_tag, boot_pre,
+                       bootstrap_indices[:, no_of_systems:]) 
 
     (MAE_boot_r2, MAE_boot_r2_std) = analysis_boot_r2(R2_File, no_of_bootstrap, reference_R2, boot_r2)
 
@@ -484,10 +600,31 @@ def main():
                 +'   StDev   '   + "{:8.3f}".format(MAE_boot_r2_std) + '\n')
           
 
-    os.system('rm temp.out')
-    os.system('rm tempo-fit.out')
-    os.system('rm ' + TempFile)
+    remove_checkpoint(CheckFile)
+
+    return()
+
+# ---------------------
+
+def main():
     
+  # get input and output files
+
+    (MatrixFile, TempFile, BOOT_File, PRED_File, CFF_File, R2_File, MAE_File,
+     CheckFile, no_of_bootstrap, percentage, Engine, no_of_jobs, resume, legacy_rng) = GetFiles()
+    MLRBinary, PYTHONHOME = GetVariables()
+
+
+  # call read_matrix to read matrix_file and run the bootstrap
+
+    with span("matrix read"):
+         matrix = read_matrix(MatrixFile)
+
+    run_bootstrap(matrix          , MatrixFile , TempFile  , BOOT_File , PRED_File ,
+                  CFF_File        , R2_File    , MAE_File  , CheckFile , no_of_bootstrap ,
+                  percentage      , Engine     , no_of_jobs, MLRBinary , resume    ,
+                  legacy_rng      )
+
 #   print('all done')
 
 
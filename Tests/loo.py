@@ -26,6 +26,10 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from Utilities.set_variables import *
 from Utilities.matrix_operation import *
+from Utilities.mlr_engine import *
+from Utilities.mlr_server import *
+from Utilities.profiling import *
+from Utilities.scratch import *
 
 
 # ---------------------
@@ -46,85 +50,48 @@ def GetFiles():
 
     parser = argparse.ArgumentParser()
     parser.add_argument("-m", "--matrix", help = "Missing Matrix file")
+    parser.add_argument("-e", "--engine", default = "fortran", help = "MLR engine: fortran (MLR.x) or numpy")
+    parser.add_argument("--parity", action = "store_true", help = "numpy engine: refit each fold explicitly")
 
     args       = parser.parse_args()
 
     if (not args.matrix) :
-       print(' Usage:  run_loo.py -m/--matrix file.matrix')
+       print(' Usage:  run_loo.py -m/--matrix file.matrix  -e/--engine fortran/numpy  --parity')
+       exit()
+
+    if (args.engine != 'fortran') and (args.engine != 'numpy'):
+       print(' Error:  -e/--engine flag must be fortran/numpy')
        exit()
 
 
     MatrixFile = args.matrix
-    TempFile   = "tmp.matrix"
+    TempFile   = MatrixFile.replace("matrix", "tmp")
     LOOFile    = MatrixFile.replace("matrix", "loo_dat")
     Q2File     = MatrixFile.replace("matrix", "loo_q2")
     MAEFile    = MatrixFile.replace("matrix", "loo_mae")
+    Engine     = args.engine
+    Parity     = args.parity
     
-    return MatrixFile, TempFile, LOOFile, Q2File, MAEFile     
+    return MatrixFile, TempFile, LOOFile, Q2File, MAEFile, Engine, Parity
 # --- End of GetFiles -----------------------------
 
-def main():
-    
-  # get input and output files
-
-    MatrixFile, TempFile, LOOFile, Q2File, MAEFile = GetFiles()
-    MLRBinary, PYTHONHOME = GetVariables()
-
-
-  # call read_matrix to read matrix_file
-
-    title             , print_flag             , normalization_flag   , \
-    shift_flag        , skipped_systems        , no_of_systems        , \
-    no_of_electronics , no_of_sterics          , no_of_buried_volumes , \
-    system_tags       , experimental_tag       , experimental_data    , \
-    electronic_tags   , electronic_descriptors , radius_proximal      , \
-    radius_distal     , buried_volumes         = read_matrix(MatrixFile) 
-
+@profiled("analysis")
+def write_loo(LOOFile, Q2File, no_of_systems, system_tags, experimental_data, loo_values):
 
-  # loop over systems excluding them one by one
+  # calculates Q2 and MAE_loo from the predicted values of the left out systems,
+  # and writes them out together with the predicted values
 
-    loo_system = [1, 0]
-    loo_values = []
-    for l in range(no_of_systems):
-        loo_system[1] = l+1
-
-    
-      # call write_matrix to write matrix_file for loo calculation
-
-        write_matrix(TempFile             , title             , print_flag             ,
-                     normalization_flag   , shift_flag        , loo_system             ,
-                     no_of_systems        , no_of_electronics , no_of_sterics          ,
-                     no_of_buried_volumes , system_tags       , experimental_tag       ,
-                     experimental_data    , electronic_tags   , electronic_descriptors ,
-                     radius_proximal      , radius_distal     , buried_volumes         )
-
-
-      # run MLR on the temporary matrix file skipping one system
-
-        run = MLRBinary + " " + TempFile + " > temp.out"
-        os.system(run)
-
-
-      # get predicted value for this matrix
-
-        with open('temp.out', "r") as f:
-             lines = f.readlines()
-             for line in lines:
-                 if ("LOO   " in line) :
-                    loo_values.append(float(line.split()[3]))
-        os.system('rm temp.out')
-    os.system('rm  tmp.matrix')
-
-    
-  # loo cycles completed, calculate Q2, MAE_loo and print out
+  # Input:
+    # LOOFile           := file with experimental and predicted values
+    # Q2File            := file with Q2 and MAE_loo
+    # loo_values        := predicted value of each system, when left out
+  # ---------------------
 
     loo_values = np.array(loo_values)
     corr_matrix = np.corrcoef(experimental_data, loo_values)
     corr = corr_matrix[0,1]
     Q2 = corr**2
 
-    no_of_descriptors = no_of_electronics + no_of_sterics
-
     with open(LOOFile, "w") as f:
          f.write( "{:32s}".format(' System      Experiment     LOO \n' ) )
          for i in range(no_of_systems) :
@@ -140,6 +107,68 @@ def main():
          f.write( "{:10.3f}".format(Q2) )
          f.write( "{:10.3f}".format(MAE_loo) + '\n' )
 
+    return()
+# ---------------------
+
+def main():
+    
+  # get input and output files
+
+    MatrixFile, TempFile, LOOFile, Q2File, MAEFile, Engine, Parity = GetFiles()
+    MLRBinary, PYTHONHOME = GetVariables()
+
+
+  # call read_matrix to read matrix_file
+
+    with span("matrix read"):
+         title             , print_flag             , normalization_flag   , \
+         shift_flag        , skipped_systems        , no_of_systems        , \
+         no_of_electronics , no_of_sterics          , no_of_buried_volumes , \
+         system_tags       , experimental_tag       , experimental_data    , \
+         electronic_tags   , electronic_descriptors , radius_proximal      , \
+         radius_distal     , buried_volumes         = read_matrix(MatrixFile)
+
+
+  # in-memory engine: all folds from one factorization per grid point, unless
+  # normalization depends on the skipped system or --parity asks for explicit
+  # refits. Take the predictions as written by MLR.x in the LOO line
+
+    loo_values = []
+    if Engine == "numpy":
+       results    = run_mlr_loo(normalization_flag , shift_flag        , no_of_systems          ,
+                                no_of_sterics      , experimental_data , electronic_descriptors ,
+                                radius_proximal    , radius_distal     , buried_volumes         ,
+                                closed_form = not Parity)
+       loo_values = list(round_significant(results[0]))
+
+
+  # MLR.x: the matrix is written once in a scratch file and kept in memory by
+  # MLR.x in server mode, run MLR skipping the systems one by one. Take the
+  # predictions as in the LOO line
+
+    else:
+       with scratch_file(TempFile) as ScratchFile:
+            with span("matrix write"):
+                 write_matrix(ScratchFile          , title             , print_flag             ,
+                              normalization_flag   , shift_flag        , skipped_systems        ,
+                              no_of_systems        , no_of_electronics , no_of_sterics          ,
+                              no_of_buried_volumes , system_tags       , experimental_tag       ,
+                              experimental_data    , electronic_tags   , electronic_descriptors ,
+                              radius_proximal      , radius_distal     , buried_volumes         )
+
+            server = get_server(MLRBinary, ScratchFile)
+            for l in range(no_of_systems):
+                with span("cycle", cycle = l):
+                     results = run_job(server, [1, l+1])
+                loo_values.append(float(results[6][l]))
+
+            stop_servers()
+
+    
+  # loo cycles completed, calculate Q2, MAE_loo and print out
+
+    write_loo(LOOFile, Q2File, no_of_systems, system_tags, experimental_data, loo_values)
+
     return()
 # --- End of main run_loo.py -------------------------------
 
@@ -24,6 +24,10 @@ import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from Utilities.set_variables import *
+from Utilities.mlr_engine import *
+from Utilities.mlr_server import grid_points
+from Utilities.mlr_output import *
+from Utilities.profiling import *
 
 
 # ---------------------
@@ -44,22 +48,28 @@ def GetFiles():
 
     parser = argparse.ArgumentParser()
     parser.add_argument("-m", "--matrix", help = "Missing Matrix file")
+    parser.add_argument("-e", "--engine", default = "fortran", help = "MLR engine: fortran (MLR.x) or numpy")
 
     args       = parser.parse_args()    
 
     if not args.matrix:
-       print(' Usage: run_mlr.py -m/--matrix sys08.matrix')
+       print(' Usage: run_mlr.py -m/--matrix sys08.matrix  -e/--engine fortran/numpy')
+       exit()
+
+    if (args.engine != 'fortran') and (args.engine != 'numpy'):
+       print(' Error:  -e/--engine flag must be fortran/numpy')
        exit()
         
         
     MatrixFile = args.matrix
     OutputFile = MatrixFile.replace("matrix","mlr_out")
     R2File     = MatrixFile.replace("matrix","mlr_r2")
+    Engine     = args.engine
         
 
   # All done, return
 
-    return MatrixFile, OutputFile, R2File
+    return MatrixFile, OutputFile, R2File, Engine
 
 # --- End of GetFiles --------------------------------------
 
@@ -77,47 +87,68 @@ def GetR2(OutputFile):
     R2                 := max R2 in the training
     ------------------------------------------------------------- """
 
-    error_values = []
-    
-    with open(OutputFile,"r") as f:
-         for line in f:
-
-             if ("Number of systems" in line): 
-                no_of_systems = float(line.split()[4])
-           
-             if ("Number of Electronic descriptors" in line): 
-                no_of_electronics = float(line.split()[5])
-           
-             if ("Number of Steric descriptors" in line): 
-                no_of_sterics = float(line.split()[5])
-           
-             if ("Max R2" in line) and ("pair" not in line): 
-                R2 = float(line.split()[2])
-
-
-             if ("Fit" in line) and ("Fitted" not in line):
-                    error_values.append(float(line.split()[4]))
-           
-    error_values = np.array(error_values)
+    output = read_mlr_output(OutputFile)
+
+    no_of_systems     = float(output["counts"]["no_of_systems"])
+    no_of_electronics = float(output["counts"]["no_of_electronics"])
+    no_of_sterics     = float(output["counts"]["no_of_sterics"])
+    R2                = float(output["max_r2"][0])
+
+
+  # errors of the fitted systems, from the Fit lines and the final table
+
+    tags, values, kinds = output["table"]
+    fitted_rows = np.array(kinds) == "Fit"
+
+    error_values = np.concatenate((output["grubbs"][1][:, 2], values[fitted_rows, 2]))
     MAE_fit = np.mean(np.abs(error_values))
  
     return (no_of_systems, no_of_electronics, no_of_sterics, R2, MAE_fit)
 # ------------------------------------------------
 
 
+@profiled("analysis")
+def write_r2(R2File, no_of_systems, no_of_electronics, no_of_sterics, R2, MAE_fit):
+
+    """ -------------------------------------------------------------
+    calculate adjusted R2 and write R2, R2_adj and MAE_fit to R2File
+
+    R2File             := output file with R^2 and adjusted R^2
+    R2                 := max R2 in the training
+    MAE_fit            := MAE of the fitted systems
+    ------------------------------------------------------------- """
+
+    no_of_descriptors = no_of_electronics + no_of_sterics
+    R2_adj = 1.0 - (1.0 - R2)*(no_of_systems - 1)/(no_of_systems - no_of_descriptors - 1)
+
+    with open(R2File, "w") as f:
+         f.write( "{:16s}".format("   R2      R2_adj   MAE_fit") + '\n' )
+         f.write( "{:8.3f}".format(R2) + "{:8.3f}".format(R2_adj) )
+         f.write( "{:8.3f}".format(MAE_fit) + '\n' )
+
+    return()
+# ------------------------------------------------
+
+
 def main():
     
   # get input and output files from GetFiles() and path to MLR.x from GetVariables()
 
-    MatrixFile, OutputFile, R2File = GetFiles()
+    MatrixFile, OutputFile, R2File, Engine = GetFiles()
     MLRBinary, PYTHONHOME = GetVariables()
 
 
   # run the code
 
-    run = MLRBinary + " " + MatrixFile + " > " + OutputFile
-
-    os.system(run)
+    if Engine == "numpy":
+       run_mlr_file(MatrixFile, OutputFile)
+    else:
+       run = MLRBinary + " " + MatrixFile + " > " + OutputFile
+       with span("solver", "MLR.x"):
+            os.system(run)
+       if profiling():
+          count("fits")
+          count("grid points", grid_points(MatrixFile))
     
     
   # get R^2 and other data from output file analysis
@@ -127,13 +158,7 @@ def main():
     
   # Calculate adjusted R2 and print out
 
-    no_of_descriptors = no_of_electronics + no_of_sterics
-    R2_adj = 1.0 - (1.0 - R2)*(no_of_systems - 1)/(no_of_systems - no_of_descriptors - 1)
-
-    with open(R2File, "w") as f:
-         f.write( "{:16s}".format("   R2      R2_adj   MAE_fit") + '\n' )
-         f.write( "{:8.3f}".format(R2) + "{:8.3f}".format(R2_adj) )
-         f.write( "{:8.3f}".format(MAE_fit) + '\n' )
+    write_r2(R2File, no_of_systems, no_of_electronics, no_of_sterics, R2, MAE_fit)
   
 
     return()
@@ -15,6 +15,9 @@ To be run as:
    python run_bootstrap.py -m/--matrix  sys08.matrix  -o/--percentage_cycles 0.2 
                            -d/--direction up/dw -c/--cutoff 0.8 -n/--no_of_cycles
 
+Completed cycles are saved in myfile.cycles_ckpt while running. After a crash,
+run again with -r/--resume to skip the cycles already done.
+
 
 Input:
    MatrixFile        : = file     myfile.matrix    Matrix with the dataset to be learned.
@@ -33,6 +36,8 @@ Output:
 
 
 import argparse
+import functools
+import io
 import sys
 import os
 import numpy as np
@@ -40,6 +45,12 @@ import numpy as np
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from Utilities.set_variables import *
 from Utilities.matrix_operation import *
+from Utilities.mlr_engine import *
+from Utilities.mlr_server import *
+from Utilities.parallel import *
+from Utilities.checkpoint import *
+from Utilities.profiling import *
+from Utilities.scratch import *
 
 
 # ---------------------
@@ -63,6 +74,10 @@ def GetFiles():
     parser.add_argument("-d", "--direction", help = "Missing if up or down reordering")
     parser.add_argument("-n", "--no_of_cycles", help = "Missing No of optimization cycles")   
     parser.add_argument("-c", "--cutoff", help = "Missing cutoff on top value in training dataset")
+    parser.add_argument("-e", "--engine", default = "fortran", help = "MLR engine: fortran (MLR.x) or numpy")
+    parser.add_argument("-j", "--jobs",   default = "1",       help = "Number of worker processes")
+    parser.add_argument("--check-updates", action = "store_true", help = "numpy engine: check updated fits against a full refit")
+    parser.add_argument("-r", "--resume", action = "store_true", help = "Skip cycles saved in the checkpoint file")
 
     args            = parser.parse_args()
 
@@ -75,7 +90,11 @@ def GetFiles():
                                       -o/--precentage fraction of systems to predict  \
                                       -d/--direction up or down \
                                       -n/--no_of_cycles  No of 3 bags optimization cycles \
-                                      -c/--cutoff cutoff to define TP/TN')
+                                      -c/--cutoff cutoff to define TP/TN \
+                                      -e/--engine fortran/numpy \
+                                      -j/--jobs No of worker processes \
+                                      --check-updates \
+                                      -r/--resume')
        exit()
 
     MatrixFile   = args.matrix
@@ -83,17 +102,31 @@ def GetFiles():
     updown_flag  = str(args.direction)
     cutoff       = float(args.cutoff)
     no_of_cycles = int(args.no_of_cycles)
+    Engine       = args.engine
+    no_of_jobs   = args.jobs
+    Debug        = args.check_updates
+    resume       = args.resume
 
     if (updown_flag != 'up') and (updown_flag != 'down'):
        print(' Error:  -d/--direction flag must be up/down')
        exit()
 
+    if (Engine != 'fortran') and (Engine != 'numpy'):
+       print(' Error:  -e/--engine flag must be fortran/numpy')
+       exit()
+
+    if (not no_of_jobs.isdigit()) or (int(no_of_jobs) < 1):
+       print(' Error:  -j/--jobs flag must be a positive integer')
+       exit()
+
     
     TempFile  = MatrixFile.replace("matrix", "tmp")
     PRED_File = MatrixFile.replace("matrix", "cycles_dat")
     OUTFile  = MatrixFile.replace("matrix",  "cycles_stat")
+    CheckFile = MatrixFile.replace("matrix", "cycles_ckpt")
     
-    return (MatrixFile, TempFile, PRED_File, OUTFile, percentage, updown_flag, no_of_cycles, cutoff)
+    return (MatrixFile, TempFile, PRED_File, OUTFile, CheckFile, percentage, updown_flag, no_of_cycles,
+            cutoff, Engine, int(no_of_jobs), Debug, resume)
 # ---------------------
 
 
@@ -108,6 +141,7 @@ def calc_Acc_Pre_Rec(tp, fp, tn, fn):
 # ------------------------------------
     
 
+@profiled("analysis")
 def calc_Acc_Pre_Rec_3bags(tp, fp, tn, fn):
  
     Acc_3_bags = np.zeros(4, dtype=float)
@@ -180,22 +214,295 @@ def set_lists_trains_preds(no_of_systems, no_of_preds, no_of_trains, updown_flag
 
 
 
-def one_loop_3bags():
+def run_optimization_cycle(cycle       , TempFile      , MLRBinary      , Engine        ,
+                           matrix      , reordered     , list_of_trains , list_of_preds ,
+                           no_of_preds , no_of_bags    , updown_flag    , cutoff        ,
+                           keep_bags_cycle , BagFile   , Debug = False):
 
-  # get input and output files
+  # simulates one optimization cycle: 3 bags with one system from the training
+  # and one from the prediction subsets, predicted one bag after the other.
+  # TP and FP systems of each bag are added to the training set of the next bag.
+  # Each cycle draws its bags from its own random stream, so that cycles can
+  # run concurrently.
 
-    MatrixFile, TempFile, PRED_File, OUTFile, percentage, updown_flag, no_of_cycles, cutoff = GetFiles()
-    MLRBinary, PYTHONHOME = GetVariables()
+  # Input:
+    # cycle           := (c, seed), cycle number and numpy SeedSequence of the cycle
+    # TempFile        := reordered matrix, as read by MLR.x
+    # matrix          := tuple with the original matrix, as returned by read_matrix
+    # reordered       := (out_tag, out_exp, out_ele, out_vbu) from reorder_matrix
+    # keep_bags_cycle := cycle whose bag matrices are kept as BagFile.bag
+    # BagFile         := name of the kept bag matrices, in the current directory
+    # Debug           := numpy engine, check updated fits against a full refit
 
+  # Output:
+    # cycle_lines     := lines of PRED_File for the bags of this cycle
+    # no_of_TP, no_of_FP, no_of_TN, no_of_FN := counts per bag in this cycle
+  # ---------------------
 
-  # call read_matrix to read matrix_file
+    c, seed = cycle
+    rng     = np.random.default_rng(seed)
+    begin   = now()
 
     title             , print_flag             , normalization_flag   , \
     shift_flag        , skipped_systems        , no_of_systems        , \
     no_of_electronics , no_of_sterics          , no_of_buried_volumes , \
     system_tags       , experimental_tag       , experimental_data    , \
     electronic_tags   , electronic_descriptors , radius_proximal      , \
-    radius_distal     , buried_volumes         = read_matrix(MatrixFile) 
+    radius_distal     , buried_volumes         = matrix
+
+    out_tag, out_exp, out_ele, out_vbu = reordered
+
+    keep_bags   = (c == keep_bags_cycle)
+    cycle_lines = []
+    model       = None
+
+    no_of_TP = np.zeros(3, dtype=int)
+    no_of_FP = np.zeros(3, dtype=int)
+    no_of_TN = np.zeros(3, dtype=int)
+    no_of_FN = np.zeros(3, dtype=int)
+
+
+    print(' cycle ', c)
+    list_outside = rng.choice(list_of_preds, no_of_bags, replace=False)
+    list_inside  = rng.choice(list_of_trains, no_of_bags, replace=False)
+
+    if(updown_flag == "up"):
+        list_outside = np.sort(list_outside)
+
+    if(updown_flag == "down"):
+        list_outside = np.sort(list_outside)
+        list_outside = list_outside[::-1]
+
+
+  # set tags of systems to be skipped - add 3 bags to out_skipped  
+
+    out_skipped = []
+    out_skipped.append(no_of_preds+no_of_bags)
+
+    for i in range(no_of_bags):
+        out_skipped.append(list_inside[i])
+        out_skipped.append(list_outside[i])
+
+
+  # add remaining top systems to out_skipped 
+
+    for i in range(len(list_of_preds)):
+        key_skip = 0
+        if list_of_preds[i] in out_skipped: 
+            key_skip = 1
+        if(key_skip == 0): 
+            out_skipped.append(list_of_preds[i])
+
+
+  # generate list_training exp_training    
+
+    list_training = []
+    exp_training  = []
+
+    for i in range(no_of_systems):
+        key_skip= 0
+        if i+1 in out_skipped[1:]:
+            key_skip = 1
+        if(key_skip == 0):
+            list_training.append(i+1)
+#            exp_training.append(experimental_data[i])
+            exp_training.append(out_exp[i])
+
+
+  # scan the bags
+
+    for bag in range(no_of_bags):
+
+        if(updown_flag == "up"):
+            threshold = np.max(exp_training) * cutoff
+
+        if(updown_flag == "down"):
+            threshold = np.min(exp_training) * cutoff
+
+
+  # in-memory engine: take values as written by MLR.x in the LOO lines.
+  # Unless normalization depends on the skipped systems, the training set is
+  # factorized at the first bag only, and TP and FP systems joining it later
+  # are added by rank-one updates.
+
+        if Engine == "numpy":
+            if normalization_flag == 2 or normalization_flag == 4:
+                results = run_mlr(normalization_flag , shift_flag      , out_skipped   ,
+                                  no_of_systems      , no_of_sterics   , out_exp       ,
+                                  out_ele            , radius_proximal , radius_distal ,
+                                  out_vbu            )
+            else:
+                if model is None:
+                    model = start_mlr_updates(normalization_flag , shift_flag , out_skipped ,
+                                              no_of_systems      , no_of_sterics , out_exp  ,
+                                              out_ele            , out_vbu    )
+                results = run_mlr_updated(model, radius_proximal, radius_distal, Debug)
+            loo_lines = [(i+1, round_significant(results[6][i]), round_significant(results[5][i]))
+                         for i in skipped_ids(out_skipped)]
+
+        else:
+
+  # MLR.x: the reordered matrix in TempFile is kept in memory by MLR.x in server
+  # mode, send the systems skipped in this bag and take values as in the LOO lines
+
+            results   = run_job(get_server(MLRBinary, TempFile), out_skipped)
+            loo_lines = [(i+1, float(results[5][i]), float(results[6][i]))
+                         for i in skipped_ids(out_skipped)]
+
+            if keep_bags:
+               with span("matrix write"):
+                    write_matrix(BagFile + "." + str(bag)  , title             , print_flag           ,
+                                 normalization_flag   , shift_flag        , out_skipped          ,
+                                 no_of_systems        , no_of_electronics , no_of_sterics        ,
+                                 no_of_buried_volumes , out_tag           , experimental_tag     ,
+                                 out_exp              , electronic_tags   , out_ele              ,
+                                 radius_proximal      , radius_distal     , out_vbu         )
+
+
+  # do the analysis
+
+        sys = []
+        exp = []
+        pre = []
+        TOF = []
+
+        for loo_sys, loo_exp, loo_pre in loo_lines:
+            sys.append(loo_sys)
+            exp.append(loo_exp)
+            pre.append(loo_pre)
+            max_exp = np.max(exp_training)
+            min_exp = np.min(exp_training)
+
+            if sys[-1] == list_outside[bag] or sys[-1] == list_inside[bag]:
+
+                if updown_flag == "up":
+
+                  if pre[-1] >= threshold:
+                      if exp[-1] >= max_exp:
+                         TOF.append("TP")
+                         no_of_TP[bag] = no_of_TP[bag] + 1
+                      else:
+                         TOF.append("FP")
+                         no_of_FP[bag] = no_of_FP[bag] + 1
+
+                  if pre[-1] < threshold:
+                      if exp[-1] > max_exp:
+                         TOF.append("FN")
+                         no_of_FN[bag] = no_of_FN[bag] + 1
+                      else:
+                         TOF.append("TN")
+                         no_of_TN[bag] = no_of_TN[bag] + 1
+
+
+                if updown_flag == "down":
+
+                  if pre[-1] > threshold and exp[-1] > min_exp:
+                      TOF.append("TN")
+                      no_of_TN[bag] = no_of_TN[bag] + 1
+
+                  if pre[-1] > threshold and exp[-1] < min_exp:
+                      TOF.append("FN")
+                      no_of_FN[bag] = no_of_FN[bag] + 1
+
+                  if pre[-1] < threshold and exp[-1] > min_exp:
+                      TOF.append("FP")
+                      no_of_FP[bag] = no_of_FP[bag] + 1
+
+                  if pre[-1] < threshold and exp[-1] < min_exp:
+                      TOF.append("TP")
+                      no_of_TP[bag] = no_of_TP[bag] + 1
+
+
+        with io.StringIO() as f:
+             f.write("{:5d} ".format(c)
+                    +"{:3d}".format(bag+1)
+                    +"{:8.3f}".format(threshold/cutoff)
+                    +"{:8.3f}".format(threshold)
+                    +"{:4d}".format(sys[0])
+                    +"{:8.3f}".format(exp[0])
+                    +"{:8.3f}".format(pre[0])
+                    +"{:>3s}".format(TOF[0])
+                    +"{:4d}".format(sys[1])
+                    +"{:8.3f}".format(exp[1])
+                    +"{:8.3f}".format(pre[1])
+                    +"{:>3s}".format(TOF[1]))
+
+             for ii in range(len(list_training)):
+                 f.write("{:6d}".format(list_training[ii]))
+             f.write("\n")
+             cycle_lines.append(f.getvalue())
+
+
+      # bag completed - add TP and FP systems to the matrix
+
+        num_move  = 0
+        temp_pred = []
+        temp_pred.append(out_skipped[1])
+        temp_pred.append(out_skipped[2])
+
+
+        if TOF[1] == "TP" or TOF[1] == "FP":
+            list_training.append(out_skipped[2])
+            temp_pred.pop(1)
+            num_move += 1
+            exp_training.append(out_exp[out_skipped[2]-1])
+
+
+        if TOF[0] == "TP" or TOF[0] == "FP":
+            list_training.append(out_skipped[1])
+            temp_pred.pop(0)
+            num_move += 1
+            exp_training.append(out_exp[out_skipped[1]-1])
+
+        if model is not None:
+            model = add_systems(model, list_training[len(list_training)-num_move:])
+
+
+        out_skipped[0] -= num_move
+        out_skipped.pop(1)
+        out_skipped.pop(1)
+
+        for ii in range(len(temp_pred)):
+            out_skipped.append(temp_pred[ii])
+
+        if updown_flag == "up":
+            threshold = np.max(exp_training) * cutoff
+
+        if updown_flag == "down":
+            threshold = np.min(exp_training) * cutoff
+
+    record_span("cycle", "cycle", begin, now(), cycle = c)
+
+
+    return (cycle_lines, no_of_TP, no_of_FP, no_of_TN, no_of_FN)
+# ---------------------------------------
+
+
+
+def run_optimization_cycles(matrix     , TempFile     , PRED_File , OUTFile    ,
+                            CheckFile  , percentage   , updown_flag  , no_of_cycles ,
+                            cutoff     , Engine       , no_of_jobs   , Debug        ,
+                            MLRBinary  , resume       ):
+
+  # runs no_of_cycles optimization cycles on matrix, and writes the history of
+  # all bags in PRED_File and the TP, FP, TN, FN summary in OUTFile
+
+  # Input:
+    # matrix       := tuple with the matrix, as returned by read_matrix
+    # percentage   := fraction of systems in the prediction subset
+    # no_of_cycles := No of optimization cycles
+    # cutoff       := fraction of the top system in the training set defining TP/TN
+    # no_of_jobs   := No of worker processes
+    # CheckFile    := checkpoint file with the results of completed cycles
+    # resume       := if True, cycles saved in CheckFile are not run again
+  # ---------------------
+
+    title             , print_flag             , normalization_flag   , \
+    shift_flag        , skipped_systems        , no_of_systems        , \
+    no_of_electronics , no_of_sterics          , no_of_buried_volumes , \
+    system_tags       , experimental_tag       , experimental_data    , \
+    electronic_tags   , electronic_descriptors , radius_proximal      , \
+    radius_distal     , buried_volumes         = matrix
 
 
   # reorder matrix and put the reordered content to the out_* lists
@@ -220,9 +527,9 @@ def one_loop_3bags():
     list_of_trains, list_of_preds = set_lists_trains_preds(no_of_systems, no_of_preds, no_of_trains, updown_flag)
   
 
-    np.random.seed(223)
-    os.system("rm " + PRED_File)
-    os.system("rm " + OUTFile)
+    for OldFile in (PRED_File, OUTFile):
+        if os.path.exists(OldFile):
+           os.remove(OldFile)
  
     no_of_TP = np.zeros(4, dtype=int)
     no_of_FP = np.zeros(4, dtype=int)
@@ -230,195 +537,63 @@ def one_loop_3bags():
     no_of_FN = np.zeros(4, dtype=int)
     
     
-  # start optimization cycles - generate 3 bags
-   
-    for c in range(no_of_cycles):
-        print(' cycle ', c)
-        list_outside = np.random.choice(list_of_preds, no_of_bags, replace=False)
-        list_inside  = np.random.choice(list_of_trains, no_of_bags, replace=False)
-        
-        if(updown_flag == "up"):
-            list_outside = np.sort(list_outside)
-            
-        if(updown_flag == "down"):
-            list_outside = np.sort(list_outside)
-            list_outside = list_outside[::-1]
- 
+  # start optimization cycles - generate 3 bags.
+  # each cycle has its own random stream spawned from seed 223, so that cycles
+  # can run on no_of_jobs worker processes with results independent of the
+  # number of workers. Results are merged back in cycle order.
+  # cycles are run in chunks, and results of completed cycles are saved in
+  # CheckFile after each chunk.
+  # MLR.x: the reordered matrix is written once in a scratch file and kept in
+  # memory by MLR.x in server mode, one server per worker. Bag matrices of the
+  # last cycle are kept as TempFile.bag
+
+    with scratch_file(TempFile) as ScratchFile:
+         if Engine == "fortran":
+            with span("matrix write"):
+                 write_matrix(ScratchFile          , title             , print_flag           ,
+                              normalization_flag   , shift_flag        , skipped_systems      ,
+                              no_of_systems        , no_of_electronics , no_of_sterics        ,
+                              no_of_buried_volumes , out_tag           , experimental_tag     ,
+                              out_exp              , electronic_tags   , out_ele              ,
+                              radius_proximal      , radius_distal     , out_vbu              )
+
+         seeds     = np.random.SeedSequence(223).spawn(no_of_cycles)
+         run_cycle = functools.partial(run_optimization_cycle,
+                                       TempFile        = ScratchFile,
+                                       MLRBinary       = MLRBinary,
+                                       Engine          = Engine,
+                                       matrix          = matrix,
+                                       reordered       = (out_tag, out_exp, out_ele, out_vbu),
+                                       list_of_trains  = list_of_trains,
+                                       list_of_preds   = list_of_preds,
+                                       no_of_preds     = no_of_preds,
+                                       no_of_bags      = no_of_bags,
+                                       updown_flag     = updown_flag,
+                                       cutoff          = cutoff,
+                                       keep_bags_cycle = no_of_cycles - 1,
+                                       BagFile         = TempFile,
+                                       Debug           = Debug)
+
+         key     = checkpoint_key("optimization cycles", matrix, percentage, updown_flag,
+                                  no_of_cycles, cutoff, Engine)
+         results = run_checkpointed(lambda cycles: map_cycles(run_cycle, [(c, seeds[c]) for c in cycles],
+                                                              no_of_jobs),
+                                    no_of_cycles, CheckFile, key, resume)
+
+         if Engine == "fortran":
+            stop_servers()
+
+    with open(PRED_File, "w") as f:
+         for c in range(no_of_cycles):
+             cycle_lines, cycle_TP, cycle_FP, cycle_TN, cycle_FN = results[c]
+             for line in cycle_lines:
+                 f.write(line)
+
+             no_of_TP[:3] = no_of_TP[:3] + cycle_TP
+             no_of_FP[:3] = no_of_FP[:3] + cycle_FP
+             no_of_TN[:3] = no_of_TN[:3] + cycle_TN
+             no_of_FN[:3] = no_of_FN[:3] + cycle_FN
 
-      # set tags of systems to be skipped - add 3 bags to out_skipped  
-      
-        out_skipped = []
-        out_skipped.append(no_of_preds+no_of_bags)
-        
-        for i in range(no_of_bags):
-            out_skipped.append(list_inside[i])
-            out_skipped.append(list_outside[i])
-            
-            
-      # add remaining top systems to out_skipped 
-      
-        for i in range(len(list_of_preds)):
-            key_skip = 0
-            if list_of_preds[i] in out_skipped: 
-                key_skip = 1
-            if(key_skip == 0): 
-                out_skipped.append(list_of_preds[i])
- 
-    
-      # generate list_training exp_training    
-      
-        list_training = []
-        exp_training  = []
-        
-        for i in range(no_of_systems):
-            key_skip= 0
-            if i+1 in out_skipped[1:]:
-                key_skip = 1
-            if(key_skip == 0):
-                list_training.append(i+1)
-#                exp_training.append(experimental_data[i])
-                exp_training.append(out_exp[i])
-
-    
-      # scan the bags
-      
-        for bag in range(no_of_bags):
-            
-      # generate temporary file
-      
-            write_matrix(TempFile             , title             , print_flag           ,
-                         normalization_flag   , shift_flag        , out_skipped          ,
-                         no_of_systems        , no_of_electronics , no_of_sterics        ,
-                         no_of_buried_volumes , out_tag           , experimental_tag     ,
-                         out_exp              , electronic_tags   , out_ele              ,
-                         radius_proximal      , radius_distal     , out_vbu         )
-        
-            
-      # run the fortran code
-      
-            run =  MLRBinary  + " " + TempFile + " > temp.out"
-            os.system(run)
-
-            os.system("cp " + TempFile + "  " + TempFile + "." + str(bag))
-    
-            
-      # do the analysis
-      
-            if(updown_flag == "up"):
-                threshold = np.max(exp_training) * cutoff
-    
-            if(updown_flag == "down"):
-                threshold = np.min(exp_training) * cutoff
-      
-            sys = []
-            exp = []
-            pre = []
-            TOF = []
-            
-            with open('temp.out', 'r') as f:
-                lines = f.readlines()
-                for line in lines:
-                    if (line[0:3] == "LOO"):
-                      sys.append(int(line.split()[1]))
-                      exp.append(float(line.split()[2]))
-                      pre.append(float(line.split()[3]))
-                      max_exp = np.max(exp_training)
-                      min_exp = np.min(exp_training)
-                      
-                      if sys[-1] == list_outside[bag] or sys[-1] == list_inside[bag]:
-
-                          if updown_flag == "up":
-                              
-                            if pre[-1] >= threshold:
-                                if exp[-1] >= max_exp:
-                                   TOF.append("TP")
-                                   no_of_TP[bag] = no_of_TP[bag] + 1
-                                else:
-                                   TOF.append("FP")
-                                   no_of_FP[bag] = no_of_FP[bag] + 1
-    
-                            if pre[-1] < threshold:
-                                if exp[-1] > max_exp:
-                                   TOF.append("FN")
-                                   no_of_FN[bag] = no_of_FN[bag] + 1
-                                else:
-                                   TOF.append("TN")
-                                   no_of_TN[bag] = no_of_TN[bag] + 1
-                                
-                                
-                          if updown_flag == "down":
-                              
-                            if pre[-1] > threshold and exp[-1] > min_exp:
-                                TOF.append("TN")
-                                no_of_TN[bag] = no_of_TN[bag] + 1
-    
-                            if pre[-1] > threshold and exp[-1] < min_exp:
-                                TOF.append("FN")
-                                no_of_FN[bag] = no_of_FN[bag] + 1
-    
-                            if pre[-1] < threshold and exp[-1] > min_exp:
-                                TOF.append("FP")
-                                no_of_FP[bag] = no_of_FP[bag] + 1
-    
-                            if pre[-1] < threshold and exp[-1] < min_exp:
-                                TOF.append("TP")
-                                no_of_TP[bag] = no_of_TP[bag] + 1
-                                                  
-                
-            with open(PRED_File, "a") as f:
-                 f.write("{:5d} ".format(c)
-                        +"{:3d}".format(bag+1)
-                        +"{:8.3f}".format(threshold/cutoff)
-                        +"{:8.3f}".format(threshold)
-                        +"{:4d}".format(sys[0])
-                        +"{:8.3f}".format(exp[0])
-                        +"{:8.3f}".format(pre[0])
-                        +"{:>3s}".format(TOF[0])
-                        +"{:4d}".format(sys[1])
-                        +"{:8.3f}".format(exp[1])
-                        +"{:8.3f}".format(pre[1])
-                        +"{:>3s}".format(TOF[1]))
-              
-                 for ii in range(len(list_training)):
-                     f.write("{:6d}".format(list_training[ii]))
-                 f.write("\n")
-      
-                
-          # bag completed - add TP and FP systems to the matrix
-      
-            num_move  = 0
-            temp_pred = []
-            temp_pred.append(out_skipped[1])
-            temp_pred.append(out_skipped[2])
-            
-    
-            if TOF[1] == "TP" or TOF[1] == "FP":
-                list_training.append(out_skipped[2])
-                temp_pred.pop(1)
-                num_move += 1
-                exp_training.append(out_exp[out_skipped[2]-1])
-
-
-            if TOF[0] == "TP" or TOF[0] == "FP":
-                list_training.append(out_skipped[1])
-                temp_pred.pop(0)
-                num_move += 1
-                exp_training.append(out_exp[out_skipped[1]-1])
-
-            
-            out_skipped[0] -= num_move
-            out_skipped.pop(1)
-            out_skipped.pop(1)
-            
-            for ii in range(len(temp_pred)):
-                out_skipped.append(temp_pred[ii])
-                
-            if updown_flag == "up":
-                threshold = np.max(exp_training) * cutoff
-                
-            if updown_flag == "down":
-                threshold = np.min(exp_training) * cutoff
-    
     no_of_TP[3] = np.sum(no_of_TP)
     no_of_FP[3] = np.sum(no_of_FP)
     no_of_TN[3] = np.sum(no_of_TN)
@@ -452,10 +627,33 @@ def one_loop_3bags():
                +"{:6.3f} ".format(Acc_3_bags[3]) 
                +"{:6.3f} ".format(Pre_3_bags[3]) 
                +"{:6.3f} ".format(Rec_3_bags[3]) + '\n')
+
+    remove_checkpoint(CheckFile)
+
+    return()
+# ---------------------------------------
+
+
+
+def one_loop_3bags():
+
+  # get input and output files
+
+    (MatrixFile, TempFile, PRED_File, OUTFile, CheckFile, percentage, updown_flag, no_of_cycles,
+     cutoff, Engine, no_of_jobs, Debug, resume) = GetFiles()
+    MLRBinary, PYTHONHOME = GetVariables()
+
+
+  # call read_matrix to read matrix_file and run the optimization cycles
+
+    with span("matrix read"):
+         matrix = read_matrix(MatrixFile)
+
+    run_optimization_cycles(matrix     , TempFile     , PRED_File , OUTFile    ,
+                            CheckFile  , percentage   , updown_flag  , no_of_cycles ,
+                            cutoff     , Engine       , no_of_jobs   , Debug        ,
+                            MLRBinary  , resume       )
    
-  
-    os.system('rm temp.out')
-    os.system('rm ' + TempFile)
     print('all done')
 
 
@@ -61,12 +61,10 @@ def GetFiles():
     return Basename, MLRFile, LOOFile, YRANDFile, BOOTFile, PREDFile, CYCLEFile, OUTFile
 # --- End of GetFiles -----------------------------
 
-def main():
-    
-  # get input and output files
+def write_pcs(Basename, MLRFile, LOOFile, YRANDFile, BOOTFile, PREDFile, CYCLEFile, OUTFile):
 
-    
-    Basename, MLRFile, LOOFile, YRANDFile, BOOTFile, PREDFile, CYCLEFile, OUTFile = GetFiles()
+  # collects the results of all tests from their output files, and writes the
+  # summary in OUTFile and the data for the radar plot in the .radar_pcs file
 
 
 # read MLR
@@ -76,7 +74,7 @@ def main():
     file.close()
     words = []
     words = file_lines[1].split()
-    words = np.array(words).astype(np.float)
+    words = np.array(words).astype(float)
     mlr_r2 = words[0]
     mlr_ar2 = words[1]
     mlr_mae = words[2]
@@ -89,7 +87,7 @@ def main():
     file.close()
     words = []
     words = file_lines[1].split()
-    words = np.array(words).astype(np.float)
+    words = np.array(words).astype(float)
     loo_q2 = words[0]
     loo_mae = words[1]
 
@@ -103,7 +101,7 @@ def main():
     words = file_lines[1].split()
     words.pop(6)
     words.pop(3)
-    words = np.array(words).astype(np.float)
+    words = np.array(words).astype(float)
     yrand_syr2_max = words[1]
     yrand_syr2_ave = words[4]
 
@@ -117,12 +115,12 @@ def main():
     words = file_lines[1].split()   
     words.pop(2)
     words.pop(0)
-    words = np.array(words).astype(np.float)
+    words = np.array(words).astype(float)
     boot_mae_fit = words[0]
     words = file_lines[2].split()   
     words.pop(2)
     words.pop(0)
-    words = np.array(words).astype(np.float)
+    words = np.array(words).astype(float)
     boot_mae_cff = words[0]
 
 
@@ -133,7 +131,7 @@ def main():
     file.close()
     words = [] 
     words = file_lines[1].split()   
-    words = np.array(words).astype(np.float)
+    words = np.array(words).astype(float)
     pred_mae = words[2]
 
 
@@ -144,7 +142,7 @@ def main():
     file.close()
     words = []
     words = file_lines[4].split()[5:8]
-    words = np.array(words).astype(np.float)
+    words = np.array(words).astype(float)
     cycle_pre = words[0]
     cycle_acc = words[1]
     cycle_rec = words[2]
@@ -215,6 +213,76 @@ def main():
          f.write("{:20s}".format('$Pre_{80}$     ') + "{:8.3f}".format(PCS[10]) + '\n' )
          f.write("{:20s}".format('$Rec_{80}$     ') + "{:8.3f}".format(PCS[11]) + '\n' )
 
+    return()
+
+
+# metrics of the .pcs file, in the order they are written, as columns of the
+# table of a batch of datasets
+
+PCS_COLUMNS = ["R2", "MAE_Fit", "Q2", "MAE_LOO", "SR2_Max", "SR2_Av",
+               "MAD_BP", "MAD_BC", "MAE_T20", "Acc_80", "Pre_80", "Rec_80"]
+
+
+def read_pcs(PCSFile):
+
+  # reads the metrics written by write_pcs in PCSFile, None if the file is
+  # missing or not complete, e.g. for a dataset whose tests did not end
+
+    if not os.path.exists(PCSFile):
+       return None
+
+    with open(PCSFile, "r") as f:
+         file_lines = f.readlines()
+
+    values = [line.split()[-1] for line in file_lines[1:] if line.strip()]
+    if len(values) != len(PCS_COLUMNS):
+       return None
+
+    return [float(v) for v in values]
+
+
+def write_batch_pcs(TableFile, datasets, PCSFiles, wall_times):
+
+  # writes the metrics of a batch of datasets in TableFile, one row per dataset
+  # with its wall time in seconds. Datasets without results are marked failed.
+
+  # Input:
+    # datasets   := name of each dataset
+    # PCSFiles   := .pcs file of each dataset, as written by write_pcs
+    # wall_times := wall time of each dataset, from its first to its last stage
+  # ---------------------
+
+    no_of_failed = 0
+
+    with open(TableFile, "w") as f:
+         f.write("{:20s}".format("Dataset") + "".join(["{:>9s}".format(c) for c in PCS_COLUMNS])
+                + "{:>10s}".format("Wall") + '\n')
+
+         for dataset, PCSFile, wall_time in zip(datasets, PCSFiles, wall_times):
+             values = read_pcs(PCSFile)
+             if values is None:
+                no_of_failed += 1
+                f.write("{:20s}".format(dataset) + "".join(["{:>9s}".format("failed")]*len(PCS_COLUMNS))
+                       + "{:10.2f}".format(wall_time) + '\n')
+             else:
+                f.write("{:20s}".format(dataset) + "".join(["{:9.3f}".format(v) for v in values])
+                       + "{:10.2f}".format(wall_time) + '\n')
+
+    if no_of_failed > 0:
+       print(' Warning: no results for ' + str(no_of_failed) + ' datasets, marked failed in ' + TableFile)
+
+    return()
+
+
+def main():
+    
+  # get input and output files
+
+    
+    Basename, MLRFile, LOOFile, YRANDFile, BOOTFile, PREDFile, CYCLEFile, OUTFile = GetFiles()
+
+    write_pcs(Basename, MLRFile, LOOFile, YRANDFile, BOOTFile, PREDFile, CYCLEFile, OUTFile)
+
 
 #==============================================================================
 if __name__ == '__main__':
@@ -24,6 +24,7 @@ Output:
 --------------------------------------------------------------------------- """
 
 import argparse
+import subprocess
 import sys
 import os
 import numpy as np
@@ -31,6 +32,11 @@ import numpy as np
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from Utilities.set_variables import *
 from Utilities.matrix_operation import *
+from Utilities.mlr_engine import *
+from Utilities.mlr_server import *
+from Utilities.mlr_output import *
+from Utilities.profiling import *
+from Utilities.scratch import *
 
 
 # ---------------------
@@ -54,6 +60,7 @@ def GetFiles():
     parser.add_argument("-m", "--matrix",  help = "Missing Matrix file") 
     parser.add_argument("-t", "--top_percentage", help = "Missing Percentage between 0.0-1.0")
     parser.add_argument("-d", "--direction", help = "Missing if up or down reordering")
+    parser.add_argument("-e", "--engine", default = "fortran", help = "MLR engine: fortran (MLR.x) or numpy")
 
     args            = parser.parse_args()
 
@@ -62,17 +69,23 @@ def GetFiles():
     or (not args.direction)      :
        print(' Usage:  run_reorder.py -m/--matrix file.matrix    \
                                       -t/--top_precentage fraction of systems to predict  \
-                                      -d/--direction up or down' )
+                                      -d/--direction up or down \
+                                      -e/--engine fortran/numpy' )
        exit()
 
     MatrixFile      = args.matrix
     percentage      = float(args.top_percentage)
     updown_flag     = str(args.direction)
+    Engine          = args.engine
 
     if (updown_flag != 'up') and (updown_flag != 'down'):
        print(' Error:  -d/--direction flag must be up/down')
        exit()
 
+    if (Engine != 'fortran') and (Engine != 'numpy'):
+       print(' Error:  -e/--engine flag must be fortran/numpy')
+       exit()
+
     
     OutputFile  = MatrixFile.replace("matrix", "pred_out")
     TempFile    = MatrixFile.replace("matrix", "tmp")
@@ -80,10 +93,12 @@ def GetFiles():
     PREFile     = MatrixFile.replace("matrix", "pred_pre")
     DATFile     = MatrixFile.replace("matrix", "pred_dat")
 
-    return (MatrixFile, OutputFile, TempFile, PRED_File, PREFile, DATFile, percentage, updown_flag)
+    return (MatrixFile, OutputFile, TempFile, PRED_File, PREFile, DATFile, percentage, updown_flag,
+            Engine)
 
 
 # ---------------------
+@profiled("analysis")
 def analysis_pred(PRED_File, PREFile, DATFile, system_tags, out_skipped, 
                   experimental_data, reference_fit, reference_pre) :
 
@@ -143,6 +158,7 @@ def analysis_pred(PRED_File, PREFile, DATFile, system_tags, out_skipped,
 
 # ---------------------
 
+@profiled("matrix assembly")
 def reorder_matrix(title             , print_flag             , normalization_flag   ,  
                    shift_flag        , skipped_systems        , no_of_systems        ,  
                    no_of_electronics , no_of_sterics          , no_of_buried_volumes ,  
@@ -194,21 +210,27 @@ def reorder_matrix(title             , print_flag             , normalization_fl
 
 # ---------------------
 
-def main():
-    
-  # get input and output files
+def run_prediction(matrix     , TempFile   , OutputFile , PRED_File , PREFile , DATFile ,
+                   percentage , updown_flag , Engine    , MLRBinary ):
 
-    MatrixFile, OutputFile, TempFile, PRED_File, PREFile, DATFile, percentage, updown_flag = GetFiles()
-    MLRBinary, PYTHONHOME = GetVariables()
+  # fits the MLR on the bottom (top) subset of the reordered matrix and predicts
+  # the systems in the top (bottom) subset. The in-memory engine works on matrix
+  # only, without writing the TempFile matrix.
 
-  # call read_matrix to read matrix_file
+  # Input:
+    # matrix      := tuple with the matrix, as returned by read_matrix
+    # TempFile    := name of the matrix read by MLR.x, as written in OutputFile.
+    #                MLR.x runs in a scratch directory removed at the end
+    # percentage  := fraction of systems in the prediction subset
+    # updown_flag := up/down, predict the top or the bottom subset
+  # ---------------------
 
     title             , print_flag             , normalization_flag   , \
     shift_flag        , skipped_systems        , no_of_systems        , \
     no_of_electronics , no_of_sterics          , no_of_buried_volumes , \
     system_tags       , experimental_tag       , experimental_data    , \
     electronic_tags   , electronic_descriptors , radius_proximal      , \
-    radius_distal     , buried_volumes         = read_matrix(MatrixFile) 
+    radius_distal     , buried_volumes         = matrix
 
 
   # initialize arrays and set skipped_systems array to indicate systems to be predicted
@@ -238,78 +260,107 @@ def main():
     radius_distal     , buried_volumes         , updown_flag          )
 
 
-  # write matrix for training the MLR model on the whole dataset
+  # in-memory engine: fit the whole dataset and the bottom subset from the reordered
+  # arrays. Take values as written by MLR.x in the Fit and Pre lines.
+
+    dat_lines = []
+
+    if Engine == "numpy":
+       R2, point, rv, rr, coefficients, fitted, experiments, exp_av, exp_sd = run_mlr_cached(
+           normalization_flag , shift_flag      , skipped_systems ,
+           no_of_systems      , no_of_sterics   , out_exp         ,
+           out_ele            , radius_proximal , radius_distal   ,
+           out_vbu            )
+
+       fit_mask      = ~skipped_mask(skipped_systems, no_of_systems)
+       reference_fit = list(round_significant(exp_av + exp_sd*fitted[fit_mask]))
+
+       R2, point, rv, rr, coefficients, fitted, experiments, exp_av, exp_sd = run_mlr_cached(
+           normalization_flag , shift_flag      , out_skipped     ,
+           no_of_systems      , no_of_sterics   , out_exp         ,
+           out_ele            , radius_proximal , radius_distal   ,
+           out_vbu            )
+
+       write_mlr_output(OutputFile         , TempFile          , title             ,
+                        normalization_flag , shift_flag        , out_skipped       ,
+                        no_of_systems      , no_of_electronics , no_of_sterics     ,
+                        out_tag            , R2                , rv                ,
+                        rr                 , coefficients      , fitted            ,
+                        experiments        , exp_av            , exp_sd            )
+
+       skip_mask     = skipped_mask(out_skipped, no_of_systems)
+       useful_data   = round_significant(np.array([experiments, fitted, fitted - experiments]))
+       reference_pre = list(round_significant(exp_av + exp_sd*fitted))
+
+       for i in range(no_of_systems):
+           dat_lines.append((out_tag[i][:12], useful_data[:, i], 'Pre' if skip_mask[i] else 'Fit'))
+
+    else:
 
-    write_matrix(TempFile             , title             , print_flag           ,
-                 normalization_flag   , shift_flag        , skipped_systems      ,
-                 no_of_systems        , no_of_electronics , no_of_sterics        ,
-                 no_of_buried_volumes , out_tag           , experimental_tag     ,
-                 out_exp              , electronic_tags   , out_ele     ,
-                 radius_proximal      , radius_distal     , out_vbu         ) 
+     # write matrix for training the MLR model on the whole dataset, in a
+     # scratch directory where MLR.x runs, with its Rm- file
 
+       with scratch_file(TempFile) as ScratchFile:
+            with span("matrix write"):
+                 write_matrix(ScratchFile          , title             , print_flag           ,
+                              normalization_flag   , shift_flag        , skipped_systems      ,
+                              no_of_systems        , no_of_electronics , no_of_sterics        ,
+                              no_of_buried_volumes , out_tag           , experimental_tag     ,
+                              out_exp              , electronic_tags   , out_ele     ,
+                              radius_proximal      , radius_distal     , out_vbu         )
 
-  # running MLR on the input matrix 
 
-    run = MLRBinary + " " + TempFile + " > " + OutputFile
-    os.system(run)
+          # running MLR on the input matrix in quiet mode, writing only the result
+          # record, to get reference fitted values of the systems not skipped
 
- # parse temp.out to get reference fitted values 
+            results       = run_quiet(MLRBinary, ScratchFile)
+            fit_mask      = ~skipped_mask(skipped_systems, no_of_systems)
+            reference_fit = [float(results[7][i]) for i in range(no_of_systems) if fit_mask[i]]
 
-    reference_fit = []
 
-    with open(OutputFile, "r") as f:
-         lines = f.readlines()
-         for line in lines:
-             if (line[-4:-1] == "Fit"):
-                reference_fit.append(float(line.split()[6]))
+          # End of reference MLR run - start the prediction run by 
+          # writing matrix with out_skipped defining the predicted systems
 
+            with span("matrix write"):
+                 write_matrix(ScratchFile          , title             , print_flag           ,
+                              normalization_flag   , shift_flag        , out_skipped          ,
+                              no_of_systems        , no_of_electronics , no_of_sterics        ,
+                              no_of_buried_volumes , out_tag           , experimental_tag     ,
+                              out_exp              , electronic_tags   , out_ele     ,
+                              radius_proximal      , radius_distal     , out_vbu         )
 
-  # End of reference MLR run - start the prediction run by 
-  # writing matrix with out_skipped defining the predicted systems
 
-    write_matrix(TempFile             , title             , print_flag           ,
-                 normalization_flag   , shift_flag        , out_skipped          ,
-                 no_of_systems        , no_of_electronics , no_of_sterics        ,
-                 no_of_buried_volumes , out_tag           , experimental_tag     ,
-                 out_exp              , electronic_tags   , out_ele     ,
-                 radius_proximal      , radius_distal     , out_vbu         ) 
+          # running MLR on the prediction matrix, by its name in the scratch directory
+          # as MLR.x writes Rm- followed by the name of its input
 
+            with open(OutputFile, "w") as f, span("solver", "MLR.x"):
+                 subprocess.run([MLRBinary, os.path.basename(ScratchFile)],
+                                cwd=os.path.dirname(ScratchFile), stdout=f)
+            if profiling():
+               count("fits")
+               count("grid points", grid_points(ScratchFile))
 
-  # running MLR on the prediction matrix 
 
-    run = MLRBinary + " " + TempFile + " > " + OutputFile
-    os.system(run)
+     # from the final table get reference fitted values and predicted values
 
+       output = read_mlr_output(OutputFile)
 
-  # from temp.out get reference fitted values and coefficients
+       tags, values, kinds = output["table"]
+       reference_pre = list(values[:, 4])
 
-    reference_pre = []
+       for i in range(len(tags)):
+           dat_lines.append((tags[i], values[i, 0:3], kinds[i]))
 
-    with open(OutputFile, "r") as f:
-         lines = f.readlines()
+
+  # write experimental, fitted and predicted values
 
     with open(DATFile, "w") as f:
-         for line in lines:
-             if (line[-4:-1] == "Fit"):
-                columns = line.split()
-                reference_pre.append(float(columns[6]))
-                useful_data = np.array(columns[2:5]).astype(np.float)
-                f.write("{:12s}".format(columns[1]) 
-                      + "{:10.5f}".format(useful_data[0])    
-                      + "{:10.5f}".format(useful_data[1])    
-                      + "{:10.5f}".format(useful_data[2]) + '  ' 
-                      + "{:3s}".format(columns[8])        + '\n' )
-             if (line[-4:-1] == "Pre"):
-                columns = line.split()
-                reference_pre.append(float(columns[6]))
-                useful_data = np.array(columns[2:5]).astype(np.float)
-                f.write("{:12s}".format(columns[1]) 
-                      + "{:10.5f}".format(useful_data[0])    
-                      + "{:10.5f}".format(useful_data[1])    
-                      + "{:10.5f}".format(useful_data[2]) + '  ' 
-                      + "{:3s}".format(columns[8])        + '\n' )
-
-    os.system("rm " + TempFile )
+         for tag, useful_data, fit_pre in dat_lines:
+             f.write("{:12s}".format(tag) 
+                   + "{:10.5f}".format(useful_data[0])    
+                   + "{:10.5f}".format(useful_data[1])    
+                   + "{:10.5f}".format(useful_data[2]) + '  ' 
+                   + "{:3s}".format(fit_pre)           + '\n' )
 
 
   # prediction run done - start analysis writing files
@@ -321,7 +372,28 @@ def main():
   # analyze and print prediction data
 
     analysis_pred(PRED_File, PREFile, DATFile, out_tag, out_skipped,
-                  out_exp, reference_fit, reference_pre) 
+                  out_exp, reference_fit, reference_pre)
+
+    return()
+
+# ---------------------
+
+def main():
+    
+  # get input and output files
+
+    (MatrixFile, OutputFile, TempFile, PRED_File, PREFile, DATFile, percentage, updown_flag,
+     Engine) = GetFiles()
+    MLRBinary, PYTHONHOME = GetVariables()
+
+
+  # call read_matrix to read matrix_file and run the predictions
+
+    with span("matrix read"):
+         matrix = read_matrix(MatrixFile)
+
+    run_prediction(matrix     , TempFile   , OutputFile , PRED_File , PREFile , DATFile ,
+                   percentage , updown_flag , Engine    , MLRBinary )
 
 
 #   print('all done')
@@ -10,6 +10,9 @@ experimental data, plus the R2 value from MLR on the shuffled data.
 To be run as:
    python run_yrand.py -m/--matrix  myfile.matrix  -n/ncycles 100
 
+Completed cycles are saved in myfile.yrand_ckpt while running. After a crash,
+run again with -r/--resume to skip the cycles already done.
+
 Input:
    MatrixFile : = myfile.matrix      Matrix with the dataset to be learned.
    ncycles    : = integer            Runtime parameter with number of 
@@ -24,6 +27,7 @@ Output:
 --------------------------------------------------------------------------- """
 
 import argparse
+import functools
 import shutil
 import sys
 import os
@@ -33,6 +37,12 @@ from scipy import stats
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from Utilities.set_variables import *
 from Utilities.matrix_operation import *
+from Utilities.mlr_engine import *
+from Utilities.mlr_server import *
+from Utilities.parallel import *
+from Utilities.checkpoint import *
+from Utilities.profiling import *
+from Utilities.scratch import *
 
 
 # ---------------------
@@ -53,52 +63,41 @@ def GetFiles():
     parser = argparse.ArgumentParser()
     parser.add_argument("-m", "--matrix",  help = "Missing Matrix file") 
     parser.add_argument("-n", "--ncycles", help = "Missing number of shuffle cycles")
+    parser.add_argument("-e", "--engine", default = "fortran", help = "MLR engine: fortran (MLR.x) or numpy")
+    parser.add_argument("-r", "--resume", action = "store_true", help = "Skip cycles saved in the checkpoint file")
 
     args = parser.parse_args()
 
     if (not args.matrix) or (not args.ncycles) :   
-       print('Usage:  run_yrand.py -m/--matrix  input.matrix  -n/ncycles No. of cycles (integer)')
+       print('Usage:  run_yrand.py -m/--matrix  input.matrix  -n/ncycles No. of cycles (integer)  -e/--engine fortran/numpy  -r/--resume')
+       exit()
+
+    if (args.engine != 'fortran') and (args.engine != 'numpy'):
+       print(' Error:  -e/--engine flag must be fortran/numpy')
        exit()
 
 
     MatrixFile     = args.matrix
     no_of_shuffles = int(args.ncycles)
 
-    TempFile  = "tmp.matrix"
+    TempFile  = MatrixFile.replace("matrix", "tmp")
     YrandFile = MatrixFile.replace("matrix", "yrand_dat")
     YR2File   = MatrixFile.replace("matrix", "yrand_yr2")
+    CheckFile = MatrixFile.replace("matrix", "yrand_ckpt")
+    Engine    = args.engine
+    resume    = args.resume
 
-    return MatrixFile, TempFile, YrandFile, YR2File, no_of_shuffles
+    return MatrixFile, TempFile, YrandFile, YR2File, CheckFile, no_of_shuffles, Engine, resume
 # --- End of GetFiles --------------------------------------
 
-def main():
-    
-  # get input and output files
-
-    MatrixFile, TempFile, YrandFile, YR2File, no_of_shuffles = GetFiles()
-    MLRBinary, PYTHONHOME = GetVariables()
-
-
-  # call read_matrix to read matrix_file
-
-    title             , print_flag             , normalization_flag   , \
-    shift_flag        , skipped_systems        , no_of_systems        , \
-    no_of_electronics , no_of_sterics          , no_of_buried_volumes , \
-    system_tags       , experimental_tag       , experimental_data    , \
-    electronic_tags   , electronic_descriptors , radius_proximal      , \
-    radius_distal     , buried_volumes         = read_matrix(MatrixFile) 
+@profiled("matrix assembly")
+def shuffle_systems(no_of_shuffles, no_of_systems):
 
+  # returns the indices of the shuffled systems, one row per shuffle cycle.
+  # Row 0 is the unshuffled dataset.
 
-  # initialize arrays
-
-    indices               = np.arange(no_of_systems, dtype=int)
-    shuffled_indices      = np.zeros ( (no_of_shuffles+1, no_of_systems), dtype=int)
-    shuffled_experimental = np.zeros (no_of_systems)
-    r2_values             = np.zeros (no_of_shuffles + 1)
-    pearson_values        = np.zeros (no_of_shuffles + 1)
-
-
-  # set indices to shuffle experimental data - start with unshuffled
+    indices          = np.arange(no_of_systems, dtype=int)
+    shuffled_indices = np.zeros ( (no_of_shuffles+1, no_of_systems), dtype=int)
 
     shuffled_indices[0][:] = indices
 
@@ -106,49 +105,31 @@ def main():
     for s in range(1, no_of_shuffles+1):
         np.random.shuffle(indices)
         shuffled_indices[s][:] = indices
-      
-      
-  # indices of all shuffles generated, run MLR on each of them.
-  # first reorder experimental data according to shuffled_indices in cycle.
-  # then calculate pearson between shuffled and unshuffled experimental data.
-
-    for s in range (0, no_of_shuffles+1):
-        for i in range (0,no_of_systems):
-            shuffled_experimental[i] = experimental_data[shuffled_indices[s][i]] 
-        pearson_values[s] = stats.pearsonr(experimental_data, shuffled_experimental)[0]
-
-
-      # call write_matrix to write matrix_file for shuffle cycle 
-      # run MLR code and extract data
 
+    return (shuffled_indices)
 
-      # call write_matrix to write matrix_file for loo calculation
-
-        write_matrix(TempFile              , title             , print_flag             ,
-                     normalization_flag    , shift_flag        , skipped_systems        ,
-                     no_of_systems         , no_of_electronics , no_of_sterics          ,
-                     no_of_buried_volumes  , system_tags       , experimental_tag       ,
-                     shuffled_experimental , electronic_tags   , electronic_descriptors ,
-                     radius_proximal       , radius_distal     , buried_volumes         )
-
-        
-        run = MLRBinary + " " + TempFile + " > temp.out"
-        os.system(run)
+# ---------------------
 
+@profiled("analysis")
+def analysis_yrand(YrandFile         , YR2File          , no_of_shuffles , no_of_systems ,
+                   experimental_data , shuffled_indices , r2_values      ):
 
-      # get R2 value for this shuffle 
+  # calculates the pearson correlation coefficient between shuffled and unshuffled 
+  # experimental data, and writes it out together with R2 of all shuffle cycles.
+  # Writes max and average R2 of the shuffled cycles in YR2File.
 
-        with open('temp.out', "r") as f:
-             lines = f.readlines()
-             for line in lines:
-                 if ("Max R2" in line) :
-                    r2_values[s] = float(line.split()[2])
-        os.system('rm temp.out')
-        os.system('rm tmp.matrix')
+  # Input:
+    # YrandFile        := file with indices, pearson and R2 of every shuffle cycle
+    # YR2File          := file with Y2R prediction quality score
+    # shuffled_indices := indices of the shuffled systems, row 0 unshuffled
+    # r2_values        := R2 of every shuffle cycle
+  # ---------------------
 
+    pearson_values = np.zeros (no_of_shuffles + 1)
+    for s in range (0, no_of_shuffles+1):
+        pearson_values[s] = stats.pearsonr(experimental_data, 
+                                           np.asarray(experimental_data)[shuffled_indices[s]])[0]
 
-  # all shuffle cycles completed, start analysis
-    
     with open(YrandFile, "w") as f:
          f.write("{}".format("1. Indeces of shuffled systems.  ")
                 +"{}".format("2. Pearson correlation coefficient.  ")
@@ -176,6 +157,107 @@ def main():
                 +"{:6.3f}".format(r2_std/r2_values[0]) + '\n')
 
 
+    return()
+
+# ---------------------
+
+def run_shuffle_cycle(s, TempFile, MLRBinary, skipped_systems, shuffled_indices):
+
+  # runs MLR.x on the matrix with experimental data shuffled as in cycle s,
+  # and returns R2 as written in the Max R2 line. The matrix in TempFile is
+  # kept in memory by MLR.x in server mode, and only the shuffle is sent.
+
+    with span("cycle", cycle = s):
+         results = run_job(get_server(MLRBinary, TempFile), skipped_systems,
+                           exp_rows=shuffled_indices[s])
+
+    return float(results[0])
+
+# ---------------------
+
+def solve_shuffles(shuffles, matrix, shuffled_indices):
+
+  # in-memory engine: factorizes the grid once and solves all shuffles of the list
+  # at once, takes R2 as written by MLR.x in the Max R2 line
+
+    title             , print_flag             , normalization_flag   , \
+    shift_flag        , skipped_systems        , no_of_systems        , \
+    no_of_electronics , no_of_sterics          , no_of_buried_volumes , \
+    system_tags       , experimental_tag       , experimental_data    , \
+    electronic_tags   , electronic_descriptors , radius_proximal      , \
+    radius_distal     , buried_volumes         = matrix
+
+    with span("cycle", "cycles", first = shuffles[0], no_of_cycles = len(shuffles)):
+         r2_shuffles, _ = run_mlr_shuffles(normalization_flag     , shift_flag      , skipped_systems ,
+                                           no_of_systems          , no_of_sterics   ,
+                                           np.asarray(experimental_data)[shuffled_indices[shuffles]] ,
+                                           electronic_descriptors , radius_proximal , radius_distal   ,
+                                           buried_volumes         )
+
+    return list(round_decimals(r2_shuffles, 4))
+
+# ---------------------
+
+def main():
+    
+  # get input and output files
+
+    (MatrixFile, TempFile, YrandFile, YR2File, CheckFile, no_of_shuffles,
+     Engine, resume) = GetFiles()
+    MLRBinary, PYTHONHOME = GetVariables()
+
+
+  # call read_matrix to read matrix_file
+
+    with span("matrix read"):
+         matrix = read_matrix(MatrixFile)
+
+    title             , print_flag             , normalization_flag   , \
+    shift_flag        , skipped_systems        , no_of_systems        , \
+    no_of_electronics , no_of_sterics          , no_of_buried_volumes , \
+    system_tags       , experimental_tag       , experimental_data    , \
+    electronic_tags   , electronic_descriptors , radius_proximal      , \
+    radius_distal     , buried_volumes         = matrix
+
+
+  # set indices to shuffle experimental data - start with unshuffled
+
+    shuffled_indices = shuffle_systems(no_of_shuffles, no_of_systems)
+      
+      
+  # indices of all shuffles generated, run MLR on each of them.
+  # MLR.x: the matrix is written once in a scratch file and kept in memory by
+  # MLR.x in server mode, each cycle only sends its shuffle.
+  # cycles are run in chunks, and R2 of completed cycles are saved in CheckFile
+  # after each chunk.
+
+    with scratch_file(TempFile) as ScratchFile:
+         if Engine == "numpy":
+            solve_cycles = functools.partial(solve_shuffles, matrix=matrix,
+                                             shuffled_indices=shuffled_indices)
+         else:
+            with span("matrix write"):
+                 write_matrix(ScratchFile, *matrix)
+            solve_cycles = functools.partial(map_cycles,
+                                             functools.partial(run_shuffle_cycle, TempFile=ScratchFile,
+                                                               MLRBinary=MLRBinary,
+                                                               skipped_systems=skipped_systems,
+                                                               shuffled_indices=shuffled_indices))
+
+         key       = checkpoint_key("y-randomization", matrix, no_of_shuffles, Engine)
+         r2_values = np.array(run_checkpointed(solve_cycles, no_of_shuffles+1, CheckFile, key, resume))
+
+         if Engine == "fortran":
+            stop_servers()
+
+
+  # all shuffle cycles completed, start analysis
+
+    analysis_yrand(YrandFile         , YR2File          , no_of_shuffles , no_of_systems ,
+                   experimental_data , shuffled_indices , r2_values      )
+
+    remove_checkpoint(CheckFile)
+
     return()
 # --- End of main run_yrand.py -------------------------------
 
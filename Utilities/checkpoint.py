@@ -0,0 +1,135 @@
+#!/usr/bin/env python3 -B
+
+""" ---------------------------------------------------------------------------
+
+Checkpoints of long runs made of independent cycles, i.e. bootstrap,
+y-randomization and optimization cycles. Cycles are run in chunks, and the
+results of all completed cycles are saved in a checkpoint file after each
+chunk. A run killed before the end can be restarted with resume, skipping
+the cycles already in the checkpoint file. Final files are the same as
+those of a run never stopped.
+
+The checkpoint file stores a key of the run, hashing the data and the
+parameters of the test. A checkpoint with a different key, i.e. left by a
+run on another matrix or with other parameters, is ignored.
+
+To be used as:
+   from Utilities.checkpoint import *
+
+   key     = checkpoint_key("bootstrap", matrix, no_of_bootstrap, percentage, Engine)
+   results = run_checkpointed(solve_cycles, no_of_cycles, CheckFile, key, resume)
+   ... write final files ...
+   remove_checkpoint(CheckFile)
+
+solve_cycles gets a list of cycle numbers, and returns the list of their
+results in the same order.
+
+@author: Zhen Cao, Luigi Cavallo
+--------------------------------------------------------------------------- """
+
+import hashlib
+import os
+import pickle
+
+
+# No of cycles run between two checkpoints
+
+CHECKPOINT_CYCLES = 50
+
+
+# ---------------------
+
+def checkpoint_key(*values):
+
+  # returns the key of a run, sha256 of the data and parameters in values
+
+    return hashlib.sha256(pickle.dumps(values)).hexdigest()
+
+
+# ---------------------
+
+def load_checkpoint(CheckFile, key):
+
+  # returns the dictionary {cycle: result} of the cycles saved in CheckFile,
+  # empty if there is no checkpoint of this run
+
+    if not os.path.exists(CheckFile):
+       return {}
+
+    try:
+       with open(CheckFile, "rb") as f:
+            checkpoint = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+       print(' Checkpoint ' + CheckFile + ' is not readable, starting from the first cycle')
+       return {}
+
+    if checkpoint["key"] != key:
+       print(' Checkpoint ' + CheckFile + ' is from another run, starting from the first cycle')
+       return {}
+
+    return checkpoint["results"]
+
+
+# ---------------------
+
+def save_checkpoint(CheckFile, key, results):
+
+  # saves the results of the completed cycles in CheckFile. The file is written
+  # under a temporary name and renamed, so that a run killed while saving
+  # leaves the previous checkpoint untouched.
+
+    TmpFile = CheckFile + ".tmp"
+
+    with open(TmpFile, "wb") as f:
+         pickle.dump({"key": key, "results": results}, f)
+    os.replace(TmpFile, CheckFile)
+
+    return()
+
+
+# ---------------------
+
+def remove_checkpoint(CheckFile):
+
+  # removes the checkpoint once the final files of the run are written
+
+    if os.path.exists(CheckFile):
+       os.remove(CheckFile)
+
+    return()
+
+
+# ---------------------
+
+def run_checkpointed(solve_cycles, no_of_cycles, CheckFile, key, resume=False,
+                     chunk_size=CHECKPOINT_CYCLES):
+
+  # runs cycles 0..no_of_cycles-1 in chunks of chunk_size cycles, saving a
+  # checkpoint after each chunk
+
+  # Input:
+    # solve_cycles := function of a list of cycles, returning their results
+    # no_of_cycles := No of cycles
+    # CheckFile    := checkpoint file
+    # key          := key of the run, from checkpoint_key
+    # resume       := if True, cycles saved in CheckFile are not run again
+    # chunk_size   := No of cycles between two checkpoints
+
+  # Output:
+    # results      := list with the result of each cycle, in cycle order
+  # ---------------------
+
+    results = {}
+    if resume:
+       results = load_checkpoint(CheckFile, key)
+       if results:
+          print(' Resuming from ' + CheckFile + ': ' + str(len(results)) + ' cycles done')
+
+    remaining = [c for c in range(no_of_cycles) if c not in results]
+
+    for start in range(0, len(remaining), chunk_size):
+        chunk = remaining[start:start+chunk_size]
+        results.update(zip(chunk, solve_cycles(chunk)))
+        save_checkpoint(CheckFile, key, results)
+
+    return [results[c] for c in range(no_of_cycles)]
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3 -B
+
+""" ---------------------------------------------------------------------------
+
+On-disk cache of MLR fits of the in-memory engine. A fit is stored under a
+key hashing the numeric contents of the matrix, the skipped systems,
+NormalizeFlag and IShift, so that the same fit is computed only once, i.e.
+when mlr.py and prediction.py fit the same NM- matrix, or when runtests.py
+is run again on the same dataset.
+
+Each fit is a .npz file in the cache directory with R2, best grid point,
+radii, coefficients, fitted and experimental values, and the averages used
+in the normalization. When the cache grows over its size limit, least
+recently used fits are removed.
+
+The cache directory and its size in Mb are set in set_variables.py, and can
+be changed with the environment variables
+   COBRA_CACHE_DIR   := cache directory
+   COBRA_CACHE_SIZE  := max size of the cache in Mb
+   COBRA_NO_CACHE    := if set, fits are neither read from nor written to the cache
+
+To be used as:
+   from Utilities.fit_cache import *
+
+   key     = fit_key(normalization_flag, shift_flag, skipped_systems, no_of_systems,
+                     no_of_sterics, experimental_data, electronic_descriptors,
+                     radius_proximal, radius_distal, buried_volumes)
+   results = load_fit(key)
+   if results is None:
+      results = run_mlr(...)
+      store_fit(key, results)
+
+@author: Zhen Cao, Luigi Cavallo
+--------------------------------------------------------------------------- """
+
+import hashlib
+import os
+import numpy as np
+
+from Utilities.set_variables import GetCacheVariables
+
+
+# names of the run_mlr results, in the order they are returned
+
+FIT_FIELDS = ["R2", "point", "rv", "rr", "coefficients", "fitted", "experiments",
+              "exp_av", "exp_sd"]
+
+
+# ---------------------
+
+def cache_directory():
+
+  # returns the cache directory, or None if the cache is switched off
+
+    if os.environ.get("COBRA_NO_CACHE"):
+       return None
+
+    CACHEHOME, CACHESIZE = GetCacheVariables()
+
+    return os.environ.get("COBRA_CACHE_DIR", CACHEHOME)
+
+
+# ---------------------
+
+def fit_key(normalization_flag , shift_flag             , skipped_systems ,
+            no_of_systems      , no_of_sterics          , experimental_data ,
+            electronic_descriptors , radius_proximal    , radius_distal ,
+            buried_volumes     ):
+
+  # returns the key of a fit: sha256 of flags, skipped systems and numeric data.
+  # Arguments are those of run_mlr. Tags and title do not enter the key.
+
+    skipped = np.zeros(no_of_systems, dtype=np.int8)
+    skipped[[i-1 for i in skipped_systems[1:1+skipped_systems[0]]]] = 1
+
+  # the first bytes give the version of the cache, changed when results of
+  # run_mlr change, so that fits stored by previous versions are not used
+
+    key = hashlib.sha256()
+    key.update(b"cobra-fit-2")
+    key.update(np.array([normalization_flag, shift_flag, no_of_systems, no_of_sterics],
+                        dtype=np.int64).tobytes())
+    key.update(skipped.tobytes())
+
+    for values in [experimental_data, electronic_descriptors, radius_proximal,
+                   radius_distal, buried_volumes]:
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        key.update(np.array(values.shape, dtype=np.int64).tobytes())
+        key.update(values.tobytes())
+
+    return key.hexdigest()
+
+
+# ---------------------
+
+def load_fit(key):
+
+  # returns the results of run_mlr stored under key, or None if not in the cache.
+  # The file is touched, to mark it as recently used.
+
+    directory = cache_directory()
+    if directory is None:
+       return None
+
+    FitFile = os.path.join(directory, key + ".npz")
+
+    try:
+       with np.load(FitFile) as data:
+            results = tuple(data[field][()] for field in FIT_FIELDS)
+       os.utime(FitFile)
+    except (OSError, KeyError, ValueError):
+       return None
+
+    return results
+
+
+# ---------------------
+
+def store_fit(key, results):
+
+  # stores the results of run_mlr under key, then trims the cache to its size.
+  # The file is written under a temporary name and renamed, so that tests
+  # running at the same time never read a partial file.
+
+    directory = cache_directory()
+    if directory is None:
+       return()
+
+    os.makedirs(directory, exist_ok=True)
+
+    FitFile = os.path.join(directory, key + ".npz")
+    TmpFile = os.path.join(directory, key + "." + str(os.getpid()) + ".tmp.npz")
+
+    np.savez(TmpFile, **dict(zip(FIT_FIELDS, results)))
+    os.replace(TmpFile, FitFile)
+
+    trim_cache(directory)
+
+    return()
+
+
+# ---------------------
+
+def trim_cache(directory):
+
+  # removes the least recently used fits until the cache is within its size
+
+    CACHEHOME, CACHESIZE = GetCacheVariables()
+    max_size = float(os.environ.get("COBRA_CACHE_SIZE", CACHESIZE)) * 1024 * 1024
+
+    fits = []
+    for name in os.listdir(directory):
+        if name.endswith(".npz") and not name.endswith(".tmp.npz"):
+           try:
+              info = os.stat(os.path.join(directory, name))
+           except OSError:
+              continue
+           fits.append((info.st_mtime, info.st_size, name))
+
+    size = sum(f[1] for f in fits)
+    for mtime, fit_size, name in sorted(fits):
+        if size <= max_size:
+           break
+        try:
+           os.remove(os.path.join(directory, name))
+        except OSError:
+           pass
+        size -= fit_size
+
+    return()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3 -B
+
+""" ---------------------------------------------------------------------------
+
+This script converts a matrix file from text to binary format, or back.
+The input format is recognized from the content of the file, the output
+is written in binary format with -b/--binary, in text format otherwise.
+
+Binary matrix files store all values as float64 blocks, mapped in memory
+by read_matrix without parsing. They can be used by all tests run with
+the numpy engine, not by Fortran/MLR.x.
+
+To be run as:
+   python matrix_convert.py -m/--matrix  myfile.matrix  -o/output binary.matrix -b/--binary
+   python matrix_convert.py -m/--matrix  binary.matrix  -o/output myfile.matrix
+
+Input:
+   MatrixFile    : = myfile.matrix     Matrix to be converted, text or binary.
+
+Output:
+   OutMatrixFile : = binary.matrix     Converted matrix file.
+
+@author: Zhen Cao, Luigi Cavallo
+--------------------------------------------------------------------------- """
+
+import argparse
+import os
+from matrix_operation import *
+
+# ---------------------
+
+
+def GetFiles():
+
+    """ -------------------------------------------------------------------
+    Handles input/output and excutable files
+
+
+    ------------------------------------------------------------------- """
+
+  # get the input and output file names
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-m", "--matrix",  help = "Missing input Matrix file")
+    parser.add_argument("-o", "--output",  help = "Missing output Matrix file")
+    parser.add_argument("-b", "--binary",  action = "store_true", help = "Write the output matrix in binary format")
+
+    args = parser.parse_args()
+
+    if (not args.matrix) or (not args.output) :
+       print(' Usage:  matrix_convert.py -m/--matrix input.matrix  -o/output output.matrix  -b/--binary')
+       exit()
+
+    if os.path.abspath(args.matrix) == os.path.abspath(args.output):
+       print(' Error:  input and output matrix files must be different')
+       exit()
+
+
+    MatrixFile     = args.matrix
+    OutMatrixFile  = args.output
+    Binary         = args.binary
+
+
+    return MatrixFile, OutMatrixFile, Binary
+# --- End of GetFiles --------------------------------------
+
+def main():
+
+  # get input and output files
+
+    MatrixFile, OutMatrixFile, Binary = GetFiles()
+
+
+  # read the matrix in any format, and write it in the requested one
+
+    write_matrix(OutMatrixFile, *read_matrix(MatrixFile), binary = Binary)
+
+
+    return()
+# --- End of main matrix_convert.py -------------------------------
+
+
+#==============================================================================
+if __name__ == '__main__':
+     main()
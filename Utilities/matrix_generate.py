@@ -0,0 +1,197 @@
+#!/usr/bin/env python3 -B
+
+""" ---------------------------------------------------------------------------
+
+This script generates a synthetic matrix, for scaling tests and benchmarks on
+datasets larger than the Examples. Systems get random electronic descriptors
+and buried volumes varying smoothly over the steric grid. Experimental data
+are given by a known linear model at one grid point, plus gaussian noise.
+The model is written to a JSON file, e.g. to check the fit of MLR.x.
+
+The steric grid is the one of the Examples, r from 3.0 and Dr from 0.1 by
+steps of 0.1, 50 Dr values per r. With 2550 rows, r goes up to 8.0.
+The same seed gives the same matrix.
+
+To be run as:
+   python matrix_generate.py -o/--output synthetic.matrix -s/--systems 1000 -l/--electronics 2
+                             -t/--sterics 2 -r/--rows 2550 -n/--noise 0.1 -d/--seed 0 -b/--binary
+
+Input:
+   systems      : = int       No of systems
+   electronics  : = int       No of electronic descriptors
+   sterics      : = 1/2       No of steric descriptors
+   rows         : = int       No of buried volume rows, i.e. points of the steric grid
+   noise        : = float     std of the noise, as fraction of std of the model values
+   seed         : = int       seed of the random number generator
+
+Output:
+   MatrixFile   : = synthetic.matrix    Matrix in text format, binary with -b/--binary
+   TruthFile    : = synthetic.truth     JSON file with the model: grid point, radii,
+                                        coefficients and std of the noise
+
+@author: Zhen Cao, Luigi Cavallo
+--------------------------------------------------------------------------- """
+
+import argparse
+import json
+import numpy as np
+from matrix_operation import *
+
+# ---------------------
+
+
+def GetFiles():
+
+    """ -------------------------------------------------------------------
+    Handles output files and size of the synthetic matrix
+
+
+    ------------------------------------------------------------------- """
+
+  # get the output file name and the size of the matrix
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output",      help = "Missing output Matrix file")
+    parser.add_argument("-s", "--systems",     default = "100",  help = "No of systems")
+    parser.add_argument("-l", "--electronics", default = "2",    help = "No of electronic descriptors")
+    parser.add_argument("-t", "--sterics",     default = "2",    help = "No of steric descriptors, 1 or 2")
+    parser.add_argument("-r", "--rows",        default = "2550", help = "No of buried volume rows")
+    parser.add_argument("-n", "--noise",       default = "0.1",  help = "std of the noise, fraction of std of the model values")
+    parser.add_argument("-d", "--seed",        default = "0",    help = "Seed of the random number generator")
+    parser.add_argument("-b", "--binary",      action = "store_true", help = "Write the matrix in binary format")
+
+    args = parser.parse_args()
+
+    if (not args.output) :
+       print(' Usage:  matrix_generate.py -o/--output synthetic.matrix  -s/--systems 100  -l/--electronics 2')
+       print('                            -t/--sterics 2  -r/--rows 2550  -n/--noise 0.1  -d/--seed 0  -b/--binary')
+       exit()
+
+    if (args.sterics != '1') and (args.sterics != '2'):
+       print(' Error:  -t/--sterics flag must be 1 or 2')
+       exit()
+
+    if (not args.systems.isdigit()) or (not args.electronics.isdigit()) \
+    or (not args.rows.isdigit()) or (not args.seed.isdigit()):
+       print(' Error:  -s/--systems, -l/--electronics, -r/--rows and -d/--seed flags must be integers')
+       exit()
+
+    if (int(args.systems) < int(args.electronics) + int(args.sterics) + 2) or (int(args.rows) < 1):
+       print(' Error:  more systems than coefficients and at least one row are needed')
+       exit()
+
+
+    MatrixFile = args.output
+    TruthFile  = MatrixFile.replace(".matrix", "") + ".truth"
+
+
+    return (MatrixFile, TruthFile, int(args.systems), int(args.electronics), int(args.sterics),
+            int(args.rows), float(args.noise), int(args.seed), args.binary)
+# --- End of GetFiles --------------------------------------
+
+
+def generate_matrix(no_of_systems, no_of_electronics, no_of_sterics, no_of_buried_volumes,
+                    noise=0.1, seed=0):
+
+  # builds the synthetic matrix and its model
+
+  # Input:
+    # no_of_systems        := No of systems
+    # no_of_electronics    := No of electronic descriptors
+    # no_of_sterics        := No of steric descriptors, 1 or 2
+    # no_of_buried_volumes := No of rows of the steric grid
+    # noise                := std of the noise, fraction of std of the model values
+    # seed                 := seed of the random number generator
+
+  # Output:
+    # matrix               := tuple with the matrix, as returned by read_matrix
+    # truth                := dictionary with the model
+  # ---------------------
+
+    rng = np.random.default_rng(seed)
+
+
+  # steric grid, as in the Examples
+
+    points          = np.arange(no_of_buried_volumes)
+    radius_proximal = np.round(3.0 + 0.1*(points // 50), 2)
+    radius_distal   = np.round(0.1 + 0.1*(points %  50), 2)
+
+
+  # electronic descriptors, each one with its own average and spread
+
+    averages = rng.uniform(-10.0, 10.0, no_of_electronics)
+    spreads  = rng.uniform(0.5, 2.0, no_of_electronics)
+    electronic_descriptors = averages[:, None] + spreads[:, None] * rng.standard_normal((no_of_electronics, no_of_systems))
+
+
+  # buried volumes, linear in r and Dr with slopes of each system, in 0-99
+  # so that they fit in the fields of write_matrix
+
+    base      = rng.uniform(25.0, 55.0, (no_of_systems, no_of_sterics))
+    slope_rv  = rng.normal(0.0, 3.0, (no_of_systems, no_of_sterics))
+    slope_rr  = rng.normal(0.0, 2.0, (no_of_systems, no_of_sterics))
+    volumes   = ( base[None]
+                + slope_rv[None] * (radius_proximal - 5.5)[:, None, None]
+                + slope_rr[None] * (radius_distal   - 2.5)[:, None, None] )
+    volumes   = np.round(np.clip(volumes, 0.0, 99.0), 3)
+    buried_volumes = volumes.reshape((no_of_buried_volumes, no_of_systems*no_of_sterics))
+
+
+  # model: intercept, electronic and steric coefficients at a random grid point
+
+    point        = int(rng.integers(no_of_buried_volumes))
+    intercept    = float(rng.normal(0.0, 1.0))
+    coef_ele     = rng.normal(0.0, 1.0, no_of_electronics)
+    coef_ste     = rng.normal(0.0, 0.1, no_of_sterics)
+
+    model_values = intercept + coef_ele @ electronic_descriptors + volumes[point] @ coef_ste
+    noise_sd     = noise * np.std(model_values)
+    experimental_data = model_values + noise_sd * rng.standard_normal(no_of_systems)
+
+    matrix = ("Synthetic matrix, seed " + str(seed)     , 0                     , 3                    ,
+              1                                          , np.array([0])         , no_of_systems        ,
+              no_of_electronics                          , no_of_sterics         , no_of_buried_volumes ,
+              ["Sys" + str(i+1) for i in range(no_of_systems)] , "Exp"           , experimental_data    ,
+              ["Desc" + str(e+1) for e in range(no_of_electronics)]               , electronic_descriptors ,
+              radius_proximal                            , radius_distal         , buried_volumes       )
+
+    truth = {"seed"                 : seed,
+             "point"                : point + 1,
+             "radius_proximal"      : float(radius_proximal[point]),
+             "radius_distal"        : float(radius_distal[point]),
+             "intercept"            : intercept,
+             "electronic_coefficients": coef_ele.tolist(),
+             "steric_coefficients"  : coef_ste.tolist(),
+             "noise_sd"             : float(noise_sd)}
+
+    return matrix, truth
+# --- End of generate_matrix --------------------------------------
+
+
+def main():
+
+  # get output files and size of the matrix
+
+    (MatrixFile, TruthFile, no_of_systems, no_of_electronics, no_of_sterics,
+     no_of_buried_volumes, noise, seed, Binary) = GetFiles()
+
+
+  # build the matrix and write it with its model
+
+    matrix, truth = generate_matrix(no_of_systems, no_of_electronics, no_of_sterics,
+                                    no_of_buried_volumes, noise, seed)
+
+    write_matrix(MatrixFile, *matrix, binary = Binary)
+
+    with open(TruthFile, "w") as f:
+         json.dump(truth, f, indent=1)
+
+
+    return()
+# --- End of main matrix_generate.py -------------------------------
+
+
+#==============================================================================
+if __name__ == '__main__':
+     main()
@@ -52,21 +52,14 @@ def GetFiles():
     return MatrixFile, NormMatrixFile
 # --- End of GetFiles --------------------------------------
 
-def main():
-    
-  # get input and output files
-
-    MatrixFile, NormMatrixFile = GetFiles()
+def normalize_matrix(no_of_systems        , no_of_electronics , no_of_sterics          ,
+                     no_of_buried_volumes , experimental_data , electronic_descriptors ,
+                     buried_volumes       ):
 
-
-  # call read_matrix to read matrix_file
-
-    title             , print_flag             , normalization_flag   , \
-    shift_flag        , skipped_systems        , no_of_systems        , \
-    no_of_electronics , no_of_sterics          , no_of_buried_volumes , \
-    system_tags       , experimental_tag       , experimental_data    , \
-    electronic_tags   , electronic_descriptors , radius_proximal      , \
-    radius_distal     , buried_volumes         = read_matrix(MatrixFile) 
+# Normalizes experimental_data, electronic_descriptors and buried_volumes, centering
+# by the mean and dividing by the standard deviation of each row.
+# Proximal and distal volumes are normalized separately.
+# Returns the normalized experimental_data, electronic_descriptors and buried_volumes
 
 
   # start normalizing experimental_data and electronic_descriptors
@@ -119,16 +112,52 @@ def main():
            NM_vd = np.divide(np.subtract(vd, mean), stdv)
 
            np.put(NM_buried_volumes[v], odd_indices,  NM_vd)
-        
 
-  # all done, call write_matrix to write normalized matrix_file 
 
-    write_matrix(NormMatrixFile            , title             , print_flag                ,
-                     normalization_flag    , shift_flag        , skipped_systems           ,
-                     no_of_systems         , no_of_electronics , no_of_sterics             ,
-                     no_of_buried_volumes  , system_tags       , experimental_tag          ,
-                     NM_experimental_data  , electronic_tags   , NM_electronic_descriptors ,
-                     radius_proximal       , radius_distal     , NM_buried_volumes         )
+    return (NM_experimental_data, NM_electronic_descriptors, NM_buried_volumes)
+
+# --- End of function normalize_matrix ---------------------------------
+
+def main():
+    
+  # get input and output files
+
+    MatrixFile, NormMatrixFile = GetFiles()
+
+
+  # call read_matrix to read matrix_file
+
+    title             , print_flag             , normalization_flag   , \
+    shift_flag        , skipped_systems        , no_of_systems        , \
+    no_of_electronics , no_of_sterics          , no_of_buried_volumes , \
+    system_tags       , experimental_tag       , experimental_data    , \
+    electronic_tags   , electronic_descriptors , radius_proximal      , \
+    radius_distal     , buried_volumes         = read_matrix(MatrixFile) 
+
+
+  # normalize experimental_data and all descriptors
+
+    NM_experimental_data, NM_electronic_descriptors, NM_buried_volumes = normalize_matrix(
+        no_of_systems     , no_of_electronics      , no_of_sterics  ,
+        no_of_buried_volumes , experimental_data   , electronic_descriptors ,
+        buried_volumes    )
+
+
+  # round normalized values to the formats of write_matrix, as read back from a
+  # text matrix, so that a binary matrix_file gives the same results of a text one
+
+    NM_matrix = round_matrix(title                 , print_flag        , normalization_flag        ,
+                             shift_flag            , skipped_systems   , no_of_systems             ,
+                             no_of_electronics     , no_of_sterics     , no_of_buried_volumes      ,
+                             system_tags           , experimental_tag  , NM_experimental_data      ,
+                             electronic_tags       , NM_electronic_descriptors , radius_proximal   ,
+                             radius_distal         , NM_buried_volumes )
+
+
+  # all done, call write_matrix to write normalized matrix_file, in the same
+  # format of matrix_file
+
+    write_matrix(NormMatrixFile, *NM_matrix, binary = is_binary_matrix(MatrixFile))
 
 
     return()
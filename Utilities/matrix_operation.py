@@ -1,197 +1,362 @@
-import numpy as np
-
-def read_matrix(matrix_file):
-
-  # read the file and save it as a list of lines in variable "file_lines" 
-
-    file_      = open(matrix_file, "r")  
-    file_lines = ( file_.readlines() )  
-    file_.close()
-
-
-  # store variables
-
-    title                = str(file_lines[0].strip())
-    print_flag           = int(file_lines[1].strip())
-    normalization_flag   = int(file_lines[2].strip())
-    shift_flag           = int(file_lines[3].strip())
-    skipped_systems      = [int(i)   for i in file_lines[4].split()]
-    no_of_systems        = int(file_lines[5].strip())
-    no_of_electronics    = int(file_lines[6].strip())
-    no_of_sterics        = int(file_lines[7].strip())
-    no_of_buried_volumes = int(file_lines[8].strip())
-    system_tags          = [str(s)   for s in file_lines[9].split()]
-    experimental_tag     = str(file_lines[10].split()[0])
-    experimental_data    = [float(e) for e in file_lines[10].split()[1:]]
-
-
-  # define and store arrays 
-
-    electronic_tags        = []
-    electronic_descriptors = []
-    buried_volumes         = []
-    radius_proximal        = []
-    radius_distal          = []
-
-    for line in file_lines[11 : 11 + no_of_electronics]:
-        electronic_tags.append(line.split()[0])
-
-        for x in line.split()[1:]:
-            electronic_descriptors.append(float(x))
-
-
-    for line in file_lines[ 11 + no_of_electronics : 
-                            11 + no_of_electronics + no_of_buried_volumes]:
-        radius_proximal.append(float(line.split()[0]))
-        radius_distal.append(float(line.split()[1]))
-
-        for x in line.split()[2:]:
-            buried_volumes.append(float(x))
-
-
-  # convert to numpy arrays
-
-    skipped_systems         = np.array(skipped_systems)       
-    experimental_data       = np.array(experimental_data)       
-    electronic_descriptors  = np.array(electronic_descriptors)  
-    radius_proximal         = np.array(radius_proximal)         
-    radius_distal           = np.array(radius_distal)           
-    buried_volumes          = np.array(buried_volumes)           
-
-    
-  # reshape 1D arrays to 2D
-    
-    electronic_descriptors = electronic_descriptors.reshape((no_of_electronics, no_of_systems))
-    if no_of_sterics == 1:
-       buried_volumes = buried_volumes.reshape((no_of_buried_volumes, 1*no_of_systems))
-    else:
-       buried_volumes = buried_volumes.reshape((no_of_buried_volumes, 2*no_of_systems))
-
-
-  # all done - return values
-
-    return (title             , print_flag             , normalization_flag   ,
-            shift_flag        , skipped_systems        , no_of_systems        ,
-            no_of_electronics , no_of_sterics          , no_of_buried_volumes ,
-            system_tags       , experimental_tag       , experimental_data    , 
-            electronic_tags   , electronic_descriptors , radius_proximal      , 
-            radius_distal     , buried_volumes         )
-
-# --- End of function read_matrix ---------------------------------------------
-
-
-def write_matrix(matrix_file          , title             , print_flag             , 
-                 normalization_flag   , shift_flag        , skipped_systems        , 
-                 no_of_systems        , no_of_electronics , no_of_sterics          , 
-                 no_of_buried_volumes , system_tags       , experimental_tag       , 
-                 experimental_data    , electronic_tags   , electronic_descriptors , 
-                 radius_proximal      , radius_distal     , buried_volumes         ):
-
-
-  # write the matrix. Start opening the output file
-
-    with open(matrix_file, "w") as f: 
-         f.write( title                              + '\n'
-                + "{:8d}".format(print_flag)         + '\n'
-                + "{:8d}".format(normalization_flag) + '\n'
-                + "{:8d}".format(shift_flag)         + '\n')
-
-         for i in range(len(skipped_systems)) : 
-               f.write( "{:8d}".format(skipped_systems[i]) )
-         f.write( '\n')
-     
-         f.write( "{:8d}".format(no_of_systems)        + '\n' 
-                + "{:8d}".format(no_of_electronics)    + '\n' 
-                + "{:8d}".format(no_of_sterics)        + '\n' 
-                + "{:8d}".format(no_of_buried_volumes) + '\n')
-         
-         f.write('            ')
-         for i in range(no_of_systems) : 
-               f.write( "{:>14s}".format(system_tags[i]) )
-         f.write( '\n')
-     
-         f.write( "{:12s}".format(experimental_tag) )
-         for i in range(no_of_systems) : 
-               f.write( "{:14.5e}".format(experimental_data[i]) )
-         f.write( '\n')
-     
-         for r in range(no_of_electronics):
-               f.write( "{:12s}".format(electronic_tags[r]) )
-
-               for i in range(no_of_systems) : 
-                   f.write( "{:14.5e}".format(electronic_descriptors[r][i]) )
-               f.write( '\n')
-         
-         for r in range(no_of_buried_volumes):
-               f.write( "{:6.2f}".format(radius_proximal[r])  
-                      + "{:6.2f}".format(radius_distal[r]) )
-
-               if no_of_sterics == 1:
-                  for i in range(no_of_systems) : 
-                      f.write( "{:9.3f}".format(buried_volumes[r][i]) )
-               else:
-                  for i in range(no_of_systems) : 
-                      f.write( "{:9.3f}".format(buried_volumes[r][2*i])  
-                             + "{:7.3f}".format(buried_volumes[r][2*i+1]) )
-
-               f.write( '\n')
-
-
-    return()
-
-# --- End of function read_matrix ---------------------------------------------
-
-def reorder_matrix(title             , print_flag             , normalization_flag   ,  
-                   shift_flag        , skipped_systems        , no_of_systems        ,  
-                   no_of_electronics , no_of_sterics          , no_of_buried_volumes ,  
-                   system_tags       , experimental_tag       , experimental_data    ,  
-                   electronic_tags   , electronic_descriptors , radius_proximal      ,  
-                   radius_distal     , buried_volumes         , updown_flag          ):
-
-# Reorders systems by increasing experimental performance if updown_flag is UP
-# Reorders systems by decreasing experimental performance if updown_flag is DOWN
-# Returns the ordered system_tags, experimental_data, electronic_descriptors and buried_volumes
-
-
-  # defyning arrays to store reordered data
-
-    out_tag = []
-    out_exp = np.zeros(no_of_systems, dtype=float)
-    out_ele = np.zeros((no_of_electronics, no_of_systems), dtype=float)
-    out_vbu = np.zeros((no_of_buried_volumes, 2*no_of_systems), dtype=float)
-
-
-  # get indices of experimental_data according to updown_flag
-
-    out_indices = np.zeros(no_of_systems, dtype=int)
-    if updown_flag == "up"   : out_indices = np.argsort(+experimental_data)
-    if updown_flag == "down" : out_indices = np.argsort(-experimental_data)
-
-
-  # store data in temporary arrays according to order in out_indices array
-
-    for r in range(no_of_systems):
-        out_tag.append(system_tags[out_indices[r]])
-        out_exp[r] = experimental_data[out_indices[r]]
-
-        for e in range(no_of_electronics):
-            out_ele[e][r] = electronic_descriptors[e][out_indices[r]]
-
-        if no_of_sterics == 1:
-            for s in range(no_of_buried_volumes):
-                out_vbu[s][r] = buried_volumes[s][r]
-         
-        if no_of_sterics == 2:
-            for s in range(no_of_buried_volumes):
-                r1 = r*2
-                r2 = out_indices[r]*2
-                out_vbu[s][r1] = buried_volumes[s][r2]
-                out_vbu[s][r1+1] = buried_volumes[s][r2+1]
-
-
-  # all done, return the reordered data
-
-    return(out_tag, out_exp, out_ele, out_vbu)
-
-# --- End of function reorder_matrix ---------------------------------------------
-
+import json
+import numpy as np
+
+
+# Binary matrix files start with BINARY_MAGIC, followed by the length of a JSON
+# header with flags, counts and tags, and by the float64 blocks of experimental
+# data, electronic descriptors, radii and buried volumes. They are recognized by
+# read_matrix from their content, and written by write_matrix with binary=True.
+
+BINARY_MAGIC = b"COBRAMTX"
+
+
+def read_values(lines, no_of_columns):
+
+  # converts lines of blank separated values to a 2D array, one row per line
+
+    if len(lines) == 0:
+       return np.zeros((0, no_of_columns))
+
+    return np.loadtxt(lines, dtype=float, comments=None, ndmin=2)
+
+# --- End of function read_values ---------------------------------------------
+
+
+def read_matrix(matrix_file):
+
+  # binary matrix files are mapped in memory, without parsing
+
+    if is_binary_matrix(matrix_file):
+       return read_binary_matrix(matrix_file)
+
+
+  # read the file and save it as a list of lines in variable "file_lines" 
+
+    file_      = open(matrix_file, "r")  
+    file_lines = ( file_.readlines() )  
+    file_.close()
+
+
+  # store variables
+
+    title                = str(file_lines[0].strip())
+    print_flag           = int(file_lines[1].strip())
+    normalization_flag   = int(file_lines[2].strip())
+    shift_flag           = int(file_lines[3].strip())
+    skipped_systems      = [int(i)   for i in file_lines[4].split()]
+    no_of_systems        = int(file_lines[5].strip())
+    no_of_electronics    = int(file_lines[6].strip())
+    no_of_sterics        = int(file_lines[7].strip())
+    no_of_buried_volumes = int(file_lines[8].strip())
+    system_tags          = [str(s)   for s in file_lines[9].split()]
+    experimental_tag     = str(file_lines[10].split()[0])
+    experimental_data    = np.array(file_lines[10].split()[1:], dtype=float)
+
+
+  # convert all values of the descriptor and buried volume blocks at once
+
+    electronic_lines = file_lines[11 : 11 + no_of_electronics]
+    volume_lines     = file_lines[ 11 + no_of_electronics :
+                                   11 + no_of_electronics + no_of_buried_volumes]
+
+    electronic_tags        = [line.split()[0] for line in electronic_lines]
+    electronic_descriptors = read_values([line.split(None, 1)[1] for line in electronic_lines],
+                                         no_of_systems)
+
+    volumes         = read_values(volume_lines, 2 + no_of_sterics*no_of_systems)
+    radius_proximal = volumes[:, 0].copy()
+    radius_distal   = volumes[:, 1].copy()
+    buried_volumes  = np.ascontiguousarray(volumes[:, 2:])
+
+    skipped_systems = np.array(skipped_systems)
+
+    
+  # reshape arrays to [no_of_electronics][no_of_systems] and [no_of_buried_volumes][systems*sterics]
+    
+    electronic_descriptors = electronic_descriptors.reshape((no_of_electronics, no_of_systems))
+    if no_of_sterics == 1:
+       buried_volumes = buried_volumes.reshape((no_of_buried_volumes, 1*no_of_systems))
+    else:
+       buried_volumes = buried_volumes.reshape((no_of_buried_volumes, 2*no_of_systems))
+
+
+  # all done - return values
+
+    return (title             , print_flag             , normalization_flag   ,
+            shift_flag        , skipped_systems        , no_of_systems        ,
+            no_of_electronics , no_of_sterics          , no_of_buried_volumes ,
+            system_tags       , experimental_tag       , experimental_data    , 
+            electronic_tags   , electronic_descriptors , radius_proximal      , 
+            radius_distal     , buried_volumes         )
+
+# --- End of function read_matrix ---------------------------------------------
+
+
+def write_matrix(matrix_file          , title             , print_flag             , 
+                 normalization_flag   , shift_flag        , skipped_systems        , 
+                 no_of_systems        , no_of_electronics , no_of_sterics          , 
+                 no_of_buried_volumes , system_tags       , experimental_tag       , 
+                 experimental_data    , electronic_tags   , electronic_descriptors , 
+                 radius_proximal      , radius_distal     , buried_volumes         ,
+                 binary = False       ):
+
+
+  # binary matrix files are written as contiguous float64 blocks
+
+    if binary:
+       write_binary_matrix(matrix_file          , title             , print_flag             ,
+                           normalization_flag   , shift_flag        , skipped_systems        ,
+                           no_of_systems        , no_of_electronics , no_of_sterics          ,
+                           no_of_buried_volumes , system_tags       , experimental_tag       ,
+                           experimental_data    , electronic_tags   , electronic_descriptors ,
+                           radius_proximal      , radius_distal     , buried_volumes         )
+       return()
+
+
+  # build the matrix as a list of lines, each value line formatted by a single
+  # format string with one field per system, then write it at once
+
+    lines = []
+    lines.append( title                              + '\n'
+                + "{:8d}".format(print_flag)         + '\n'
+                + "{:8d}".format(normalization_flag) + '\n'
+                + "{:8d}".format(shift_flag)         + '\n')
+
+    lines.append( ("%8d" * len(skipped_systems)) % tuple(skipped_systems) + '\n')
+
+    lines.append( "{:8d}".format(no_of_systems)        + '\n'
+                + "{:8d}".format(no_of_electronics)    + '\n'
+                + "{:8d}".format(no_of_sterics)        + '\n'
+                + "{:8d}".format(no_of_buried_volumes) + '\n')
+
+    lines.append('            '
+                + "".join(["{:>14s}".format(system_tags[i]) for i in range(no_of_systems)]) + '\n')
+
+    electronic_format = "%14.5e" * no_of_systems
+
+    lines.append( "{:12s}".format(experimental_tag)
+                + electronic_format % tuple(np.asarray(experimental_data, dtype=float)[:no_of_systems].tolist())
+                + '\n')
+
+    for r in range(no_of_electronics):
+        lines.append( "{:12s}".format(electronic_tags[r])
+                    + electronic_format % tuple(np.asarray(electronic_descriptors[r], dtype=float)[:no_of_systems].tolist())
+                    + '\n')
+
+    if no_of_sterics == 1:
+       volume_format = "%9.3f" * no_of_systems
+       volume_width  = no_of_systems
+    else:
+       volume_format = "%9.3f%7.3f" * no_of_systems
+       volume_width  = 2*no_of_systems
+
+    for r in range(no_of_buried_volumes):
+        lines.append( "{:6.2f}".format(radius_proximal[r])
+                    + "{:6.2f}".format(radius_distal[r])
+                    + volume_format % tuple(np.asarray(buried_volumes[r], dtype=float)[:volume_width].tolist())
+                    + '\n')
+
+    with open(matrix_file, "w") as f: 
+         f.write("".join(lines))
+
+
+    return()
+
+# --- End of function read_matrix ---------------------------------------------
+
+def is_binary_matrix(matrix_file):
+
+  # True if matrix_file is a binary matrix file
+
+    with open(matrix_file, "rb") as f:
+         return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+# --- End of function is_binary_matrix ----------------------------------------
+
+def read_binary_matrix(matrix_file):
+
+# Reads a binary matrix file, returning the same values as read_matrix.
+# Arrays are copy-on-write views of the file mapped in memory with np.memmap,
+# so that data are read from disk only when used, and never written back.
+
+
+  # read the header
+
+    with open(matrix_file, "rb") as f:
+         f.read(len(BINARY_MAGIC))
+         header_length = int(np.frombuffer(f.read(8), dtype="<i8")[0])
+         header        = json.loads(f.read(header_length).decode("utf-8"))
+
+    no_of_systems        = header["no_of_systems"]
+    no_of_electronics    = header["no_of_electronics"]
+    no_of_sterics        = header["no_of_sterics"]
+    no_of_buried_volumes = header["no_of_buried_volumes"]
+    volumes_width        = no_of_systems if no_of_sterics == 1 else 2*no_of_systems
+
+
+  # map the float64 blocks, and take views of each of them
+
+    sizes  = [no_of_systems, no_of_electronics*no_of_systems, no_of_buried_volumes,
+              no_of_buried_volumes, no_of_buried_volumes*volumes_width]
+    data   = np.memmap(matrix_file, dtype="<f8", mode="c", shape=(sum(sizes),),
+                       offset=len(BINARY_MAGIC) + 8 + header_length)
+    blocks = np.split(data, np.cumsum(sizes)[:-1])
+
+    experimental_data      = blocks[0]
+    electronic_descriptors = blocks[1].reshape((no_of_electronics, no_of_systems))
+    radius_proximal        = blocks[2]
+    radius_distal          = blocks[3]
+    buried_volumes         = blocks[4].reshape((no_of_buried_volumes, volumes_width))
+
+
+    return (header["title"]        , header["print_flag"]   , header["normalization_flag"] ,
+            header["shift_flag"]   , np.array(header["skipped_systems"]) , no_of_systems   ,
+            no_of_electronics      , no_of_sterics          , no_of_buried_volumes         ,
+            header["system_tags"]  , header["experimental_tag"] , experimental_data        ,
+            header["electronic_tags"] , electronic_descriptors , radius_proximal           ,
+            radius_distal          , buried_volumes         )
+
+# --- End of function read_binary_matrix --------------------------------------
+
+def write_binary_matrix(matrix_file          , title             , print_flag             ,
+                        normalization_flag   , shift_flag        , skipped_systems        ,
+                        no_of_systems        , no_of_electronics , no_of_sterics          ,
+                        no_of_buried_volumes , system_tags       , experimental_tag       ,
+                        experimental_data    , electronic_tags   , electronic_descriptors ,
+                        radius_proximal      , radius_distal     , buried_volumes         ):
+
+# Writes a binary matrix file. Values are stored in full precision, and only the
+# columns of buried_volumes written by write_matrix are kept.
+
+
+    volumes_width = no_of_systems if no_of_sterics == 1 else 2*no_of_systems
+
+    header = json.dumps({"title"                : title,
+                         "print_flag"           : int(print_flag),
+                         "normalization_flag"   : int(normalization_flag),
+                         "shift_flag"           : int(shift_flag),
+                         "skipped_systems"      : [int(i) for i in skipped_systems],
+                         "no_of_systems"        : int(no_of_systems),
+                         "no_of_electronics"    : int(no_of_electronics),
+                         "no_of_sterics"        : int(no_of_sterics),
+                         "no_of_buried_volumes" : int(no_of_buried_volumes),
+                         "system_tags"          : [str(t) for t in system_tags[:no_of_systems]],
+                         "experimental_tag"     : str(experimental_tag),
+                         "electronic_tags"      : [str(t) for t in electronic_tags[:no_of_electronics]]})
+
+
+  # pad the header with blanks, so that float64 blocks are aligned to 8 bytes
+
+    header = header.encode("utf-8")
+    header = header + b" " * (-len(header) % 8)
+
+
+  # collect data before opening the file, that can be the one mapped by read_matrix
+
+    data = b"".join([np.ascontiguousarray(values, dtype="<f8").tobytes() for values in
+                     [np.asarray(experimental_data)[:no_of_systems],
+                      np.asarray(electronic_descriptors)[:no_of_electronics, :no_of_systems],
+                      np.asarray(radius_proximal)[:no_of_buried_volumes],
+                      np.asarray(radius_distal)[:no_of_buried_volumes],
+                      np.asarray(buried_volumes)[:no_of_buried_volumes, :volumes_width]]])
+
+    with open(matrix_file, "wb") as f:
+         f.write(BINARY_MAGIC)
+         f.write(np.array([len(header)], dtype="<i8").tobytes())
+         f.write(header)
+         f.write(data)
+
+
+    return()
+
+# --- End of function write_binary_matrix -------------------------------------
+
+def round_matrix(title             , print_flag             , normalization_flag   ,
+                 shift_flag        , skipped_systems        , no_of_systems        ,
+                 no_of_electronics , no_of_sterics          , no_of_buried_volumes ,
+                 system_tags       , experimental_tag       , experimental_data    ,
+                 electronic_tags   , electronic_descriptors , radius_proximal      ,
+                 radius_distal     , buried_volumes         ):
+
+# Returns the matrix as read_matrix would read it back after write_matrix, i.e.
+# with values rounded to the formats of write_matrix. Used to pass matrices
+# between tests in memory with the same results obtained through matrix files.
+
+
+    experimental_data      = np.array([float("{:14.5e}".format(x))
+                                       for x in experimental_data])
+    electronic_descriptors = np.array([float("{:14.5e}".format(x))
+                                       for x in np.ravel(electronic_descriptors)])
+    radius_proximal        = np.array([float("{:6.2f}".format(x)) for x in radius_proximal])
+    radius_distal          = np.array([float("{:6.2f}".format(x)) for x in radius_distal])
+    buried_volumes         = np.array([float("{:9.3f}".format(x))
+                                       for x in np.ravel(np.asarray(buried_volumes)
+                                          [:no_of_buried_volumes, :no_of_sterics*no_of_systems])])
+
+    electronic_descriptors = electronic_descriptors.reshape((no_of_electronics, no_of_systems))
+    buried_volumes         = buried_volumes.reshape((no_of_buried_volumes, no_of_sterics*no_of_systems))
+
+
+    return (title.strip()     , int(print_flag)        , int(normalization_flag) ,
+            int(shift_flag)   , np.array(skipped_systems) , int(no_of_systems)   ,
+            int(no_of_electronics) , int(no_of_sterics) , int(no_of_buried_volumes) ,
+            list(system_tags) , experimental_tag       , experimental_data    ,
+            list(electronic_tags) , electronic_descriptors , radius_proximal  ,
+            radius_distal     , buried_volumes         )
+
+# --- End of function round_matrix --------------------------------------------
+
+def reorder_matrix(title             , print_flag             , normalization_flag   ,  
+                   shift_flag        , skipped_systems        , no_of_systems        ,  
+                   no_of_electronics , no_of_sterics          , no_of_buried_volumes ,  
+                   system_tags       , experimental_tag       , experimental_data    ,  
+                   electronic_tags   , electronic_descriptors , radius_proximal      ,  
+                   radius_distal     , buried_volumes         , updown_flag          ):
+
+# Reorders systems by increasing experimental performance if updown_flag is UP
+# Reorders systems by decreasing experimental performance if updown_flag is DOWN
+# Returns the ordered system_tags, experimental_data, electronic_descriptors and buried_volumes
+
+
+  # defyning arrays to store reordered data
+
+    out_tag = []
+    out_exp = np.zeros(no_of_systems, dtype=float)
+    out_ele = np.zeros((no_of_electronics, no_of_systems), dtype=float)
+    out_vbu = np.zeros((no_of_buried_volumes, 2*no_of_systems), dtype=float)
+
+
+  # get indices of experimental_data according to updown_flag
+
+    out_indices = np.zeros(no_of_systems, dtype=int)
+    if updown_flag == "up"   : out_indices = np.argsort(+experimental_data)
+    if updown_flag == "down" : out_indices = np.argsort(-experimental_data)
+
+
+  # store data in temporary arrays according to order in out_indices array
+
+    for r in range(no_of_systems):
+        out_tag.append(system_tags[out_indices[r]])
+        out_exp[r] = experimental_data[out_indices[r]]
+
+        for e in range(no_of_electronics):
+            out_ele[e][r] = electronic_descriptors[e][out_indices[r]]
+
+        if no_of_sterics == 1:
+            for s in range(no_of_buried_volumes):
+                out_vbu[s][r] = buried_volumes[s][r]
+         
+        if no_of_sterics == 2:
+            for s in range(no_of_buried_volumes):
+                r1 = r*2
+                r2 = out_indices[r]*2
+                out_vbu[s][r1] = buried_volumes[s][r2]
+                out_vbu[s][r1+1] = buried_volumes[s][r2+1]
+
+
+  # all done, return the reordered data
+
+    return(out_tag, out_exp, out_ele, out_vbu)
+
+# --- End of function reorder_matrix ---------------------------------------------
+
@@ -161,14 +161,15 @@ def main():
     radius_distal     , buried_volumes         , updown_flag          )
 
 
-  # write reordered matrix 
+  # write reordered matrix, in the same format of matrix_file
 
     write_matrix(Out_Matrix_File      , title             , print_flag           ,
                  normalization_flag   , shift_flag        , skipped_systems      ,
                  no_of_systems        , no_of_electronics , no_of_sterics        ,
                  no_of_buried_volumes , out_tag           , experimental_tag     ,
                  out_exp              , electronic_tags   , out_ele     ,
-                 radius_proximal      , radius_distal     , out_vbu         ) 
+                 radius_proximal      , radius_distal     , out_vbu         ,
+                 binary = is_binary_matrix(MatrixFile)) 
 
     return()
 
@@ -0,0 +1,1408 @@
+#!/usr/bin/env python3 -B
+
+""" ---------------------------------------------------------------------------
+
+In-memory MLR engine. Reproduces what Fortran/MLR.f does on a matrix file,
+working directly on the arrays returned by read_matrix:
+
+    1) normalization of data according to NormalizeFlag 0-4
+    2) removal of the skipped systems from the training set
+    3) least squares fit at every (Rv, Rr) point of the steric grid, with the
+       electronic block factorized once and a Schur complement update per point
+    4) selection of the grid point with max R2, ties to the lowest point. As
+       MLR.x, the run stops if no point has R2 > 0
+    5) fitted values for all systems, predictions for the skipped ones
+
+To be used as:
+   from Utilities.mlr_engine import *
+
+   (R2, point, rv, rr, coefficients, fitted, experiments,
+    exp_av, exp_sd) = run_mlr(normalization_flag, shift_flag, skipped_systems,
+                              no_of_systems, no_of_sterics, experimental_data,
+                              electronic_descriptors, radius_proximal,
+                              radius_distal, buried_volumes)
+
+run_mlr_cached takes the same arguments as run_mlr and reads the fit from the
+on-disk cache of fit_cache.py when the same fit was already done.
+
+run_mlr_file(MatrixFile, OutputFile) is a drop-in replacement for running
+"MLR.x MatrixFile > OutputFile".
+
+run_mlr_shuffles returns the max R2 for many shuffled experimental vectors,
+factorizing the design of each grid point only once, as in y-randomization.
+run_mlr_loo returns the leave-one-out predictions of all systems from the
+same single factorization, using the leverages of the full fit.
+
+All values are returned in full precision. round_significant and
+round_decimals give back values as written by MLR.x in its output, to keep
+results of the drivers identical to those obtained parsing MLR.x output.
+
+@author: Zhen Cao, Luigi Cavallo
+--------------------------------------------------------------------------- """
+
+import numpy as np
+
+from Utilities.matrix_operation import read_matrix
+from Utilities.fit_cache import fit_key, load_fit, store_fit
+from Utilities.profiling import profiled, count
+
+
+# index of the grid point of a fit where no point has R2 > 0, nMax = 0 in MLR.f
+
+NO_POINT = -1
+
+
+# ---------------------
+
+def skipped_mask(skipped_systems, no_of_systems):
+
+  # converts skipped_systems, as in line 5 of the matrix file, into a boolean mask
+  # skipped_systems[0] is the number of skipped systems, followed by their 1-based IDs
+
+    mask = np.zeros(no_of_systems, dtype=bool)
+
+    if len(skipped_systems) > 0 and skipped_systems[0] > 0:
+       skipped = np.asarray(skipped_systems[1:skipped_systems[0]+1], dtype=int)
+       mask[skipped - 1] = True
+
+    return mask
+
+
+# ---------------------
+
+def skipped_ids(skipped_systems):
+
+  # returns the 0-based indices of the skipped systems, in the order of the matrix file
+
+    if len(skipped_systems) == 0 or skipped_systems[0] == 0:
+       return np.zeros(0, dtype=int)
+
+    return np.asarray(skipped_systems[1:skipped_systems[0]+1], dtype=int) - 1
+
+
+# ---------------------
+
+def unpack_buried_volumes(buried_volumes, no_of_systems, no_of_sterics):
+
+  # buried_volumes from read_matrix is [no_of_buried_volumes][no_of_sterics*no_of_systems]
+  # with the steric descriptors of each system next to each other.
+  # Returns volumes as [no_of_buried_volumes][no_of_systems][no_of_sterics]
+
+    buried_volumes = np.asarray(buried_volumes, dtype=float)
+    no_of_points   = buried_volumes.shape[0]
+
+    return buried_volumes[:, :no_of_sterics*no_of_systems].reshape(
+                          (no_of_points, no_of_systems, no_of_sterics))
+
+
+# ---------------------
+
+def normalize_values(values, fitted_mask):
+
+  # normalizes values along the last axis with mean and standard deviation
+  # (ddof=1) of the fitted systems only, as dnormal in Fortran/dnormal1.f.
+  # Skipped systems are normalized with the same mean and standard deviation.
+
+    fitted = values[..., fitted_mask]
+    mean   = np.mean(fitted, axis=-1, keepdims=True)
+    stdv   = np.std(fitted, axis=-1, ddof=1, keepdims=True)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+         normalized = (values - mean) / stdv
+
+    return normalized, mean, stdv
+
+
+# ---------------------
+
+@profiled("matrix assembly")
+def normalize_data(normalization_flag, skip_mask, experimental_data,
+                   electronic_descriptors, volumes):
+
+  # normalizes experimental data and descriptors according to NormalizeFlag
+  #   0 -> no normalization
+  #   1 -> normalize all data, skipped systems included
+  #   2 -> normalize all data, skipped systems excluded
+  #   3 -> normalize descriptors only, skipped systems included
+  #   4 -> normalize descriptors only, skipped systems excluded
+
+  # Input:
+    # experimental_data      := [no_of_systems]
+    # electronic_descriptors := [no_of_electronics][no_of_systems]
+    # volumes                := [no_of_buried_volumes][no_of_systems][no_of_sterics]
+
+  # Output:
+    # experiments, electronics [no_of_systems][no_of_electronics] and volumes,
+    # all normalized, plus average and standard deviation of experimental data
+  # ---------------------
+
+    if normalization_flag < 0 or normalization_flag > 4:
+       print(' NormalizeFlag =', normalization_flag)
+       print(' NormalizeFlag key out of allowed range 0-4')
+       exit()
+
+    experiments = np.array(experimental_data, dtype=float)
+    electronics = np.array(electronic_descriptors, dtype=float).reshape(
+                           (-1, len(experiments))).T
+    volumes     = np.array(volumes, dtype=float)
+    exp_av      = 0.0
+    exp_sd      = 1.0
+
+    if normalization_flag == 0:
+       return experiments, electronics, volumes, exp_av, exp_sd
+
+    if normalization_flag == 1 or normalization_flag == 3:
+       fitted_mask = np.ones(len(experiments), dtype=bool)
+    else:
+       fitted_mask = ~skip_mask
+
+    if normalization_flag == 1 or normalization_flag == 2:
+       experiments, mean, stdv = normalize_values(experiments, fitted_mask)
+       exp_av = float(mean[0])
+       exp_sd = float(stdv[0])
+
+    electronics = normalize_values(electronics.T, fitted_mask)[0].T
+    volumes     = np.swapaxes(normalize_values(np.swapaxes(volumes, 1, 2), fitted_mask)[0], 1, 2)
+
+    return experiments, electronics, volumes, exp_av, exp_sd
+
+
+# ---------------------
+
+@profiled("matrix assembly")
+def assemble_design(shift_flag, electronics, volumes):
+
+  # builds the MLR design matrices for all the points of the steric grid
+  # columns are: [1 if shift_flag == 1], electronic descriptors, steric descriptors
+
+  # Input:
+    # electronics := [no_of_systems][no_of_electronics]
+    # volumes     := [no_of_points][no_of_systems][no_of_sterics]
+
+  # Output:
+    # design      := [no_of_points][no_of_systems][no_of_variables]
+  # ---------------------
+
+    if shift_flag < 0 or shift_flag > 1:
+       print(' IShift =', shift_flag)
+       print(' IShift key out of allowed range 0-1')
+       exit()
+
+    no_of_points, no_of_systems, no_of_sterics = volumes.shape
+
+    columns = []
+    if shift_flag == 1:
+       columns.append(np.ones((no_of_points, no_of_systems, 1)))
+    columns.append(np.broadcast_to(electronics, (no_of_points,) + electronics.shape))
+    columns.append(volumes)
+
+    return np.concatenate(columns, axis=2)
+
+
+# ---------------------
+
+def scan_grid(design, experiments):
+
+  # least squares fit of experiments at every point of the grid by QR factorization,
+  # as DGELS in MLR.f. Points where the design matrix is rank deficient get R2 = nan.
+
+  # Input:
+    # design      := [no_of_points][no_of_fitted][no_of_variables]
+    # experiments := [no_of_fitted]
+
+  # Output:
+    # r2_values    := [no_of_points]
+    # coefficients := [no_of_points][no_of_variables]
+  # ---------------------
+
+    q, r = np.linalg.qr(design)
+    qty  = np.einsum('pnk,n->pk', q, experiments)
+
+    diagonal = np.abs(np.diagonal(r, axis1=1, axis2=2))
+    singular = np.min(diagonal, axis=1) <= 1.0e-12 * np.max(diagonal, axis=1)
+    if np.any(singular):
+       r = r.copy()
+       r[singular] = np.eye(r.shape[1])
+
+    coefficients = np.linalg.solve(r, qty[..., None])[..., 0]
+
+    residuals = experiments - np.einsum('pnk,pk->pn', design, coefficients)
+    ss_res    = np.sum(residuals**2, axis=1)
+    ss_tot    = np.sum((experiments - np.mean(experiments))**2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+         r2_values = 1.0 - ss_res / ss_tot
+    r2_values[singular] = np.nan
+
+    return r2_values, coefficients
+
+
+# ---------------------
+
+def scan_grid_gram(fixed, volumes, responses, block_size=256):
+
+  # R2 at every point of the grid from precomputed blocks of the columns that
+  # do not change along the grid, i.e. intercept and electronic descriptors.
+  # These are orthonormalized once, X_f = Q_f R_f, and each point only adds its
+  # steric columns V as a bordered update. With the Schur complement
+  #     S = V^T V - (Q_f^T V)^T (Q_f^T V)
+  # and g = V^T r_f, with r_f the residuals of the fit on the fixed columns,
+  #     ss_res = r_f^T r_f - g^T S^-1 g
+  # so that the cost per point is that of a no_of_sterics x no_of_sterics solve.
+  # Points where S or the fixed block are rank deficient get R2 = nan.
+  # Many responses can be scanned at once, in blocks of block_size columns.
+
+  # Input:
+    # fixed     := [no_of_fitted][no_of_fixed]
+    # volumes   := [no_of_points][no_of_fitted][no_of_sterics]
+    # responses := [no_of_fitted] or [no_of_fitted][no_of_responses]
+
+  # Output:
+    # r2_values := [no_of_points] or [no_of_points][no_of_responses]
+  # ---------------------
+
+    single    = responses.ndim == 1
+    responses = responses.reshape((responses.shape[0], -1))
+
+    q_f, r_f = np.linalg.qr(fixed)
+    cross    = np.einsum('nk,pns->pks', q_f, volumes)
+    schur    = np.einsum('pns,pnt->pst', volumes, volumes) - np.einsum('pks,pkt->pst', cross, cross)
+
+
+  # rank check on the Schur complement scaled to unit diagonal of V^T V
+
+    diagonal = np.sqrt(np.einsum('pns,pns->ps', volumes, volumes))
+    with np.errstate(divide='ignore', invalid='ignore'):
+         scaled = schur / (diagonal[:, :, None] * diagonal[:, None, :])
+    singular = ~np.all(np.isfinite(scaled), axis=(1, 2))
+    scaled[singular] = np.eye(scaled.shape[1])
+    singular = singular | (np.linalg.eigvalsh(scaled)[:, 0] <= 1.0e-12)
+
+    fixed_diagonal = np.abs(np.diagonal(r_f))
+    if fixed_diagonal.size > 0 and np.min(fixed_diagonal) <= 1.0e-12 * np.max(fixed_diagonal):
+       singular[:] = True
+
+    if np.any(singular):
+       schur[singular] = np.eye(schur.shape[1])
+
+    no_of_responses = responses.shape[1]
+    r2_values       = np.empty((volumes.shape[0], no_of_responses))
+
+    for start in range(0, no_of_responses, block_size):
+        block     = responses[:, start:start+block_size]
+        residuals = block - q_f @ (q_f.T @ block)
+        ss_fixed  = np.sum(residuals**2, axis=0)
+        ss_tot    = np.sum((block - np.mean(block, axis=0))**2, axis=0)
+
+        g      = np.einsum('pns,nr->psr', volumes, residuals)
+        ss_res = ss_fixed - np.sum(g * np.linalg.solve(schur, g), axis=1)
+        ss_res = np.maximum(ss_res, 0.0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+             r2_values[:, start:start+block_size] = 1.0 - ss_res / ss_tot
+
+    r2_values[singular] = np.nan
+
+    if single:
+       return r2_values[:, 0]
+
+    return r2_values
+
+
+# ---------------------
+
+def select_points(r2_values, axis=0):
+
+  # index of the grid point with max R2 along axis, e.g. for each column of
+  # r2_values. As in MLR.f, the first point wins in case of ties, points with
+  # undefined R2 are never selected, and only points with R2 > 0 are: where
+  # no point has R2 > 0 the index is NO_POINT.
+
+    r2_values = np.where(np.isnan(r2_values), -np.inf, r2_values)
+    points    = np.argmax(r2_values, axis=axis)
+    r2_max    = np.take_along_axis(r2_values, np.expand_dims(points, axis), axis=axis)
+
+    return np.where(np.squeeze(r2_max, axis=axis) > 0.0, points, NO_POINT)
+
+
+# ---------------------
+
+def select_point(r2_values):
+
+  # index of the grid point with max R2 of a single fit, as select_points,
+  # the run stops if no point has R2 > 0
+
+    point = int(select_points(r2_values))
+    check_points(point)
+
+    return point
+
+
+# ---------------------
+
+def check_points(points):
+
+  # stops the run if no grid point with R2 > 0 was found for some fit, as
+  # MLR.x does in server mode
+
+    if np.any(np.asarray(points) == NO_POINT):
+       print(' Error: MLR, no grid point with positive R2')
+       exit(1)
+
+    return()
+
+
+# ---------------------
+
+def fit_point(design, experiments):
+
+  # least squares fit at a single grid point, returns R2 and coefficients
+
+    r2_values, coefficients = scan_grid(design[None], experiments)
+
+    return float(r2_values[0]), coefficients[0]
+
+
+# ---------------------
+
+def check_coefficients(coefficients):
+
+  # sanity check on coefficients, as in MLR.f: values larger than 10e+6 are
+  # suspicious and all coefficients are zeroed. Returns True if zeroed.
+
+    if np.any(np.abs(coefficients) > 10.0e+6):
+       coefficients[:] = 0.0
+       return True
+
+    return False
+
+
+# ---------------------
+
+@profiled("solver")
+def run_mlr(normalization_flag , shift_flag             , skipped_systems ,
+            no_of_systems      , no_of_sterics          , experimental_data ,
+            electronic_descriptors , radius_proximal    , radius_distal ,
+            buried_volumes     ):
+
+  # runs the full MLR analysis of MLR.f on the arrays returned by read_matrix
+
+  # Input:
+    # normalization_flag   := NormalizeFlag, 0-4
+    # shift_flag           := IShift, 1 to include the intercept
+    # skipped_systems      := No of skipped systems followed by their 1-based IDs
+    # no_of_systems        := No of systems in the matrix
+    # no_of_sterics        := No of steric descriptors
+    # experimental_data, electronic_descriptors, radius_proximal, radius_distal,
+    # buried_volumes       := as returned by read_matrix
+
+  # Output:
+    # R2           := R2 of the fit at the best grid point
+    # point        := 0-based index of the best grid point
+    # rv, rr       := radii of the best grid point, zeroed with the coefficients
+    # coefficients := MLR coefficients, intercept first if shift_flag == 1
+    # fitted       := fitted values of all the systems, normalized. Values of skipped
+    #                 systems are predictions
+    # experiments  := experimental values of all the systems, normalized
+    # exp_av       := average of experimental data used in the normalization
+    # exp_sd       := standard deviation of experimental data used in the normalization
+  # ---------------------
+
+    skip_mask = skipped_mask(skipped_systems, no_of_systems)
+    volumes   = unpack_buried_volumes(buried_volumes, no_of_systems, no_of_sterics)
+
+    if np.count_nonzero(~skip_mask) < volumes.shape[2] + len(electronic_descriptors) + shift_flag:
+       print(' You remove too many systems')
+       exit()
+
+    experiments, electronics, volumes, exp_av, exp_sd = normalize_data(
+                 normalization_flag, skip_mask, experimental_data,
+                 electronic_descriptors, volumes)
+
+    design      = assemble_design(shift_flag, electronics, volumes)
+    no_of_fixed = design.shape[2] - volumes.shape[2]
+
+
+  # scan the grid on the fitted systems only, then refit at the best point
+
+    r2_values = scan_grid_gram(design[0][~skip_mask, :no_of_fixed],
+                               design[:, ~skip_mask, no_of_fixed:], experiments[~skip_mask])
+    point     = select_point(r2_values)
+
+    R2, coefficients = fit_point(design[point][~skip_mask], experiments[~skip_mask])
+
+    count("fits")
+    count("grid points", len(r2_values))
+
+    rv = float(radius_proximal[point])
+    rr = float(radius_distal[point])
+    if check_coefficients(coefficients):
+       rv = 0.0
+       rr = 0.0
+
+
+  # fitted values for all systems, predictions for the skipped ones
+
+    fitted = design[point] @ coefficients
+
+
+    return (R2, point, rv, rr, coefficients, fitted, experiments, exp_av, exp_sd)
+
+# --- End of function run_mlr -------------------------------------------------
+
+
+# ---------------------
+
+def run_mlr_cached(normalization_flag , shift_flag             , skipped_systems ,
+                   no_of_systems      , no_of_sterics          , experimental_data ,
+                   electronic_descriptors , radius_proximal    , radius_distal ,
+                   buried_volumes     ):
+
+  # as run_mlr, with the fit read from the cache if already done on the same
+  # data, flags and skipped systems, and stored in the cache otherwise
+
+    key = fit_key(normalization_flag , shift_flag             , skipped_systems ,
+                  no_of_systems      , no_of_sterics          , experimental_data ,
+                  electronic_descriptors , radius_proximal    , radius_distal ,
+                  buried_volumes     )
+
+    results = load_fit(key)
+    if results is not None:
+       count("cache hits")
+    else:
+       results = run_mlr(normalization_flag , shift_flag             , skipped_systems ,
+                         no_of_systems      , no_of_sterics          , experimental_data ,
+                         electronic_descriptors , radius_proximal    , radius_distal ,
+                         buried_volumes     )
+       store_fit(key, results)
+
+    return results
+
+
+# ---------------------
+
+@profiled("solver")
+def run_mlr_shuffles(normalization_flag , shift_flag             , skipped_systems ,
+                     no_of_systems      , no_of_sterics          , shuffled_data   ,
+                     electronic_descriptors , radius_proximal    , radius_distal   ,
+                     buried_volumes     ):
+
+  # max R2 of the MLR grid scan for a set of shuffled experimental vectors.
+  # Descriptors, their normalization and the QR factorization of every grid
+  # point do not depend on experimental data, so they are computed only once.
+
+  # Input:
+    # shuffled_data := [no_of_shuffles][no_of_systems], experimental data of each shuffle
+    # all others    := as in run_mlr
+
+  # Output:
+    # r2_values     := [no_of_shuffles], R2 at the best grid point of each shuffle
+    # points        := [no_of_shuffles], 0-based index of the best grid point
+  # ---------------------
+
+    skip_mask = skipped_mask(skipped_systems, no_of_systems)
+    volumes   = unpack_buried_volumes(buried_volumes, no_of_systems, no_of_sterics)
+
+    if np.count_nonzero(~skip_mask) < volumes.shape[2] + len(electronic_descriptors) + shift_flag:
+       print(' You remove too many systems')
+       exit()
+
+    responses = np.array(shuffled_data, dtype=float).reshape((-1, no_of_systems))
+
+    _, electronics, volumes, _, _ = normalize_data(
+                 normalization_flag, skip_mask, responses[0],
+                 electronic_descriptors, volumes)
+
+    if normalization_flag == 1:
+       responses = normalize_values(responses, np.ones(no_of_systems, dtype=bool))[0]
+    elif normalization_flag == 2:
+       responses = normalize_values(responses, ~skip_mask)[0]
+
+    design      = assemble_design(shift_flag, electronics, volumes)
+    no_of_fixed = design.shape[2] - volumes.shape[2]
+
+
+  # scan the grid for all shuffles, best point is the first max of each column
+
+    r2_grid = scan_grid_gram(design[0][~skip_mask, :no_of_fixed],
+                             design[:, ~skip_mask, no_of_fixed:], responses[:, ~skip_mask].T)
+    points  = select_points(r2_grid, axis=0)
+    check_points(points)
+
+    r2_values = r2_grid[points, np.arange(len(points))]
+
+    count("fits", len(points))
+    count("grid points", r2_grid.size)
+
+
+    return r2_values, points
+
+# --- End of function run_mlr_shuffles ----------------------------------------
+
+
+def scan_grid_loo(design, experiments):
+
+  # leave-one-out at every point of the grid from a single fit per point.
+  # For least squares the LOO residual of system i is e_i/(1-h_ii), with h_ii
+  # the leverage, and the residual sum of squares of the fit without system i
+  # is ss_res - e_i^2/(1-h_ii). This gives the R2 of every fold at every point,
+  # needed to select the best point of each fold as MLR.f does.
+
+  # Input:
+    # design        := [no_of_points][no_of_systems][no_of_variables]
+    # experiments   := [no_of_systems]
+
+  # Output:
+    # r2_values     := [no_of_points][no_of_systems], R2 of the fit without each
+    #                  system, nan where the fold is rank deficient
+    # loo_residuals := [no_of_points][no_of_systems]
+    # q, r, qty     := QR factorization of the design and Q^T y at every point
+  # ---------------------
+
+    no_of_systems = len(experiments)
+
+    q, r = np.linalg.qr(design)
+    qty  = np.einsum('pnk,n->pk', q, experiments)
+
+    diagonal = np.abs(np.diagonal(r, axis1=1, axis2=2))
+    singular = np.min(diagonal, axis=1) <= 1.0e-12 * np.max(diagonal, axis=1)
+
+    residuals = experiments - np.einsum('pnk,pk->pn', q, qty)
+    leverage  = np.sum(q**2, axis=2)
+    ss_res    = np.sum(residuals**2, axis=1, keepdims=True)
+
+    deviation = experiments - np.mean(experiments)
+    ss_tot    = np.sum(deviation**2) - deviation**2 * no_of_systems / (no_of_systems - 1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+         loo_residuals = residuals / (1.0 - leverage)
+         r2_values     = 1.0 - (ss_res - residuals * loo_residuals) / ss_tot
+
+    r2_values[singular]                  = np.nan
+    r2_values[leverage > 1.0 - 1.0e-10]  = np.nan
+
+    return r2_values, loo_residuals, q, r, qty
+
+
+# ---------------------
+
+@profiled("solver")
+def run_mlr_loo(normalization_flag , shift_flag         , no_of_systems  ,
+                no_of_sterics      , experimental_data  , electronic_descriptors ,
+                radius_proximal    , radius_distal      , buried_volumes ,
+                closed_form = True ):
+
+  # leave-one-out predictions of all systems, as obtained running MLR.x
+  # skipping one system at a time.
+
+  # With NormalizeFlag 0, 1 and 3 normalization does not depend on the skipped
+  # system and all the folds are obtained in closed form from one factorization
+  # per grid point. With NormalizeFlag 2 and 4, or closed_form = False, each
+  # fold is refitted explicitly with run_mlr.
+
+  # Input:
+    # closed_form := False to refit each fold explicitly, as a parity check
+    # all others  := as in run_mlr
+
+  # Output:
+    # loo_values  := [no_of_systems], normalized prediction of each system when skipped
+    # points      := [no_of_systems], 0-based index of the best grid point of each fold
+  # ---------------------
+
+    loo_values = np.zeros(no_of_systems)
+    points     = np.zeros(no_of_systems, dtype=int)
+
+    if not closed_form or normalization_flag == 2 or normalization_flag == 4:
+       loo_system = [1, 0]
+       for l in range(no_of_systems):
+           loo_system[1] = l+1
+           results = run_mlr(normalization_flag     , shift_flag      , loo_system        ,
+                             no_of_systems          , no_of_sterics   , experimental_data ,
+                             electronic_descriptors , radius_proximal , radius_distal     ,
+                             buried_volumes         )
+           loo_values[l] = results[5][l]
+           points[l]     = results[1]
+       return loo_values, points
+
+    skip_mask = np.zeros(no_of_systems, dtype=bool)
+    volumes   = unpack_buried_volumes(buried_volumes, no_of_systems, no_of_sterics)
+
+    if no_of_systems - 1 < volumes.shape[2] + len(electronic_descriptors) + shift_flag:
+       print(' You remove too many systems')
+       exit()
+
+    experiments, electronics, volumes, _, _ = normalize_data(
+                 normalization_flag, skip_mask, experimental_data,
+                 electronic_descriptors, volumes)
+
+    design = assemble_design(shift_flag, electronics, volumes)
+
+
+  # R2 of every fold at every point, best point of each fold is the first max
+
+    r2_values, loo_residuals, q, r, qty = scan_grid_loo(design, experiments)
+
+    folds  = np.arange(no_of_systems)
+    points = select_points(r2_values, axis=0)
+    check_points(points)
+
+    count("fits", no_of_systems)
+    count("grid points", r2_values.size)
+
+
+  # coefficients of each fold at its best point, for the sanity check of MLR.f
+
+    rhs          = qty[points] - q[points, folds, :] * loo_residuals[points, folds][:, None]
+    coefficients = np.linalg.solve(r[points], rhs[..., None])[..., 0]
+    zeroed       = np.any(np.abs(coefficients) > 10.0e+6, axis=1)
+
+    loo_values         = experiments - loo_residuals[points, folds]
+    loo_values[zeroed] = 0.0
+
+
+    return loo_values, points
+
+# --- End of function run_mlr_loo ---------------------------------------------
+
+
+def normalize_weighted(values, weights, axis=-1):
+
+  # normalizes values along axis with weighted mean and standard deviation,
+  # weights being the number of times each system is taken. Same as
+  # normalize_values on a matrix where each system is repeated weights times.
+
+    total = np.sum(weights, axis=axis, keepdims=True)
+    mean  = np.sum(weights * values, axis=axis, keepdims=True) / total
+    stdv  = np.sqrt(np.sum(weights * (values - mean)**2, axis=axis, keepdims=True) / (total - 1))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+         normalized = (values - mean) / stdv
+
+    return normalized, mean, stdv
+
+
+# ---------------------
+
+def scan_grid_weighted(fixed, volumes, offsets, scales, experiments, weights):
+
+  # weighted version of scan_grid_gram for a batch of bootstrap cycles.
+  # Weighted least squares with integer weights is least squares on the matrix
+  # with repeated systems, solved here scaling each row by sqrt(weight).
+  # ss_tot is the weighted sum of squares.
+  # Normalized volumes of each cycle are (volumes - offsets)/scales and they are
+  # never built: V^T V, Q_f^T V and V^T r are obtained from matrix products
+  # with the volumes shared by all cycles, then shifted and scaled per cycle.
+
+  # Input:
+    # fixed       := [no_of_cycles][no_of_systems][no_of_fixed], normalized
+    # volumes     := [no_of_systems][no_of_points][no_of_sterics]
+    # offsets     := [no_of_cycles][no_of_points][no_of_sterics]
+    # scales      := [no_of_cycles][no_of_points][no_of_sterics]
+    # experiments := [no_of_cycles][no_of_systems], normalized
+    # weights     := [no_of_cycles][no_of_systems]
+
+  # Output:
+    # r2_values   := [no_of_cycles][no_of_points], nan where rank deficient
+  # ---------------------
+
+    no_of_systems, no_of_points, no_of_sterics = volumes.shape
+    no_of_cycles = len(weights)
+
+    flat     = volumes.reshape((no_of_systems, -1))
+    products = (volumes[..., :, None] * volumes[..., None, :]).reshape((no_of_systems, -1))
+    shape    = (no_of_cycles, no_of_points, no_of_sterics)
+
+    root   = np.sqrt(weights)
+    scaled = experiments * root
+
+    q_f, r_f = np.linalg.qr(fixed * root[:, :, None])
+    q_w      = np.swapaxes(q_f * root[:, :, None], 1, 2)
+
+
+  # weighted V^T V, Q_f^T V, and Schur complement of normalized volumes
+
+    total = np.sum(weights, axis=1)[:, None, None, None]
+    first = (weights @ flat).reshape(shape)
+    gram  = (weights @ products).reshape(shape + (no_of_sterics,))
+    shift = np.einsum('...s,...t->...st', offsets, first)
+    gram  = gram - shift - np.swapaxes(shift, -1, -2) \
+          + total * np.einsum('...s,...t->...st', offsets, offsets)
+    gram  = gram / np.einsum('...s,...t->...st', scales, scales)
+
+    cross = (q_w @ flat).reshape((no_of_cycles, -1, no_of_points, no_of_sterics))
+    cross = (cross - np.sum(q_w, axis=2)[:, :, None, None] * offsets[:, None]) / scales[:, None]
+    schur = gram - np.einsum('bkps,bkpt->bpst', cross, cross)
+
+
+  # rank check on the Schur complement scaled to unit diagonal of V^T V
+
+    diagonal = np.sqrt(np.diagonal(gram, axis1=2, axis2=3))
+    with np.errstate(divide='ignore', invalid='ignore'):
+         unit = schur / np.einsum('...s,...t->...st', diagonal, diagonal)
+    singular = ~np.all(np.isfinite(unit), axis=(2, 3))
+    unit[singular] = np.eye(no_of_sterics)
+    singular = singular | (np.linalg.eigvalsh(unit)[..., 0] <= 1.0e-12)
+
+    fixed_diagonal = np.abs(np.diagonal(r_f, axis1=1, axis2=2))
+    if fixed_diagonal.shape[1] > 0:
+       singular = singular | (np.min(fixed_diagonal, axis=1) <= 1.0e-12 * np.max(fixed_diagonal, axis=1))[:, None]
+
+    if np.any(singular):
+       schur[singular] = np.eye(no_of_sterics)
+
+    residuals = scaled - (q_f @ (np.swapaxes(q_f, 1, 2) @ scaled[..., None]))[..., 0]
+    ss_fixed  = np.sum(residuals**2, axis=1)
+
+    mean   = np.sum(weights * experiments, axis=1, keepdims=True) / np.sum(weights, axis=1, keepdims=True)
+    ss_tot = np.sum(weights * (experiments - mean)**2, axis=1)
+
+    weighted = residuals * root
+    g        = (weighted @ flat).reshape(shape)
+    g        = (g - np.sum(weighted, axis=1)[:, None, None] * offsets) / scales
+    ss_res   = ss_fixed[:, None] - np.sum(g * np.linalg.solve(schur, g[..., None])[..., 0], axis=2)
+    ss_res   = np.maximum(ss_res, 0.0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+         r2_values = 1.0 - ss_res / ss_tot[:, None]
+    r2_values[singular] = np.nan
+
+    return r2_values
+
+
+# ---------------------
+
+def fit_weighted(design, experiments, weights):
+
+  # weighted least squares fit of a batch of cycles, each at its own grid point,
+  # returns R2 and coefficients as fit_point does for a single fit
+
+  # Input:
+    # design      := [no_of_cycles][no_of_systems][no_of_variables]
+    # experiments := [no_of_cycles][no_of_systems]
+    # weights     := [no_of_cycles][no_of_systems]
+  # ---------------------
+
+    root   = np.sqrt(weights)
+    scaled = experiments * root
+
+    q, r = np.linalg.qr(design * root[:, :, None])
+    qty  = np.einsum('bnk,bn->bk', q, scaled)
+
+    diagonal = np.abs(np.diagonal(r, axis1=1, axis2=2))
+    singular = np.min(diagonal, axis=1) <= 1.0e-12 * np.max(diagonal, axis=1)
+    if np.any(singular):
+       r = r.copy()
+       r[singular] = np.eye(r.shape[1])
+
+    coefficients = np.linalg.solve(r, qty[..., None])[..., 0]
+
+    residuals = scaled - root * np.einsum('bnk,bk->bn', design, coefficients)
+    ss_res    = np.sum(residuals**2, axis=1)
+    mean      = np.sum(weights * experiments, axis=1, keepdims=True) / np.sum(weights, axis=1, keepdims=True)
+    ss_tot    = np.sum(weights * (experiments - mean)**2, axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+         r2_values = 1.0 - ss_res / ss_tot
+    r2_values[singular] = np.nan
+
+    return r2_values, coefficients
+
+
+# ---------------------
+
+@profiled("solver")
+def run_mlr_weighted(normalization_flag , shift_flag         , no_of_systems  ,
+                     no_of_sterics      , experimental_data  , electronic_descriptors ,
+                     radius_proximal    , radius_distal      , buried_volumes ,
+                     weights            , predicted          , block_size = 16):
+
+  # MLR for a set of bootstrap cycles, each given as the number of times every
+  # system is taken in the training bag, plus the systems of the prediction bag.
+  # Gives the same results of run_mlr on the matrix with repeated systems in the
+  # training bag and the prediction bag as skipped systems, as assembled by
+  # Tests/bootstrap.py, without building that matrix. Cycles are processed in
+  # blocks of block_size, with all the grid points of a block scanned at once.
+
+  # Input:
+    # weights      := [no_of_cycles][no_of_systems], times each system is in the training bag
+    # predicted    := [no_of_cycles][no_of_systems], True for systems in the prediction bag
+    # all others   := as in run_mlr
+
+  # Output:
+    # R2           := [no_of_cycles], R2 of the fit at the best grid point
+    # points       := [no_of_cycles], 0-based index of the best grid point
+    # coefficients := [no_of_cycles][no_of_variables], zeroed as in check_coefficients
+    # values       := [no_of_cycles][no_of_systems], fitted values of all systems
+    #                 in the units of experimental data, i.e. as in the Fit and Pre lines
+  # ---------------------
+
+    weights   = np.array(weights, dtype=float).reshape((-1, no_of_systems))
+    predicted = np.array(predicted, dtype=bool).reshape((-1, no_of_systems))
+    volumes   = unpack_buried_volumes(buried_volumes, no_of_systems, no_of_sterics)
+
+    if normalization_flag < 0 or normalization_flag > 4:
+       print(' NormalizeFlag =', normalization_flag)
+       print(' NormalizeFlag key out of allowed range 0-4')
+       exit()
+
+    if np.min(np.sum(weights, axis=1)) < volumes.shape[2] + len(electronic_descriptors) + shift_flag:
+       print(' You remove too many systems')
+       exit()
+
+    if shift_flag < 0 or shift_flag > 1:
+       print(' IShift =', shift_flag)
+       print(' IShift key out of allowed range 0-1')
+       exit()
+
+    experimental_data = np.array(experimental_data, dtype=float)
+    electronic_data   = np.array(electronic_descriptors, dtype=float).reshape((-1, no_of_systems)).T
+
+
+  # volumes are centered once on their plain average, to keep the weighted sums
+  # of the normalization accurate. Normalization of each cycle is then an offset
+  # and a scale with respect to the centered volumes.
+
+    volume_av   = np.mean(volumes, axis=1)
+    volume_data = np.swapaxes(volumes - volume_av[:, None, :], 0, 1)
+    volume_flat = volume_data.reshape((no_of_systems, -1))
+
+    no_of_cycles = weights.shape[0]
+    R2           = np.zeros(no_of_cycles)
+    points       = np.zeros(no_of_cycles, dtype=int)
+    coefficients = []
+    values       = np.zeros((no_of_cycles, no_of_systems))
+
+    for start in range(0, no_of_cycles, block_size):
+        w = weights[start:start+block_size]
+        c = len(w)
+
+
+      # normalization of each cycle, with weights of the training bag or of all systems
+
+        if normalization_flag == 1 or normalization_flag == 3:
+           normal = w + predicted[start:start+block_size]
+        else:
+           normal = w
+
+        experiments = np.broadcast_to(experimental_data, (c, no_of_systems))
+        electronics = np.broadcast_to(electronic_data, (c,) + electronic_data.shape)
+        offsets     = np.broadcast_to(-volume_av, (c,) + volume_av.shape)
+        scales      = np.ones((c,) + volume_av.shape)
+        exp_av      = np.zeros((c, 1))
+        exp_sd      = np.ones((c, 1))
+
+        if normalization_flag == 1 or normalization_flag == 2:
+           experiments, exp_av, exp_sd = normalize_weighted(experiments, normal)
+
+        if normalization_flag > 0:
+           electronics = normalize_weighted(electronics, normal[:, :, None], axis=1)[0]
+
+           total   = np.sum(normal, axis=1)[:, None]
+           offsets = (normal @ volume_flat) / total
+           scales  = np.sqrt(np.maximum((normal @ volume_flat**2) / total - offsets**2, 0.0)
+                             * total / (total - 1))
+           offsets = offsets.reshape((c,) + volume_av.shape)
+           scales  = scales.reshape((c,) + volume_av.shape)
+
+        fixed = electronics
+        if shift_flag == 1:
+           fixed = np.concatenate([np.ones((c, no_of_systems, 1)), electronics], axis=2)
+
+
+      # scan the grid of all cycles, then refit each cycle at its best point
+
+        r2_grid = scan_grid_weighted(fixed, volume_data, offsets, scales, experiments, w)
+        best    = select_points(r2_grid, axis=1)
+        check_points(best)
+
+        count("fits", c)
+        count("grid points", r2_grid.size)
+
+        steric      = (volume_data[:, best, :].swapaxes(0, 1) - offsets[np.arange(c), best][:, None, :]) \
+                    / scales[np.arange(c), best][:, None, :]
+        best_design = np.concatenate([fixed, steric], axis=2)
+        r2_best, coef_best = fit_weighted(best_design, experiments, w)
+
+        zeroed = np.any(np.abs(coef_best) > 10.0e+6, axis=1)
+        coef_best[zeroed] = 0.0
+
+        R2[start:start+c]     = r2_best
+        points[start:start+c] = best
+        coefficients.append(coef_best)
+        values[start:start+c] = exp_av + exp_sd * np.einsum('bnk,bk->bn', best_design, coef_best)
+
+
+    return R2, points, np.concatenate(coefficients), values
+
+# --- End of function run_mlr_weighted ----------------------------------------
+
+
+def factor_grid(design, experiments):
+
+  # triangular factor of the augmented matrix [design experiments] at every point
+  # of the grid, i.e. R from its QR factorization, with positive diagonal.
+  # The leading no_of_variables block is R of the design, the last column holds
+  # Q^T y and the last diagonal element is the square root of ss_res.
+
+  # Input:
+    # design      := [no_of_points][no_of_fitted][no_of_variables]
+    # experiments := [no_of_fitted]
+
+  # Output:
+    # factor      := [no_of_points][no_of_variables+1][no_of_variables+1]
+  # ---------------------
+
+    augmented = np.concatenate([design, np.broadcast_to(experiments[:, None],
+                                design.shape[:2] + (1,))], axis=2)
+    factor    = np.linalg.qr(augmented, mode='r')
+
+    signs = np.sign(np.diagonal(factor, axis1=1, axis2=2))
+    signs[signs == 0] = 1.0
+
+    return factor * signs[:, :, None]
+
+
+# ---------------------
+
+def update_factor(factor, rows, remove=False):
+
+  # adds (or removes with remove = True) one observation to the least squares
+  # problem of every grid point, as a rank-one update (downdate) of the
+  # triangular factor. Givens rotations are used to add, hyperbolic rotations
+  # to remove, as in the LINPACK Cholesky up- and down-dates. Cost is
+  # no_of_variables^2 per grid point, instead of a new factorization.
+
+  # Input:
+    # factor := [no_of_points][no_of_variables+1][no_of_variables+1], from factor_grid
+    # rows   := [no_of_points][no_of_variables+1], design row and experimental value
+    #           of the observation at every point
+
+  # Output:
+    # factor := updated factor, a new array
+  # ---------------------
+
+    factor = np.array(factor, dtype=float)
+    rows   = np.array(rows, dtype=float)
+
+    for j in range(factor.shape[1]):
+        r = factor[:, j, j]
+        x = rows[:, j]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+             if remove:
+                h = np.sqrt(np.maximum(r**2 - x**2, 0.0))
+                c = np.where(r != 0.0, h / r, 1.0)
+                s = np.where(r != 0.0, x / r, 0.0)
+                row_j = np.where(c[:, None] != 0.0,
+                                 (factor[:, j, j:] - s[:, None] * rows[:, j:]) / c[:, None], 0.0)
+                rows[:, j:] = c[:, None] * rows[:, j:] - s[:, None] * row_j
+             else:
+                h = np.hypot(r, x)
+                c = np.where(h != 0.0, r / h, 1.0)
+                s = np.where(h != 0.0, x / h, 0.0)
+                row_j = c[:, None] * factor[:, j, j:] + s[:, None] * rows[:, j:]
+                rows[:, j:] = c[:, None] * rows[:, j:] - s[:, None] * factor[:, j, j:]
+
+        factor[:, j, j:] = row_j
+        factor[:, j, j]  = h
+
+    return factor
+
+
+# ---------------------
+
+def scan_grid_factor(factor, experiments):
+
+  # R2 at every point of the grid from the factor of the fitted systems,
+  # and coefficients of every point. Points where the design matrix is
+  # rank deficient get R2 = nan.
+
+  # Input:
+    # factor       := [no_of_points][no_of_variables+1][no_of_variables+1]
+    # experiments  := [no_of_fitted], for ss_tot
+
+  # Output:
+    # r2_values    := [no_of_points]
+    # coefficients := [no_of_points][no_of_variables]
+  # ---------------------
+
+    k = factor.shape[1] - 1
+    r = factor[:, :k, :k]
+
+    diagonal = np.abs(np.diagonal(r, axis1=1, axis2=2))
+    singular = np.min(diagonal, axis=1) <= 1.0e-12 * np.max(diagonal, axis=1)
+    if np.any(singular):
+       r = r.copy()
+       r[singular] = np.eye(k)
+
+    coefficients = np.linalg.solve(r, factor[:, :k, k:])[..., 0]
+
+    ss_res = factor[:, k, k]**2
+    ss_tot = np.sum((experiments - np.mean(experiments))**2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+         r2_values = 1.0 - ss_res / ss_tot
+    r2_values[singular] = np.nan
+
+    return r2_values, coefficients
+
+
+# ---------------------
+
+@profiled("solver")
+def start_mlr_updates(normalization_flag , shift_flag             , skipped_systems ,
+                      no_of_systems      , no_of_sterics          , experimental_data ,
+                      electronic_descriptors , buried_volumes     ):
+
+  # sets up MLR for a training set that changes by a few systems at a time,
+  # as in optimization cycles. Data are normalized and the factor of the fitted
+  # systems is computed once. Systems then join or leave the training set with
+  # add_systems and remove_systems, and run_mlr_updated gives the results of
+  # run_mlr for the current training set.
+
+  # Only NormalizeFlag 0, 1 and 3 are allowed, since with 2 and 4 normalization
+  # depends on the skipped systems and each change requires a full refit.
+
+  # Output:
+    # model := (design, experiments, exp_av, exp_sd, fit_mask, factor)
+  # ---------------------
+
+    if normalization_flag == 2 or normalization_flag == 4:
+       print(' NormalizeFlag =', normalization_flag)
+       print(' Updates of the training set require NormalizeFlag 0, 1 or 3')
+       exit()
+
+    skip_mask = skipped_mask(skipped_systems, no_of_systems)
+    volumes   = unpack_buried_volumes(buried_volumes, no_of_systems, no_of_sterics)
+
+    if np.count_nonzero(~skip_mask) < volumes.shape[2] + len(electronic_descriptors) + shift_flag:
+       print(' You remove too many systems')
+       exit()
+
+    experiments, electronics, volumes, exp_av, exp_sd = normalize_data(
+                 normalization_flag, skip_mask, experimental_data,
+                 electronic_descriptors, volumes)
+
+    design = assemble_design(shift_flag, electronics, volumes)
+    factor = factor_grid(design[:, ~skip_mask, :], experiments[~skip_mask])
+
+    return (design, experiments, exp_av, exp_sd, ~skip_mask, factor)
+
+
+# ---------------------
+
+def add_systems(model, system_ids, remove=False):
+
+  # adds (remove = True: removes) systems to the training set of model by
+  # rank-one updates of the factor. system_ids are 1-based, as in skipped_systems.
+
+    design, experiments, exp_av, exp_sd, fit_mask, factor = model
+    fit_mask = fit_mask.copy()
+
+    for i in np.asarray(system_ids, dtype=int) - 1:
+        if fit_mask[i] == remove:
+           rows     = np.concatenate([design[:, i, :], np.full((design.shape[0], 1), experiments[i])], axis=1)
+           factor   = update_factor(factor, rows, remove)
+           fit_mask[i] = not remove
+
+    return (design, experiments, exp_av, exp_sd, fit_mask, factor)
+
+
+# ---------------------
+
+def remove_systems(model, system_ids):
+
+  # removes systems from the training set of model, see add_systems
+
+    return add_systems(model, system_ids, remove=True)
+
+
+# ---------------------
+
+@profiled("solver")
+def run_mlr_updated(model, radius_proximal, radius_distal, check=False):
+
+  # runs MLR on the current training set of model, giving the same output of
+  # run_mlr. With check = True the factor is compared with a full refit of
+  # the same training set, and the run stops if they do not agree.
+  # ---------------------
+
+    design, experiments, exp_av, exp_sd, fit_mask, factor = model
+
+    r2_values, grid_coefficients = scan_grid_factor(factor, experiments[fit_mask])
+    point        = select_point(r2_values)
+
+    count("fits")
+    count("grid points", len(r2_values))
+    R2           = float(r2_values[point])
+    coefficients = grid_coefficients[point].copy()
+
+    if check:
+       R2_fit, coefficients_fit = fit_point(design[point][fit_mask], experiments[fit_mask])
+       refit = factor_grid(design[:, fit_mask, :], experiments[fit_mask])
+       if abs(R2 - R2_fit) > 1.0e-8                                               \
+       or np.max(np.abs(coefficients - coefficients_fit)) > 1.0e-8 * max(1.0, np.max(np.abs(coefficients_fit))) \
+       or np.nanmax(np.abs(r2_values - scan_grid_factor(refit, experiments[fit_mask])[0])) > 1.0e-8:
+          print(' Error:  updated factor differs from full refit')
+          print('         R2 updated', R2, ' full refit', R2_fit)
+          exit()
+
+    rv = float(radius_proximal[point])
+    rr = float(radius_distal[point])
+    if check_coefficients(coefficients):
+       rv = 0.0
+       rr = 0.0
+
+    fitted = design[point] @ coefficients
+
+
+    return (R2, point, rv, rr, coefficients, fitted, experiments, exp_av, exp_sd)
+
+# --- End of function run_mlr_updated -----------------------------------------
+
+
+def round_significant(values, digits=5):
+
+  # rounds values to the number of significant digits written by MLR.x in
+  # Ew.d format, e.g. 5 digits for e15.5
+
+    values  = np.asarray(values, dtype=float)
+    rounded = np.array([float("{:.{}e}".format(v, digits-1)) for v in values.ravel()])
+
+    if values.ndim == 0:
+       return float(rounded[0])
+
+    return rounded.reshape(values.shape)
+
+
+# ---------------------
+
+def round_decimals(values, decimals=4):
+
+  # rounds values to the number of decimals written by MLR.x in Fw.d format,
+  # e.g. 4 decimals for f8.4
+
+    values  = np.asarray(values, dtype=float)
+    rounded = np.array([float("{:.{}f}".format(v, decimals)) for v in values.ravel()])
+
+    if values.ndim == 0:
+       return float(rounded[0])
+
+    return rounded.reshape(values.shape)
+
+
+# ---------------------
+
+def format_e(value, width, digits):
+
+  # formats value as Fortran Ew.d, i.e. 0.ddddE+xx right justified in width
+
+    if np.isnan(value):
+       return "{:>{}s}".format("NaN", width)
+
+    if value == 0.0:
+       mantissa = "0." + "0"*digits
+       exponent = 0
+    else:
+       text     = "{:.{}e}".format(abs(value), digits-1)
+       exponent = int(text.split('e')[1]) + 1
+       mantissa = "0." + text.split('e')[0].replace('.', '')
+
+    if abs(exponent) > 99:
+       text = mantissa + "{:+04d}".format(exponent)
+    else:
+       text = mantissa + "E" + "{:+03d}".format(exponent)
+
+    if value < 0.0:
+       text = "-" + text
+
+    return "{:>{}s}".format(text, width)
+
+
+# ---------------------
+
+def write_mlr_output(OutputFile         , MatrixFile        , title             ,
+                     normalization_flag , shift_flag        , skipped_systems   ,
+                     no_of_systems      , no_of_electronics , no_of_sterics     ,
+                     system_tags        , R2                , rv                ,
+                     rr                 , coefficients      , fitted            ,
+                     experiments        , exp_av            , exp_sd            ):
+
+  # writes a compact MLR.x-like output with the results of run_mlr.
+  # Only the sections used by the test drivers and the plots are written,
+  # with the same formats of MLR.f: counters, Max R2, Fit, LOO and final tables.
+  # ---------------------
+
+    skip_mask = skipped_mask(skipped_systems, no_of_systems)
+    no_of_skipped = np.count_nonzero(skip_mask)
+
+    inp_exp = exp_av + exp_sd*experiments
+    inp_fit = exp_av + exp_sd*fitted
+
+
+  # averages and standard deviation of errors, as computed in MLR.f
+
+    fitted_mask = ~skip_mask
+    dif_av = np.mean(exp_sd*experiments[fitted_mask] + exp_sd*fitted[fitted_mask])
+    dif_sd = np.sqrt(np.sum((exp_sd*experiments[fitted_mask] - exp_sd*fitted[fitted_mask]
+                           - dif_av)**2) / (np.count_nonzero(fitted_mask) - 1))
+
+    with open(OutputFile, "w") as f:
+         f.write('\n')
+         f.write(' Input File : ' + MatrixFile + '\n')
+         f.write(' System     : ' + title + '\n')
+         f.write('\n')
+         f.write('  Number of systems                : ' + "{:12d}".format(no_of_systems) + '\n')
+         f.write('  Number of Steric descriptors     : ' + "{:12d}".format(no_of_sterics) + '\n')
+         f.write('  Number of Electronic descriptors : ' + "{:12d}".format(no_of_electronics) + '\n')
+         f.write('  Number of system to be skipped   : ' + "{:12d}".format(no_of_skipped) + '\n')
+         f.write('  Normalization Flag               : ' + "{:12d}".format(normalization_flag) + '\n')
+         f.write('  MLR forced through origin yes/no = 0/1  : ' + "{:12d}".format(shift_flag) + '\n')
+         f.write('\n')
+         f.write('       Max-R2, r/Dr pair and coefficients' + '\n')
+         f.write('Max R2' + "{:8.4f}".format(R2) + "{:5.1f}".format(rv) + "{:5.1f}".format(rr) + '   '
+                + "".join([format_e(c, 18, 5) for c in coefficients]) + '\n')
+         f.write('\n')
+
+         f.write('  Averages and Standard deviations' + '\n')
+         f.write(' Experimental data ' + "{:10.4f}".format(exp_av) + "{:10.4f}".format(exp_sd) + '\n')
+         f.write(' Fitted - Experim. ' + "{:10.4f}".format(dif_av) + "{:10.4f}".format(dif_sd) + '\n')
+         f.write('\n')
+         f.write('              Normalized  Data                  Input  Data           Grubbs ' + '\n')
+         f.write('     N    Experim.  Fitted     Error    Experim.  Fitted     Error     Test  ' + '\n')
+         for i in range(no_of_systems):
+             if not skip_mask[i]:
+                f.write('Fit  ' + "{:5d}".format(i+1)
+                       + "{:10.3f}".format(experiments[i]) + "{:10.3f}".format(fitted[i])
+                       + "{:10.3f}".format(fitted[i] - experiments[i])
+                       + "{:10.3f}".format(inp_exp[i]) + "{:10.3f}".format(inp_fit[i])
+                       + "{:10.3f}".format(inp_fit[i] - inp_exp[i])
+                       + "{:10.3f}".format((exp_sd*experiments[i] - exp_sd*fitted[i])/dif_sd) + '\n')
+
+         if no_of_skipped > 0:
+            f.write('\n')
+            f.write('   Predicted value of LOO system ' + '\n')
+            for i in skipped_ids(skipped_systems):
+                f.write('LOO   ' + "{:3d}".format(i+1)
+                       + format_e(experiments[i], 15, 5) + format_e(fitted[i], 15, 5)
+                       + format_e(fitted[i] - experiments[i], 15, 5)
+                       + format_e(inp_exp[i], 15, 5) + format_e(inp_fit[i], 15, 5)
+                       + format_e(exp_sd*fitted[i] - exp_sd*experiments[i], 15, 5) + '\n')
+         f.write('\n')
+
+         f.write('              Normalized  Data                  Input  Data' + '\n')
+         f.write('     N    Experim.  Fitted     Error    Experim.  Fitted     Error' + '\n')
+         for i in range(no_of_systems):
+             f.write("{:3d}".format(i+1) + '   ' + "{:12s}".format(system_tags[i][:12]) + ' '
+                    + format_e(experiments[i], 15, 5) + format_e(fitted[i], 15, 5)
+                    + format_e(fitted[i] - experiments[i], 15, 5)
+                    + format_e(inp_exp[i], 15, 5) + format_e(inp_fit[i], 15, 5)
+                    + format_e(inp_fit[i] - inp_exp[i], 15, 5)
+                    + '  ' + ('Pre' if skip_mask[i] else 'Fit') + '\n')
+         f.write('  Normal termination' + '\n')
+
+    return()
+
+
+# ---------------------
+
+def write_best_matrix(MatrixOutFile     , title           , normalization_flag ,
+                      shift_flag        , skipped_systems , no_of_systems      ,
+                      no_of_electronics , no_of_sterics   , system_tags        ,
+                      experimental_tag  , experimental_data , electronic_tags  ,
+                      electronic_descriptors , rv         , rr                 ,
+                      buried_volumes    , point           ):
+
+  # writes the matrix with the best grid point only, as MLR.x does for Iwrite = 1.
+  # buried_volumes is the full grid as returned by read_matrix.
+  # ---------------------
+
+    volumes = unpack_buried_volumes(buried_volumes, no_of_systems, no_of_sterics)[point]
+    no_of_skipped = len(skipped_ids(skipped_systems))
+
+    with open(MatrixOutFile, "w") as f:
+         f.write("{:200s}".format(title[:200]) + '\n')
+         f.write('  0' + '\n')
+         f.write("{:12d}".format(normalization_flag) + '\n')
+         f.write("{:12d}".format(shift_flag) + '\n')
+         f.write("{:12d}".format(no_of_skipped)
+                + "".join(["{:12d}".format(i+1) for i in skipped_ids(skipped_systems)]) + '\n')
+         f.write("{:12d}".format(no_of_systems) + '\n')
+         f.write("{:12d}".format(no_of_electronics) + '\n')
+         f.write("{:12d}".format(no_of_sterics) + '\n')
+         f.write(' 1' + '\n')
+         f.write(' '*12 + " ".join(["{:12s}".format(t[:12]) for t in system_tags]) + '\n')
+         f.write("{:12s}".format(experimental_tag[:12])
+                + "".join([format_e(x, 15, 6) for x in experimental_data]) + '\n')
+         for e in range(no_of_electronics):
+             f.write("{:12s}".format(electronic_tags[e][:12])
+                    + "".join([format_e(x, 15, 6) for x in electronic_descriptors[e]]) + '\n')
+         f.write("{:6.2f}".format(rv) + "{:6.2f}".format(rr)
+                + "".join(["{:8.3f}".format(x) for x in volumes.ravel()]) + '\n')
+
+    return()
+
+
+# ---------------------
+
+def best_matrix(title             , normalization_flag , shift_flag        ,
+                skipped_systems   , no_of_systems      , no_of_electronics ,
+                no_of_sterics     , system_tags        , experimental_tag  ,
+                experimental_data , electronic_tags    , electronic_descriptors ,
+                rv                , rr                 , buried_volumes    ,
+                point             ):
+
+  # returns the matrix written by write_best_matrix, as read back by read_matrix,
+  # to pass it to the following tests without writing the Rm- matrix file.
+  # ---------------------
+
+    volumes = unpack_buried_volumes(buried_volumes, no_of_systems, no_of_sterics)[point]
+    skipped = [len(skipped_ids(skipped_systems))] + [i+1 for i in skipped_ids(skipped_systems)]
+
+    return (title[:200].strip()   , 0                  , normalization_flag ,
+            shift_flag            , np.array(skipped)  , no_of_systems      ,
+            no_of_electronics     , no_of_sterics      , 1                  ,
+            [t[:12] for t in system_tags]              , experimental_tag[:12] ,
+            round_significant(experimental_data, 6)    , [t[:12] for t in electronic_tags] ,
+            round_significant(electronic_descriptors, 6).reshape((no_of_electronics, no_of_systems)) ,
+            round_decimals([rv], 2)                    , round_decimals([rr], 2) ,
+            round_decimals(volumes.reshape((1, no_of_sterics*no_of_systems)), 3))
+
+
+# ---------------------
+
+def run_mlr_file(MatrixFile, OutputFile):
+
+  # drop-in replacement for "MLR.x MatrixFile > OutputFile": reads the matrix,
+  # runs the engine, writes the output and, if print_flag == 1, the Rm- matrix
+  # with the best grid point only.
+
+    title             , print_flag             , normalization_flag   , \
+    shift_flag        , skipped_systems        , no_of_systems        , \
+    no_of_electronics , no_of_sterics          , no_of_buried_volumes , \
+    system_tags       , experimental_tag       , experimental_data    , \
+    electronic_tags   , electronic_descriptors , radius_proximal      , \
+    radius_distal     , buried_volumes         = read_matrix(MatrixFile)
+
+    R2, point, rv, rr, coefficients, fitted, experiments, exp_av, exp_sd = run_mlr_cached(
+        normalization_flag , shift_flag             , skipped_systems ,
+        no_of_systems      , no_of_sterics          , experimental_data ,
+        electronic_descriptors , radius_proximal    , radius_distal ,
+        buried_volumes     )
+
+    write_mlr_output(OutputFile         , MatrixFile        , title             ,
+                     normalization_flag , shift_flag        , skipped_systems   ,
+                     no_of_systems      , no_of_electronics , no_of_sterics     ,
+                     system_tags        , R2                , rv                ,
+                     rr                 , coefficients      , fitted            ,
+                     experiments        , exp_av            , exp_sd            )
+
+    if print_flag == 1:
+       write_best_matrix("Rm-" + MatrixFile , title           , normalization_flag ,
+                         shift_flag         , skipped_systems , no_of_systems      ,
+                         no_of_electronics  , no_of_sterics   , system_tags        ,
+                         experimental_tag   , experimental_data , electronic_tags  ,
+                         electronic_descriptors , rv          , rr                 ,
+                         buried_volumes     , point           )
+
+    return()
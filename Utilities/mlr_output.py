@@ -0,0 +1,139 @@
+#!/usr/bin/env python3 -B
+
+""" ---------------------------------------------------------------------------
+
+Parser of the full output of Fortran/MLR.x, and of the MLR.x-like output
+written by write_mlr_output of the numpy engine. The output is read line by
+line, without loading the whole file, i.e. the NP lines of the steric grid,
+and the sections used by the test drivers are returned in a dictionary.
+
+Sections asked in required must be found in the output, otherwise the run
+stops with an error, as for an MLR.x run that did not end normally.
+
+To be used as:
+   from Utilities.mlr_output import *
+
+   output = read_mlr_output(OutputFile, required = ("counts", "max_r2", "table"))
+
+Sections:
+   counts      := no_of_systems, no_of_sterics, no_of_electronics, no_of_skipped
+   max_r2      := R2, rv, rr and coefficients of the Max R2 line, as strings
+                  with the digits written by MLR.x
+   grubbs      := (ids, values) of the Fit lines, values with columns normalized
+                  experimental, fitted and error, input experimental, fitted
+                  and error, Grubbs test
+   loo         := (ids, values) of the LOO lines, values with columns as in the
+                  Fit lines, without the Grubbs test
+   table       := (tags, values, kinds) of the final table, one row per system
+                  in input order, values as in the LOO lines, kinds Fit or Pre
+   termination := True if the output ends with Normal termination
+
+ids and values are numpy arrays, tags and kinds lists. Only the text of the values is kept while
+reading, and it is converted at once at the end of each section.
+
+@author: Zhen Cao, Luigi Cavallo
+--------------------------------------------------------------------------- """
+
+import numpy as np
+
+from Utilities.matrix_operation import read_values
+from Utilities.profiling import profiled
+
+
+# header lines with the counters, as written by MLR.x
+
+COUNTERS = {"Number of systems"                : "no_of_systems"    ,
+            "Number of Steric descriptors"     : "no_of_sterics"    ,
+            "Number of Electronic descriptors" : "no_of_electronics",
+            "Number of system to be skipped"   : "no_of_skipped"    }
+
+
+# kinds of the rows of the final table, one string object shared by all rows
+
+KINDS = {"Fit": "Fit", "Pre": "Pre"}
+
+
+# ---------------------
+
+@profiled("output parsing")
+def read_mlr_output(OutputFile, required = ("counts", "max_r2", "table", "termination")):
+
+  # reads the sections of the MLR.x output in OutputFile
+
+  # Input:
+    # OutputFile := MLR.x output, e.g. myfile.mlr_out
+    # required   := sections that must be found in OutputFile
+
+  # Output:
+    # dictionary with the sections found, see above
+  # ---------------------
+
+    counts = {}
+    output = {"counts": counts}
+    rows   = {"grubbs": ([], []), "loo": ([], [])}
+    table  = ([], [], [])
+
+    with open(OutputFile, "r") as f:
+         for line in f:
+
+             if line.startswith("Max R2"):
+                words = line.split()
+                output["max_r2"] = (words[2], words[3], words[4], words[5:])
+
+             elif line.startswith("Fit ") or line.startswith("LOO "):
+                ids, values = rows["grubbs" if line[0] == "F" else "loo"]
+                words = line.split(None, 2)
+                ids.append(int(words[1]))
+                values.append(words[2])
+
+           # final table, (i3,3x,a12,1x,6e15.5,2x,a3), read from the end of the
+           # line, the No of the system may not fit in i3
+
+             elif line[-4:-1] in KINDS and line[-6:-4] == "  ":
+                table[0].append(line[-109:-97].strip())
+                table[1].append(line[-96:-6])
+                table[2].append(KINDS[line[-4:-1]])
+
+             elif line.startswith("  Number of"):
+                name, value = line.split(":")[:2]
+                if name.strip() in COUNTERS:
+                   counts[COUNTERS[name.strip()]] = value.split()[0]
+
+             elif "Normal termination" in line:
+                output["termination"] = True
+
+    output["grubbs"] = (np.array(rows["grubbs"][0], dtype=int), read_values(rows["grubbs"][1], 7))
+    output["loo"]    = (np.array(rows["loo"][0], dtype=int), read_values(rows["loo"][1], 6))
+    output["table"]  = (table[0], read_values(table[1], 6), table[2])
+
+    check_sections(OutputFile, output, required)
+
+    return output
+
+
+# ---------------------
+
+def check_sections(OutputFile, output, required):
+
+  # stops with an error if a required section is missing or not complete
+
+    found = {"counts"     : all(name in output["counts"] for name in COUNTERS.values()),
+             "max_r2"     : "max_r2" in output,
+             "grubbs"     : len(output["grubbs"][0]) > 0,
+             "loo"        : len(output["loo"][0]) > 0,
+             "table"      : len(output["table"][0]) > 0,
+             "termination": output.get("termination", False)}
+
+    for section in required:
+        if not found[section]:
+           print(' Error: section ' + section + ' not found in MLR output ' + OutputFile)
+           exit(1)
+
+    if "table" in required and "counts" in required:
+       if len(output["table"][0]) != int(output["counts"]["no_of_systems"]):
+          print(' Error: ' + str(len(output["table"][0])) + ' systems in the final table of '
+                + OutputFile + ', ' + output["counts"]["no_of_systems"] + ' expected')
+          exit()
+
+    return()
+
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3 -B
+
+""" ---------------------------------------------------------------------------
+
+Client of the server mode of Fortran/MLR.x. The server reads the matrix once
+and then runs one MLR job per request, each job being the matrix with a set
+of skipped systems, an optional row map (bootstrap bags) and an optional
+permutation of the experimental data (y-randomization shuffles). This avoids
+starting MLR.x and writing a scratch matrix for every LOO fold, shuffle or
+bag. Results are those of MLR.x run on the scratch matrix of the job.
+
+In quiet mode, MLR.x runs the matrix as it is, with its own skipped systems,
+and writes the record of this single job instead of the full output.
+
+Servers are kept open and reused by later jobs on the same matrix in the same
+process, also by worker processes of Utilities/parallel.py. They are stopped
+by stop_servers, or when their process ends.
+
+To be used as:
+   from Utilities.mlr_server import *
+
+   server = get_server(MLRBinary, MatrixFile)
+   R2, point, rv, rr, coefficients, experiments, fitted, fitted_data = \
+       run_job(server, skipped_systems, rows, exp_rows)
+   ...
+   stop_servers()
+
+   R2, point, rv, rr, coefficients, experiments, fitted, fitted_data = \
+       run_quiet(MLRBinary, MatrixFile)
+
+skipped_systems is in the format of read_matrix, [No of skipped, id1, id2 ...],
+with 1-based ids of the rows of the job. rows and exp_rows are 0-based indices
+of the systems of the matrix, None for all systems in input order.
+
+Values are given back as strings, with the digits written by MLR.x in the
+Max R2, LOO and Fit/Pre lines, so that they can be parsed as from the MLR.x
+output:
+   R2           := R2 at the best grid point, as in the Max R2 line
+   point        := 1-based index of the best grid point
+   rv, rr       := radii of the best grid point
+   coefficients := MLR coefficients
+   experiments  := normalized experimental data, one per row, as in the LOO line
+   fitted       := normalized fitted values, one per row, as in the LOO line
+   fitted_data  := fitted values in input units, one per row, as in the Fit/Pre lines
+
+@author: Zhen Cao, Luigi Cavallo
+--------------------------------------------------------------------------- """
+
+import itertools
+import os
+import subprocess
+
+from Utilities.profiling import span, profiled, profiling, count
+
+
+# servers open in this process, by MLR.x binary and matrix file
+
+SERVERS = {}
+
+
+# ---------------------
+
+def start_server(MLRBinary, MatrixFile):
+
+  # starts MLR.x in server mode on MatrixFile. With profiling, the No of grid
+  # points of the matrix is kept to count the points scanned by each job
+
+    server = subprocess.Popen([MLRBinary, MatrixFile, "server"],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    server.no_of_points = grid_points(MatrixFile) if profiling() else 0
+
+    return server
+
+
+# ---------------------
+
+def grid_points(MatrixFile):
+
+  # No of buried volume rows, from the 9th line of the matrix header
+
+    with open(MatrixFile, "r") as f:
+         return int(list(itertools.islice(f, 9))[8])
+
+
+# ---------------------
+
+def stop_server(server):
+
+  # closes the job stream, MLR.x ends at end of file
+
+    server.stdin.close()
+    server.wait()
+    server.stdout.close()
+
+    return()
+
+
+# ---------------------
+
+def stop_servers():
+
+  # stops all servers open in this process
+
+    for key in list(SERVERS):
+        stop_server(SERVERS.pop(key))
+
+    return()
+
+
+# ---------------------
+
+def get_server(MLRBinary, MatrixFile):
+
+  # returns the server running on MatrixFile in this process, starting it at
+  # the first call. A matrix file written again gets a new server.
+
+    info = os.stat(MatrixFile)
+    key  = (MLRBinary, os.path.abspath(MatrixFile), info.st_mtime_ns, info.st_size)
+
+    if key not in SERVERS or SERVERS[key].poll() is not None:
+       SERVERS[key] = start_server(MLRBinary, MatrixFile)
+
+    return SERVERS[key]
+
+
+# ---------------------
+
+def format_list(indices):
+
+  # job line: No of indices followed by the indices
+
+    return " ".join([str(len(indices))] + [str(i) for i in indices]) + "\n"
+
+
+# ---------------------
+
+def run_job(server, skipped_systems, rows=None, exp_rows=None):
+
+  # runs one MLR job on the server, and returns its results as strings
+
+  # Input:
+    # server          := MLR.x process, from get_server
+    # skipped_systems := [No of skipped, id1, id2 ...], 1-based ids of job rows
+    # rows            := 0-based input system of each row of the job matrix
+    # exp_rows        := 0-based input system whose experimental value goes in each row
+
+  # Output:
+    # R2, point, rv, rr, coefficients, experiments, fitted, fitted_data
+  # ---------------------
+
+    skipped  = [int(i) for i in skipped_systems[1:1+int(skipped_systems[0])]]
+    rows     = [] if rows is None else [int(i)+1 for i in rows]
+    exp_rows = [] if exp_rows is None else [int(i)+1 for i in exp_rows]
+
+    with span("solver", "MLR.x server"):
+         server.stdin.write(format_list(skipped) + format_list(rows) + format_list(exp_rows))
+         server.stdin.flush()
+         line = server.stdout.readline()
+
+    count("fits")
+    count("grid points", server.no_of_points)
+
+    return parse_record(line)
+
+
+# ---------------------
+
+def run_quiet(MLRBinary, MatrixFile):
+
+  # runs MLR.x in quiet mode on MatrixFile, and returns its results as strings
+
+    with span("solver", "MLR.x quiet"):
+         run = subprocess.run([MLRBinary, MatrixFile, "quiet"], stdout=subprocess.PIPE, text=True)
+
+    if profiling():
+       count("fits")
+       count("grid points", grid_points(MatrixFile))
+
+    return parse_record(run.stdout)
+
+
+# ---------------------
+
+@profiled("output parsing")
+def parse_record(line):
+
+  # splits the result record of a job written by MLR.x in server or quiet mode
+
+    if not line:
+       print(' Error: no result from MLR.x, check that MLR.x was compiled with Fortran/link.sh')
+       exit()
+
+    words = line.split()
+    if words[0] != "MLR":
+       print(' Error: MLR.x, job ' + words[1] + ': ' + " ".join(words[2:]))
+       exit(1)
+
+    point, no_of_coef = int(words[2]), int(words[4])
+    R2, rv, rr   = words[5], words[6], words[7]
+    coefficients = words[8:8+no_of_coef]
+    values       = words[8+no_of_coef:]
+
+    return (R2, point, rv, rr, coefficients, values[0::3], values[1::3], values[2::3])
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3 -B
+
+""" ---------------------------------------------------------------------------
+
+Runs independent cycles of a test, i.e. bootstrap or optimization cycles,
+on a pool of worker processes. Results are given back in cycle order, so
+that output files do not depend on the number of workers.
+
+To be used as:
+   from Utilities.parallel import *
+
+   results = map_cycles(function, cycles, no_of_jobs)
+
+function must be defined at module level, so that worker processes can
+import it. Use functools.partial to pass the data shared by all cycles.
+
+run_stages runs the tests of runtests.py as a dependency graph built from
+the files each test reads and writes, with independent tests running at
+the same time:
+
+   times, dependencies, codes = run_stages(stages, no_of_workers)
+   print_stage_times(stages, times, dependencies, codes)
+
+Stages whose dependencies failed are skipped, codes gives the exit code of
+each stage, None if skipped.
+
+@author: Zhen Cao, Luigi Cavallo
+--------------------------------------------------------------------------- """
+
+import concurrent.futures
+import multiprocessing
+import os
+import subprocess
+import time
+
+
+# ---------------------
+
+def map_cycles(function, cycles, no_of_jobs=1):
+
+  # runs function on every element of cycles, with no_of_jobs worker processes.
+  # With no_of_jobs = 1 all cycles are run in this process.
+
+  # Input:
+    # function   := function of a single argument, an element of cycles
+    # cycles     := list of arguments, one per cycle
+    # no_of_jobs := number of worker processes
+
+  # Output:
+    # results    := list with the value returned by function for each cycle,
+    #               in the order of cycles
+  # ---------------------
+
+    cycles = list(cycles)
+
+    if no_of_jobs <= 1 or len(cycles) <= 1:
+       return [function(c) for c in cycles]
+
+    with multiprocessing.Pool(min(no_of_jobs, len(cycles))) as pool:
+         results = pool.map(function, cycles)
+
+    return results
+
+
+# ---------------------
+
+def split_cycles(no_of_cycles, no_of_jobs):
+
+  # splits cycles 0..no_of_cycles-1 into no_of_jobs contiguous blocks of
+  # nearly equal size, for workers solving many cycles at once
+
+    size   = no_of_cycles // no_of_jobs
+    extra  = no_of_cycles %  no_of_jobs
+    blocks = []
+
+    start = 0
+    for j in range(no_of_jobs):
+        end = start + size + (1 if j < extra else 0)
+        if end > start:
+           blocks.append(range(start, end))
+        start = end
+
+    return blocks
+
+
+# ---------------------
+
+def stage_dependencies(stages):
+
+  # returns, for each stage, the list of earlier stages it has to wait for:
+  # those writing a file it reads or writes, and those reading a file it writes.
+  # Stages sharing scratch files are thus run one after the other, in the order
+  # they are given.
+
+    dependencies = []
+    for s, stage in enumerate(stages):
+        inputs  = set(stage["inputs"])
+        outputs = set(stage["outputs"])
+        dependencies.append([r for r in range(s)
+                             if (set(stages[r]["outputs"]) & (inputs | outputs))
+                             or (set(stages[r]["inputs"]) & outputs)])
+
+    return dependencies
+
+
+# ---------------------
+
+def run_stage(stage, capture=False):
+
+  # runs the commands of a stage one after the other, stopping at the first
+  # command that fails. With capture, output of the commands is collected and
+  # given back, instead of being printed.
+  # Commands are run in the directory of the stage, if given, and the stage
+  # name is passed to them in COBRA_STAGE, for profiling.
+
+  # Output:
+    # begin, end := wall clock time of the stage
+    # output     := output of the commands, with capture
+    # code       := exit code of the stage, that of the command that failed or 0
+  # ---------------------
+
+    output = []
+    code   = 0
+    begin  = time.time()
+    env    = dict(os.environ, COBRA_STAGE=stage["name"])
+
+    for command in stage["commands"]:
+        if capture:
+           run = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                                env=env, cwd=stage.get("cwd"))
+           output.append(run.stdout)
+        else:
+           run = subprocess.run(command, env=env, cwd=stage.get("cwd"))
+
+        if run.returncode != 0:
+           code = run.returncode
+           break
+
+    return (begin, time.time(), "".join(output), code)
+
+
+# ---------------------
+
+def run_stages(stages, no_of_workers=1):
+
+  # runs stages as a dependency graph, starting each stage as soon as the stages
+  # it depends on are done, with at most no_of_workers stages running at once.
+  # With more than one worker, output of each stage is printed when it ends.
+  # Stages depending on a stage that failed, or was skipped, are not run: they
+  # would read missing or stale files. The other stages go on.
+
+  # Input:
+    # stages        := list of dictionaries with keys
+    #                  name     - label of the stage
+    #                  commands - list of commands, each one a list for subprocess.run
+    #                  inputs   - files read by the stage
+    #                  outputs  - files written by the stage, scratch files included
+    #                  cwd      - optional, directory where commands are run
+    # no_of_workers := maximum number of stages running at once
+
+  # Output:
+    # times         := (begin, end) wall clock time of each stage, begin = end
+    #                  for skipped stages
+    # dependencies  := stages each stage waited for, from stage_dependencies
+    # codes         := exit code of each stage, None for skipped stages
+  # ---------------------
+
+    dependencies = stage_dependencies(stages)
+    capture      = no_of_workers > 1
+    times        = [None]*len(stages)
+    codes        = [None]*len(stages)
+    pending      = list(range(len(stages)))
+    running      = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=no_of_workers) as pool:
+         while pending or running:
+
+             for s in list(pending):
+                 if not all(times[r] is not None for r in dependencies[s]):
+                    continue
+                 if any(codes[r] != 0 for r in dependencies[s]):
+                    print(' Skipping ' + stages[s]["name"] + ', a stage it depends on failed', flush=True)
+                    times[s] = (time.time(), time.time())
+                    pending.remove(s)
+                 elif len(running) < no_of_workers:
+                    print(' Running ' + stages[s]["name"] + '...', flush=True)
+                    running[pool.submit(run_stage, stages[s], capture)] = s
+                    pending.remove(s)
+
+             if not running:
+                continue
+
+             done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+             for future in done:
+                 s = running.pop(future)
+                 begin, end, output, codes[s] = future.result()
+                 times[s] = (begin, end)
+                 print(output, end='', flush=True)
+                 if codes[s] != 0:
+                    print(' Error:  stage ' + stages[s]["name"] + ' failed with exit code '
+                          + str(codes[s]), flush=True)
+
+    return (times, dependencies, codes)
+
+
+# ---------------------
+
+def print_stage_times(stages, times, dependencies, codes):
+
+  # prints wall time and status of each stage, the critical path, i.e. the chain
+  # of stages, each one waiting for the previous, that ends with the last stage,
+  # and the stages that failed or were skipped
+
+    start = min(t[0] for t in times)
+
+    print('')
+    print(' Stage                    Start     Wall')
+    for s, stage in enumerate(stages):
+        print(' ' + "{:20s}".format(stage["name"])
+                  + "{:10.2f}".format(times[s][0] - start)
+                  + "{:9.2f}".format(times[s][1] - times[s][0])
+                  + ('' if codes[s] == 0 else '   skipped' if codes[s] is None
+                                         else '   failed, exit code ' + str(codes[s])))
+
+    path = [max(range(len(stages)), key=lambda s: times[s][1])]
+    while dependencies[path[-1]]:
+        path.append(max(dependencies[path[-1]], key=lambda r: times[r][1]))
+
+    print(' Critical path: ' + ' -> '.join([stages[s]["name"] for s in path[::-1]]))
+    print(' Total wall time ' + "{:9.2f}".format(max(t[1] for t in times) - start))
+
+    print_failed_stages(stages, codes)
+
+    return()
+
+
+# ---------------------
+
+def print_failed_stages(stages, codes):
+
+  # prints the stages that failed and those skipped, and returns True if any
+
+    failed  = [stages[s]["name"] for s in range(len(stages)) if codes[s] not in (0, None)]
+    skipped = [stages[s]["name"] for s in range(len(stages)) if codes[s] is None]
+
+    if failed:
+       print(' Failed stages: '  + ', '.join(failed))
+    if skipped:
+       print(' Skipped stages: ' + ', '.join(skipped))
+
+    return bool(failed or skipped)
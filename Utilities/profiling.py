@@ -0,0 +1,307 @@
+#!/usr/bin/env python3 -B
+
+""" ---------------------------------------------------------------------------
+
+Opt-in profiling of the tests. When the environment variable COBRA_PROFILE is
+set, e.g. by runtests.py -p/--profile, the drivers record the time spent in
+each stage, each cycle, matrix assembly, matrix read and write, solver runs,
+output parsing and analysis, together with counters such as the number of
+fits and of grid points scanned. Without COBRA_PROFILE nothing is recorded.
+
+Events are written in the Chrome trace format, one file per process, named as
+the trace file followed by the process id, so that tests run as subprocesses
+and worker processes can write at the same time. merge_trace collects them
+in the trace file, e.g. myfile.trace.json next to myfile.info, with a summary
+of time and counters per stage and category in otherData. The trace can be
+opened in chrome://tracing or https://ui.perfetto.dev
+
+COBRA_PROFILE is the path of the trace file, or 1 for cobra.trace.json in
+the current directory. COBRA_STAGE names the stage of a test run as a
+subprocess, it is set by run_stages of parallel.py.
+
+To be used as:
+   from Utilities.profiling import *
+
+   @profiled("analysis")
+   def analysis_boot_r2(...):
+
+   with span("cycle", cycle = b):
+        ...
+
+   count("fits", 1)
+
+and from the command line, to merge the files of a run:
+   python Utilities/profiling.py -t myfile.trace.json
+
+Durations of spans include those of the spans nested in them. The summary
+gives both the total time of each category and its self time, without the
+nested spans. Spans nested in a span of the same category are not recorded.
+
+@author: Zhen Cao, Luigi Cavallo
+--------------------------------------------------------------------------- """
+
+import argparse
+import contextlib
+import functools
+import glob
+import json
+import os
+import sys
+import threading
+import time
+
+
+# trace file of this run, None when profiling is off
+
+PROFILE = os.environ.get("COBRA_PROFILE", "")
+
+if PROFILE in ("", "0"):
+   TRACE_FILE = None
+elif PROFILE == "1":
+   TRACE_FILE = os.path.abspath("cobra.trace.json")
+else:
+   TRACE_FILE = os.path.abspath(PROFILE)
+
+
+# state of this process: events file, current stage, open categories, counters
+
+STATE = {"file": None, "pid": None, "stage": os.environ.get("COBRA_STAGE", ""),
+         "open": set(), "counters": {}}
+
+
+# ---------------------
+
+def profiling():
+
+  # True if profiling is on
+
+    return TRACE_FILE is not None
+
+
+# ---------------------
+
+def now():
+
+  # wall clock time in microseconds, the same in all processes
+
+    return time.time_ns() // 1000
+
+
+# ---------------------
+
+def write_event(event):
+
+  # appends an event to the events file of this process. The file is opened at
+  # the first event, and again in processes forked after it, e.g. pool workers.
+  # Lines are flushed at once, worker processes may end without cleanup
+
+    pid = os.getpid()
+    if STATE["pid"] != pid:
+       STATE["pid"]  = pid
+       STATE["file"] = open(TRACE_FILE + "." + str(pid), "a", buffering=1)
+       STATE["file"].write(json.dumps({"name": "process_name", "ph": "M", "pid": pid,
+                                       "args": {"name": " ".join([os.path.basename(sys.argv[0])] + sys.argv[1:])}}) + "\n")
+
+    event["pid"] = pid
+    STATE["file"].write(json.dumps(event) + "\n")
+
+    return()
+
+
+# ---------------------
+
+def record_span(name, category, begin, end, **values):
+
+  # writes a complete event, begin and end in microseconds, of the current
+  # stage unless given in values
+
+    if TRACE_FILE is None:
+       return()
+
+    values.setdefault("stage", STATE["stage"])
+    write_event({"name": name, "cat": category, "ph": "X", "ts": begin, "dur": end - begin,
+                 "tid": threading.get_native_id(), "args": values})
+
+    return()
+
+
+# ---------------------
+
+@contextlib.contextmanager
+def span(category, name=None, **values):
+
+  # times the block of a with statement. Spans of category stage also set the
+  # stage of the events recorded in the block
+
+    if TRACE_FILE is None or category in STATE["open"]:
+       yield
+       return
+
+    stage = STATE["stage"]
+    if category == "stage":
+       STATE["stage"] = name
+
+    STATE["open"].add(category)
+    begin = now()
+    try:
+       yield
+    finally:
+       record_span(name if name else category, category, begin, now(), **values)
+       STATE["open"].discard(category)
+       STATE["stage"] = stage
+
+
+# ---------------------
+
+def start_profiling(TraceFile):
+
+  # turns profiling on, in this process and in the processes it starts, with
+  # events collected in TraceFile. Files of a previous run are removed
+
+    global TRACE_FILE
+
+    TRACE_FILE = os.path.abspath(TraceFile)
+    os.environ["COBRA_PROFILE"] = TRACE_FILE
+
+    for OldFile in [TRACE_FILE] + glob.glob(glob.escape(TRACE_FILE) + ".*"):
+        if os.path.exists(OldFile):
+           os.remove(OldFile)
+
+    return()
+
+
+# ---------------------
+
+def profiled(category):
+
+  # decorator timing every call of a function as a span of category
+
+    def decorator(function):
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if TRACE_FILE is None:
+               return function(*args, **kwargs)
+            with span(category, function.__name__):
+                 return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# ---------------------
+
+def count(name, value=1):
+
+  # adds value to a counter of the current stage. Counters are kept by process,
+  # so that processes forked by this one, e.g. pool workers, start from zero
+
+    if TRACE_FILE is None:
+       return()
+
+    key = (os.getpid(), STATE["stage"], name)
+    STATE["counters"][key] = STATE["counters"].get(key, 0) + value
+    write_event({"name": name, "cat": STATE["stage"], "ph": "C", "ts": now(),
+                 "args": {name: STATE["counters"][key]}})
+
+    return()
+
+
+# ---------------------
+
+def summarize(events):
+
+  # total and self time of each category, and counters, per stage
+
+    summary = {}
+    spans   = sorted([e for e in events if e["ph"] == "X"],
+                     key=lambda e: (e["pid"], e["tid"], e["ts"], -e["dur"]))
+
+
+  # self time: duration minus that of the direct children, found with a stack
+  # of the spans open on each thread
+
+    stack = []
+    for event in spans:
+        while stack and (stack[-1]["pid"], stack[-1]["tid"]) == (event["pid"], event["tid"]) \
+              and stack[-1]["ts"] + stack[-1]["dur"] <= event["ts"]:
+              stack.pop()
+        if stack and (stack[-1]["pid"], stack[-1]["tid"]) != (event["pid"], event["tid"]):
+           stack = []
+
+        event["self"] = event["dur"]
+        if stack:
+           stack[-1]["self"] -= event["dur"]
+        stack.append(event)
+
+    for event in spans:
+        stage = event["args"].get("stage", "") or "(none)"
+        entry = summary.setdefault(stage, {"time": {}, "counters": {}}) \
+                       ["time"].setdefault(event["cat"], {"count": 0, "total_s": 0.0, "self_s": 0.0})
+        entry["count"]   += 1
+        entry["total_s"] += event["dur"] / 1.0e6
+        entry["self_s"]  += event["self"] / 1.0e6
+        del event["self"]
+
+
+  # counters are cumulative in each process, take the last value of each one
+
+    last = {}
+    for event in events:
+        if event["ph"] == "C":
+           last[(event["pid"], event["cat"], event["name"])] = event["args"][event["name"]]
+
+    for (pid, stage, name), value in last.items():
+        counters = summary.setdefault(stage or "(none)", {"time": {}, "counters": {}})["counters"]
+        counters[name] = counters.get(name, 0) + value
+
+    return summary
+
+
+# ---------------------
+
+def merge_trace(TraceFile):
+
+  # collects the events files of all processes in TraceFile, with the summary,
+  # and removes them
+
+    events = []
+    for PartFile in sorted(glob.glob(glob.escape(TraceFile) + ".*")):
+        if not PartFile[len(TraceFile)+1:].isdigit():
+           continue
+        with open(PartFile, "r") as f:
+             events += [json.loads(line) for line in f if line.strip()]
+        os.remove(PartFile)
+
+    if os.path.exists(TraceFile):
+       with open(TraceFile, "r") as f:
+            events = json.load(f)["traceEvents"] + events
+
+    with open(TraceFile, "w") as f:
+         json.dump({"traceEvents"    : events,
+                    "displayTimeUnit": "ms",
+                    "otherData"      : {"summary": summarize(events)}}, f)
+
+    return()
+
+
+# ---------------------
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-t", "--trace", help = "Missing trace file")
+    args = parser.parse_args()
+
+    if not args.trace:
+       print(' Usage:  profiling.py -t/--trace myfile.trace.json')
+       exit()
+
+    merge_trace(args.trace)
+
+    return()
+
+
+if __name__ == '__main__':
+    main()
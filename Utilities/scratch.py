@@ -0,0 +1,119 @@
+#!/usr/bin/env python3 -B
+
+""" ---------------------------------------------------------------------------
+
+Scratch files of the tests. Each run gets its own scratch directory, with a
+unique name, so that tests, stages and datasets can run at the same time in
+the same directory without overwriting each other's temporary files, e.g.
+the matrix written for the MLR.x servers. The directory and all the files in
+it are removed at the end of the with statement, also on errors, exit() and
+SIGTERM, e.g. when a run is stopped with kill.
+
+Scratch directories are made in the directory given by the environment
+variable COBRA_SCRATCH, if set, otherwise in /dev/shm when available, i.e. in
+memory, otherwise in the default temporary directory of the system.
+
+To be used as:
+   from Utilities.scratch import *
+
+   with scratch_file("myfile.tmp") as TempFile:
+        write_matrix(TempFile, ...)
+        ...
+
+   with scratch_directory() as ScratchDir:
+        ...
+
+Processes forked in the with statement, e.g. pool workers, can use the files,
+only the process that made the directory removes it.
+
+@author: Zhen Cao, Luigi Cavallo
+--------------------------------------------------------------------------- """
+
+import contextlib
+import os
+import shutil
+import signal
+import tempfile
+import threading
+
+
+# ---------------------
+
+def scratch_root():
+
+  # directory where scratch directories are made
+
+    root = os.environ.get("COBRA_SCRATCH", "")
+    if root:
+       return root
+
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK | os.X_OK):
+       return "/dev/shm"
+
+    return tempfile.gettempdir()
+
+
+# ---------------------
+
+def stop_on_sigterm(signum, frame):
+
+  # SIGTERM handler, turns the signal in SystemExit so that finally blocks,
+  # and then the removal of scratch directories, are run
+
+    raise SystemExit(128 + signum)
+
+
+# ---------------------
+
+@contextlib.contextmanager
+def scratch_directory(prefix="cobra-"):
+
+  # makes a new scratch directory, removed with its files at the end of the
+  # with statement
+
+  # Input:
+    # prefix     := start of the name of the directory
+
+  # Output:
+    # ScratchDir := path of the directory
+  # ---------------------
+
+    pid        = os.getpid()
+    ScratchDir = tempfile.mkdtemp(prefix=prefix, dir=scratch_root())
+
+
+  # SIGTERM stops the process without cleanup, unless handled. Signal handlers
+  # can be set in the main thread only, and are left alone if set by others
+
+    handler = None
+    if threading.current_thread() is threading.main_thread() \
+       and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+       handler = signal.signal(signal.SIGTERM, stop_on_sigterm)
+
+    try:
+       yield ScratchDir
+    finally:
+       if os.getpid() == pid:
+          if handler is not None:
+             signal.signal(signal.SIGTERM, handler)
+          shutil.rmtree(ScratchDir, ignore_errors=True)
+
+
+# ---------------------
+
+@contextlib.contextmanager
+def scratch_file(FileName):
+
+  # path of a file with the name of FileName in a new scratch directory. The
+  # file is not created, the directory is removed at the end of the with
+  # statement
+
+  # Input:
+    # FileName := name of the file, only the name is kept, not the directory
+
+  # Output:
+    # TempFile := path of the file in the scratch directory
+  # ---------------------
+
+    with scratch_directory() as ScratchDir:
+         yield os.path.join(ScratchDir, os.path.basename(FileName))
@@ -1,3 +1,5 @@
+import os
+
 def GetVariables():
 
     PYTHONHOME = "/Users/cavalll/Desktop/MLR-Vbur/Sources/GitHub/cobra/" 
@@ -5,3 +7,10 @@ def GetVariables():
 
     return MLRBinary, PYTHONHOME
 
+
+def GetCacheVariables():
+
+    CACHEHOME = os.path.join(os.path.expanduser("~"), ".cache", "cobra")
+    CACHESIZE = 100
+
+    return CACHEHOME, CACHESIZE
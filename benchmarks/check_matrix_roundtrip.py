@@ -0,0 +1,157 @@
+#!/usr/bin/env python3 -B
+
+""" ---------------------------------------------------------------------------
+
+Round trip check of read_matrix/write_matrix on all the matrices of Examples.
+Each matrix is read and written back in text format, and read again: values
+must be the same, and the bytes of the output the same as the original, for
+all matrices but the Rm- ones written by MLR.x in its own format. The matrix
+is also written in binary format and read back, values must be the same as
+those read from the text file, and written back in text format it must have
+the same bytes as the text output.
+
+To be run as:
+   python benchmarks/check_matrix_roundtrip.py
+   python benchmarks/check_matrix_roundtrip.py -m Examples/case-02/case-02.matrix
+
+Input:
+   MatrixFiles : = Examples/**/*.matrix      Matrices to be checked
+
+Output:
+   exit code 0 if all matrices passed the check, 1 otherwise
+
+@author: Zhen Cao, Luigi Cavallo
+--------------------------------------------------------------------------- """
+
+import argparse
+import glob
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT)
+from Utilities.matrix_operation import *
+
+# matrices of the best grid point written by MLR.x, in the format of MLR.f
+MLR_MATRIX_PREFIX = "Rm-"
+
+
+# ---------------------
+
+def same_matrix(matrix, other):
+
+  # True if the two tuples returned by read_matrix have the same values
+
+    if len(matrix) != len(other):
+       return False
+
+    for value, other_value in zip(matrix, other):
+        if isinstance(value, (np.ndarray, list)):
+           if not np.array_equal(np.asarray(value), np.asarray(other_value)):
+              return False
+        elif value != other_value:
+           return False
+
+    return True
+
+
+# ---------------------
+
+def same_bytes(file_name, other_file_name):
+
+  # True if the two files have the same bytes
+
+    with open(file_name, "rb") as f:
+         content = f.read()
+    with open(other_file_name, "rb") as f:
+         return content == f.read()
+
+
+# ---------------------
+
+def check_matrix(MatrixFile, WorkDir):
+
+  # round trip of one matrix, returns the list of the failed checks
+
+  # Input:
+    # MatrixFile := text matrix file to be checked
+    # WorkDir    := directory where the matrices are written
+
+  # Output:
+    # failed     := names of the failed checks, empty if all passed
+  # ---------------------
+
+    failed         = []
+    TextFile       = os.path.join(WorkDir, "roundtrip.matrix")
+    BinaryFile     = os.path.join(WorkDir, "roundtrip.bin.matrix")
+    BinaryTextFile = os.path.join(WorkDir, "roundtrip.bin.txt.matrix")
+
+
+  # text round trip, same values, and same bytes as the original unless
+  # written by MLR.x
+
+    matrix = read_matrix(MatrixFile)
+    write_matrix(TextFile, *matrix)
+    if not same_matrix(matrix, read_matrix(TextFile)):
+       failed.append("text values")
+    if not os.path.basename(MatrixFile).startswith(MLR_MATRIX_PREFIX) \
+       and not same_bytes(MatrixFile, TextFile):
+       failed.append("text bytes")
+
+
+  # binary round trip, same values as the text matrix, and same bytes as the
+  # text output once written back as text
+
+    write_matrix(BinaryFile, *matrix, binary = True)
+    binary_matrix = read_matrix(BinaryFile)
+    if not same_matrix(matrix, binary_matrix):
+       failed.append("binary values")
+
+    write_matrix(BinaryTextFile, *binary_matrix)
+    del binary_matrix
+    if not same_bytes(TextFile, BinaryTextFile):
+       failed.append("binary to text bytes")
+
+
+    return failed
+
+
+# ---------------------
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-m", "--matrix", nargs = "*", default = None, help = "Matrices to be checked")
+    args = parser.parse_args()
+
+    MatrixFiles = args.matrix
+    if not MatrixFiles:
+       MatrixFiles = sorted(glob.glob(os.path.join(ROOT, "Examples", "**", "*.matrix"),
+                                      recursive = True))
+    if not MatrixFiles:
+       print(' Error:  no matrix found')
+       exit(1)
+
+    no_of_failed = 0
+    with tempfile.TemporaryDirectory(prefix = "cobra-roundtrip-") as WorkDir:
+         for MatrixFile in MatrixFiles:
+             failed = check_matrix(MatrixFile, WorkDir)
+             name   = os.path.relpath(MatrixFile, ROOT)
+             if failed:
+                no_of_failed += 1
+                print(' ' + "{:50s}".format(name) + ' FAILED: ' + ', '.join(failed))
+             else:
+                print(' ' + "{:50s}".format(name) + ' OK')
+
+    print(' ' + str(len(MatrixFiles) - no_of_failed) + ' of ' + str(len(MatrixFiles)) + ' matrices passed')
+    if no_of_failed:
+       exit(1)
+
+    return()
+
+
+if __name__ == '__main__':
+    main()
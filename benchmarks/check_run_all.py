@@ -0,0 +1,92 @@
+#!/usr/bin/env python3 -B
+
+""" ---------------------------------------------------------------------------
+
+Smoke run of the in-process pipeline, cobra.run_all, on one of the Examples
+with a few cycles. The matrix is copied in a temporary directory, all tests
+are run with the numpy engine, without the cache of fits, and the run fails
+if run_all stops or if the .pcs file does not have all the pcs metrics.
+
+To be run as:
+   python benchmarks/check_run_all.py -m case-02 -n 5
+
+Input:
+   dataset      : = case-02      Example run, Examples/case-02/case-02.matrix
+   no_of_cycles : = int          No of randomization/bootstrap/optimization cycles
+
+Output:
+   exit code 0 if the run completed, 1 otherwise
+
+@author: Zhen Cao, Luigi Cavallo
+--------------------------------------------------------------------------- """
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import traceback
+
+os.environ["COBRA_NO_CACHE"] = "1"
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT)
+import cobra
+from Tests.pcs import read_pcs, PCS_COLUMNS
+
+
+# ---------------------
+
+def check_run_all(dataset, no_of_cycles):
+
+  # runs cobra.run_all on the Example dataset in a temporary directory, and
+  # returns the pcs metrics, None if the run failed
+
+    MatrixPath = os.path.join(ROOT, "Examples", dataset, dataset + ".matrix")
+    if not os.path.exists(MatrixPath):
+       print(' Error:  ' + MatrixPath + ' not found')
+       exit(1)
+
+    CurrentDir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix = "cobra-check-") as WorkDir:
+         shutil.copy(MatrixPath, WorkDir)
+         os.chdir(WorkDir)
+         try:
+            cobra.run_all(dataset + ".matrix",
+                          {"no_of_cycles"        : no_of_cycles, "percentage_top_preds": 0.2,
+                           "percentage_bootstrap": 0.1,          "percentage_cycles"   : 0.2,
+                           "direction"           : "up",         "cutoff"              : 0.8})
+            metrics = read_pcs(dataset + ".pcs")
+         except Exception:
+            traceback.print_exc()
+            metrics = None
+         finally:
+            os.chdir(CurrentDir)
+
+    return metrics
+
+
+# ---------------------
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-m", "--matrix",       default = "case-02", help = "Example dataset")
+    parser.add_argument("-n", "--no_of_cycles", default = "5",       help = "No of cycles")
+    args = parser.parse_args()
+
+    metrics = check_run_all(args.matrix, int(args.no_of_cycles))
+
+    if metrics is None:
+       print(' run_all on ' + args.matrix + ': FAILED')
+       exit(1)
+
+    print(' run_all on ' + args.matrix + ': OK')
+    for name, value in zip(PCS_COLUMNS, metrics):
+        print('   ' + "{:10s}".format(name) + "{:8.3f}".format(value))
+
+    return()
+
+
+if __name__ == '__main__':
+    main()
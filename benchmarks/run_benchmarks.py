@@ -0,0 +1,511 @@
+#!/usr/bin/env python3 -B
+
+""" ---------------------------------------------------------------------------
+
+This script times each stage of the validation pipeline of runtests.py on the
+bundled Examples and on synthetic matrices of growing size, and records wall
+time, peak RSS and fits per second of each stage to a JSON file. Two JSON
+files can then be compared, to spot performance regressions.
+
+To be run as:
+   python benchmarks/run_benchmarks.py -o before.json
+   ... change the code ...
+   python benchmarks/run_benchmarks.py -o after.json
+   python benchmarks/run_benchmarks.py -c before.json after.json
+
+Input:
+   datasets       : = HQ-example,case-01   Examples benchmarked, default all of runall.sh
+   grow           : = 100,300              synthetic matrices with 100 and 300 systems,
+                                           from Utilities/matrix_generate.py
+   no_of_cycles   : = int                  No of randomization/bootstrap/optimization cycles
+   output_systems : = 100000               No of systems of the synthetic MLR output parsed
+
+Output:
+   OutputFile     : = benchmark.json       wall time, peak RSS, fits and fits/s of each
+                                           stage of each dataset, with the run parameters
+
+Stages are those declared by runtests.dataset_stages, with the parameters of
+Examples/runall.sh, run one after the other, each one in its own process, as
+in runtests.py with -s 1. The first two stages time read_matrix and
+write_matrix alone. The parsing of a synthetic output of write_mlr_output is
+timed with the readlines parsing of the drivers before Utilities/mlr_output.py
+and with read_mlr_output, as dataset output-N. Peak RSS is the largest
+resident set of the stage process and of the processes it started, e.g. MLR.x.
+
+@author: Zhen Cao, Luigi Cavallo
+--------------------------------------------------------------------------- """
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from Utilities.set_variables import *
+from Utilities.matrix_operation import *
+from Utilities.mlr_engine import write_mlr_output
+from Utilities.mlr_output import read_mlr_output
+from Tests.optimization_cycles import define_no_preds_bags
+from runtests import dataset_stages
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'Utilities'))
+from matrix_generate import generate_matrix
+
+
+# Examples run by Examples/runall.sh
+
+EXAMPLES = ["LQ-example", "HQ-example", "case-01", "case-02", "case-03",
+            "case-04", "case-05", "case-06", "case-07"]
+
+# runs the command in its arguments, and prints the max RSS of its processes
+
+LAUNCHER = ("import resource, subprocess, sys\n"
+            "code = subprocess.call(sys.argv[1:])\n"
+            "print(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)\n"
+            "sys.exit(code)\n")
+
+# parameters of runtests.py in Examples/runall.sh, other than the no of cycles
+
+RUNALL_PARAMETERS = {"percentage_top_preds": "0.2", "percentage_bootstrap": "0.1",
+                     "percentage_cycles"   : "0.2", "direction"           : "up",
+                     "cutoff"              : "0.8"}
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Examples')
+
+
+# ---------------------
+
+def GetFiles():
+
+    """ -------------------------------------------------------------
+    Handles input/output files and parameters of the benchmarks
+
+    OutputFile  := JSON file with the timings
+    CompareFiles:= two JSON files to be compared
+    ------------------------------------------------------------- """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--datasets",     default = ",".join(EXAMPLES), help = "Examples to benchmark, comma separated")
+    parser.add_argument("-g", "--grow",         default = "100,300",  help = "No of systems of the synthetic matrices, comma separated, none for no synthetic matrix")
+    parser.add_argument("-l", "--electronics",  default = "2",        help = "No of electronic descriptors of the synthetic matrices")
+    parser.add_argument("-t", "--sterics",      default = "2",        help = "No of steric descriptors of the synthetic matrices, 1 or 2")
+    parser.add_argument("-y", "--rows",         default = "2550",     help = "No of buried volume rows of the synthetic matrices")
+    parser.add_argument("-u", "--output_systems", default = "100000", help = "No of systems of the synthetic MLR output parsed, none for no parsing")
+    parser.add_argument("-n", "--no_of_cycles", default = "100",      help = "No of randomization/bootstrap/optimization cycles")
+    parser.add_argument("-e", "--engine",       default = "fortran",  help = "MLR engine: fortran (MLR.x) or numpy")
+    parser.add_argument("-j", "--jobs",         default = "1",        help = "No of worker processes for bootstrap and optimization cycles")
+    parser.add_argument("-o", "--output",       default = "benchmark.json", help = "JSON file with the timings")
+    parser.add_argument("-w", "--workdir",      default = None,       help = "Directory where the stages are run, kept at the end")
+    parser.add_argument("-k", "--cache",        action = "store_true", help = "numpy engine: read and write fits in the cache, off by default")
+    parser.add_argument("-x", "--no-plots",     action = "store_true", help = "Do not time the plots")
+    parser.add_argument("-c", "--compare",      nargs = 2,            help = "Compare two JSON files: old new")
+    parser.add_argument("-r", "--threshold",    default = "0.10",     help = "Relative slowdown reported as regression, default 0.10")
+    parser.add_argument("--matrix-io",          default = None,       help = argparse.SUPPRESS)
+    parser.add_argument("--output-parsing",     nargs = 2,            help = argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if (args.engine != 'fortran') and (args.engine != 'numpy'):
+       print(' Error:  -e/--engine flag must be fortran/numpy')
+       exit()
+
+    if (args.sterics != '1') and (args.sterics != '2'):
+       print(' Error:  -t/--sterics flag must be 1 or 2')
+       exit()
+
+    if (not args.no_of_cycles.isdigit()) or (not args.jobs.isdigit()):
+       print(' Error:  -n/--no_of_cycles and -j/--jobs flags must be positive integers')
+       exit()
+
+    return args
+# ---------------------
+
+
+def time_matrix_io(MatrixFile):
+
+  # times read_matrix and write_matrix on MatrixFile, best of 3 runs,
+  # called in a process of its own by run_matrix_io
+
+    read_time  = []
+    write_time = []
+    ScratchFile = MatrixFile + ".io"
+
+    for r in range(3):
+        begin  = time.perf_counter()
+        matrix = read_matrix(MatrixFile)
+        read_time.append(time.perf_counter() - begin)
+
+        begin  = time.perf_counter()
+        write_matrix(ScratchFile, *matrix)
+        write_time.append(time.perf_counter() - begin)
+
+    os.remove(ScratchFile)
+    print(json.dumps({"read matrix": min(read_time), "write matrix": min(write_time)}))
+
+    return()
+# ---------------------
+
+
+def parse_output_readlines(OutputFile):
+
+  # parsing of the MLR.x output of the drivers before Utilities/mlr_output.py:
+  # the whole file is loaded with readlines, then counters, Max R2, errors of
+  # the Fit lines, as in Tests/mlr.py, and rows of the final table, as in
+  # Tests/prediction.py, are taken from the lines
+
+    error_values  = []
+    reference_pre = []
+    dat_lines     = []
+
+    with open(OutputFile, "r") as f:
+         lines = f.readlines()
+
+    for line in lines:
+        if ("Number of systems" in line):
+           no_of_systems = float(line.split()[4])
+
+        if ("Number of Electronic descriptors" in line):
+           no_of_electronics = float(line.split()[5])
+
+        if ("Number of Steric descriptors" in line):
+           no_of_sterics = float(line.split()[5])
+
+        if ("Max R2" in line) and ("pair" not in line):
+           R2 = float(line.split()[2])
+
+        if ("Fit" in line) and ("Fitted" not in line):
+           error_values.append(float(line.split()[4]))
+
+        if (line[-4:-1] == "Fit") or (line[-4:-1] == "Pre"):
+           columns = line.split()
+           reference_pre.append(float(columns[6]))
+           useful_data = np.array(columns[2:5]).astype(float)
+           dat_lines.append((columns[1], useful_data, columns[8]))
+
+    return (no_of_systems, no_of_electronics, no_of_sterics, R2,
+            np.array(error_values), reference_pre, dat_lines)
+# ---------------------
+
+
+def time_output_parsing(parser, OutputFile):
+
+  # times the parsing of OutputFile with the readlines parsing of the drivers
+  # or with read_mlr_output, best of 3 runs, called in a process of its own by
+  # run_benchmarks for each parser, so that the peak RSS is the one of the parser
+
+    parse = {"readlines": parse_output_readlines, "streaming": read_mlr_output}[parser]
+    times = []
+
+    for r in range(3):
+        begin  = time.perf_counter()
+        output = parse(OutputFile)
+        times.append(time.perf_counter() - begin)
+        del output
+
+    print(json.dumps({"wall": min(times)}))
+
+    return()
+# ---------------------
+
+
+def write_synthetic_output(OutputFile, no_of_systems, seed = 0):
+
+  # writes the MLR.x-like output of write_mlr_output for a fit of no_of_systems
+  # random systems, with one system out of ten skipped
+
+    rng         = np.random.default_rng(seed)
+    skipped     = np.arange(1, no_of_systems + 1)[::10]
+    experiments = rng.standard_normal(no_of_systems)
+    fitted      = experiments + 0.1*rng.standard_normal(no_of_systems)
+
+    write_mlr_output(OutputFile         , "synthetic.matrix" , "synthetic output"   ,
+                     3                  , 1                  , np.concatenate(([len(skipped)], skipped)),
+                     no_of_systems      , 2                  , 2                    ,
+                     ["S" + str(i+1) for i in range(no_of_systems)], 0.9, 3.5, 1.0  ,
+                     rng.standard_normal(5), fitted          , experiments          ,
+                     2.0                , 0.5                )
+
+    return()
+# ---------------------
+
+
+def peak_rss_mb(maxrss):
+
+  # peak resident set size in MB, ru_maxrss is in kB on Linux and in bytes on macOS
+
+    if sys.platform == "darwin":
+       return maxrss / 2**20
+
+    return maxrss / 2**10
+# ---------------------
+
+
+def run_command(command, cwd):
+
+  # runs command in cwd, and returns wall time, peak RSS, exit code and output.
+  # The command is started by LAUNCHER, a small process printing the peak RSS
+  # of its children as last line: a process started directly from this one
+  # would report at least the RSS of this process, as it is inherited by exec
+
+    begin = time.perf_counter()
+    run   = subprocess.run([sys.executable, "-S", "-c", LAUNCHER] + command, cwd=cwd,
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    wall  = time.perf_counter() - begin
+
+    output, _, rss = run.stdout.rstrip("\n").rpartition("\n")
+    rss = float(rss) if rss.isdigit() else 0.0
+
+    return (wall, peak_rss_mb(rss), run.returncode, output)
+# ---------------------
+
+
+def stage_result(name, wall, rss, fits, code):
+
+  # record of a stage in the JSON file
+
+    return {"name"        : name,
+            "wall"        : round(wall, 4),
+            "peak_rss_mb" : round(rss, 1),
+            "fits"        : fits,
+            "fits_per_s"  : round(fits / wall, 2) if fits and wall > 0 else None,
+            "exit_code"   : code}
+# ---------------------
+
+
+def pipeline_stages(MatrixFile, args, no_of_systems):
+
+  # stages of runtests.py on MatrixFile, as declared by runtests.dataset_stages
+  # with the parameters of Examples/runall.sh, with the number of fits each one runs
+
+    MLRBinary, PYTHONHOME = GetVariables()
+
+    cycles = int(args.no_of_cycles)
+    _, _, no_of_bags = define_no_preds_bags(no_of_systems, float(RUNALL_PARAMETERS["percentage_cycles"]))
+
+    fits = {"MLR"                 : 1,
+            "MLR NM"              : 1,
+            "LOO"                 : no_of_systems,
+            "LOO NM"              : no_of_systems,
+            "Y-randomization"     : cycles + 1,
+            "bootstrap"           : cycles + 1,
+            "predictions"         : 2,
+            "optimization cycles" : cycles * no_of_bags}
+
+    stage_args = argparse.Namespace(no_of_cycles = args.no_of_cycles, engine     = args.engine,
+                                    jobs         = args.jobs,         resume     = False,
+                                    legacy_rng   = False,             **RUNALL_PARAMETERS)
+
+    stages = [(stage["name"], stage["commands"], fits.get(stage["name"], 0))
+              for stage in dataset_stages(MatrixFile, stage_args)]
+
+    if not args.no_plots:
+       stages.append(("plots", [["python", PYTHONHOME + "runplots.py", "-m", MatrixFile]], 0))
+
+    return stages
+# ---------------------
+
+
+def prepare_datasets(args, WorkDir):
+
+  # writes the matrix of each dataset in a directory of its own in WorkDir,
+  # with print flag 1 as set by runtests.py
+
+    datasets = []
+    names    = [d for d in args.datasets.split(",") if d]
+
+    for name in names:
+        MatrixFile = os.path.join(EXAMPLES_DIR, name, name + ".matrix")
+        if not os.path.exists(MatrixFile):
+           print(' Error: matrix ' + MatrixFile + ' not found')
+           exit()
+        datasets.append((name, read_matrix(MatrixFile)))
+
+    if args.grow != "none":
+       for no_of_systems in [int(n) for n in args.grow.split(",") if n]:
+           matrix, truth = generate_matrix(no_of_systems, int(args.electronics), int(args.sterics), int(args.rows))
+           datasets.append(("synthetic-" + str(no_of_systems), matrix))
+
+    for name, matrix in datasets:
+        os.makedirs(os.path.join(WorkDir, name))
+        matrix    = list(matrix)
+        matrix[1] = 1
+        write_matrix(os.path.join(WorkDir, name, name + ".matrix"), *matrix)
+
+    return [(name, matrix[5]) for name, matrix in datasets]
+# ---------------------
+
+
+def run_benchmarks(args):
+
+  # runs all stages on all datasets and writes the JSON file
+
+    MLRBinary, PYTHONHOME = GetVariables()
+
+  # fits read from the cache of the numpy engine would not be timed
+
+    if not args.cache:
+       os.environ["COBRA_NO_CACHE"] = "1"
+
+    WorkDir = args.workdir if args.workdir else tempfile.mkdtemp(prefix="cobra-bench-")
+    os.makedirs(WorkDir, exist_ok=True)
+
+    results = {"date"        : datetime.datetime.now().isoformat(timespec="seconds"),
+               "host"        : platform.node(),
+               "python"      : platform.python_version(),
+               "numpy"       : np.__version__,
+               "cpus"        : os.cpu_count(),
+               "engine"      : args.engine,
+               "no_of_cycles": int(args.no_of_cycles),
+               "jobs"        : int(args.jobs),
+               "cache"       : args.cache,
+               "datasets"    : []}
+
+    for name, no_of_systems in prepare_datasets(args, WorkDir):
+        RunDir     = os.path.join(WorkDir, name)
+        MatrixFile = name + ".matrix"
+        stages     = []
+        print(' Benchmark of ' + name + ', ' + str(no_of_systems) + ' systems', flush=True)
+
+
+      # read and write of the matrix, timed inside their own process
+
+        wall, rss, code, output = run_command(["python", os.path.abspath(__file__), "--matrix-io", MatrixFile], RunDir)
+        io_times = json.loads(output.splitlines()[-1]) if code == 0 else {}
+        for stage in ["read matrix", "write matrix"]:
+            stages.append(stage_result(stage, io_times.get(stage, 0.0), rss, 0, code))
+
+
+      # stages of runtests.py
+
+        for stage, commands, fits in pipeline_stages(MatrixFile, args, no_of_systems):
+            wall, rss, code = 0.0, 0.0, 0
+            for command in commands:
+                w, r, c, output = run_command(command, RunDir)
+                wall, rss, code = wall + w, max(rss, r), max(code, c)
+
+            stages.append(stage_result(stage, wall, rss, fits, code))
+            print('   ' + "{:20s}".format(stage) + "{:9.2f}".format(wall) + ' s'
+                  + "{:9.1f}".format(rss) + ' MB' + ('' if code == 0 else '  exit code ' + str(code)), flush=True)
+
+        results["datasets"].append({"name": name, "no_of_systems": no_of_systems, "stages": stages})
+
+
+  # parsing of a synthetic MLR output, with the readlines parsing of the drivers
+  # before Utilities/mlr_output.py and with read_mlr_output
+
+    if args.output_systems != "none":
+       no_of_systems = int(args.output_systems)
+       name          = "output-" + str(no_of_systems)
+       RunDir        = os.path.join(WorkDir, name)
+       OutputFile    = name + ".mlr_out"
+       stages        = []
+       print(' Benchmark of ' + name + ', MLR output of ' + str(no_of_systems) + ' systems', flush=True)
+
+       os.makedirs(RunDir)
+       write_synthetic_output(os.path.join(RunDir, OutputFile), no_of_systems)
+
+       for parser in ["readlines", "streaming"]:
+           stage = "parse output " + parser
+           wall, rss, code, output = run_command(["python", os.path.abspath(__file__),
+                                                  "--output-parsing", parser, OutputFile], RunDir)
+           wall = json.loads(output.splitlines()[-1])["wall"] if code == 0 else 0.0
+
+           stages.append(stage_result(stage, wall, rss, 0, code))
+           print('   ' + "{:20s}".format(stage) + "{:9.2f}".format(wall) + ' s'
+                 + "{:9.1f}".format(rss) + ' MB' + ('' if code == 0 else '  exit code ' + str(code)), flush=True)
+
+       results["datasets"].append({"name": name, "no_of_systems": no_of_systems, "stages": stages})
+
+    with open(args.output, "w") as f:
+         json.dump(results, f, indent=1)
+
+    if not args.workdir:
+       shutil.rmtree(WorkDir)
+
+    print(' Timings written to ' + args.output)
+
+    return()
+# ---------------------
+
+
+def compare_benchmarks(OldFile, NewFile, threshold):
+
+  # prints wall time, peak RSS and fits/s of the stages found in both files,
+  # flagging stages slower by more than threshold. Stages with an exit code
+  # other than 0 in either file are flagged as failed, and not compared
+
+    with open(OldFile, "r") as f:
+         old = json.load(f)
+    with open(NewFile, "r") as f:
+         new = json.load(f)
+
+    for key in ["engine", "no_of_cycles", "jobs", "cache", "cpus"]:
+        if old.get(key) != new.get(key):
+           print(' Warning: ' + key + ' differs, ' + str(old.get(key)) + ' vs ' + str(new.get(key)))
+
+    old_stages = {(d["name"], s["name"]): s for d in old["datasets"] for s in d["stages"]}
+    regressions = 0
+    failures    = 0
+
+    print('')
+    print(' Dataset              Stage                 Old wall  New wall   Ratio   Old RSS  New RSS   Old fits/s  New fits/s')
+    for dataset in new["datasets"]:
+        for stage in dataset["stages"]:
+            key = (dataset["name"], stage["name"])
+            if key not in old_stages:
+               continue
+
+            o = old_stages[key]
+            if o.get("exit_code", 0) != 0 or stage.get("exit_code", 0) != 0:
+               failures += 1
+               print(' ' + "{:20s}".format(dataset["name"]) + ' ' + "{:20s}".format(stage["name"])
+                         + '  failed, exit code ' + str(o.get("exit_code", 0)) + ' vs ' + str(stage.get("exit_code", 0)))
+               continue
+
+            ratio = stage["wall"] / o["wall"] if o["wall"] > 0 else float("nan")
+            flag  = '  <-- slower' if ratio > 1.0 + threshold else ''
+            regressions += (flag != '')
+
+            print(' ' + "{:20s}".format(dataset["name"]) + ' ' + "{:20s}".format(stage["name"])
+                      + "{:10.3f}".format(o["wall"]) + "{:10.3f}".format(stage["wall"])
+                      + "{:8.2f}".format(ratio)
+                      + "{:10.1f}".format(o["peak_rss_mb"]) + "{:9.1f}".format(stage["peak_rss_mb"])
+                      + "{:13s}".format("" if o["fits_per_s"] is None else "{:13.1f}".format(o["fits_per_s"]))
+                      + "{:12s}".format("" if stage["fits_per_s"] is None else "{:12.1f}".format(stage["fits_per_s"]))
+                      + flag)
+
+    print('')
+    print(' ' + str(regressions) + ' stages slower by more than ' + "{:.0f}".format(100*threshold) + '%')
+    if failures:
+       print(' ' + str(failures) + ' stages failed in one of the runs, not compared')
+
+    return()
+# ---------------------
+
+
+def main():
+
+    args = GetFiles()
+
+    if args.matrix_io:
+       time_matrix_io(args.matrix_io)
+    elif args.output_parsing:
+       time_output_parsing(args.output_parsing[0], args.output_parsing[1])
+    elif args.compare:
+       compare_benchmarks(args.compare[0], args.compare[1], float(args.threshold))
+    else:
+       run_benchmarks(args)
+
+    return()
+# ---------------------
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3 -B
+
+""" ---------------------------------------------------------------------------
+
+This module runs all tests of runtests.py in a single process, with the
+in-memory MLR engine. The matrix is read once, and the reordered, normalized
+and best point (Rm-) matrices are passed from one test to the other as arrays.
+Only the output files of the tests, used by pcs.py and by the plots, are written.
+Their content is the same as with runtests.py -e numpy.
+
+To be used as:
+   import cobra
+
+   cobra.run_all("myfile.matrix", {"no_of_cycles"         : 1000,
+                                   "percentage_top_preds" : 0.2,
+                                   "percentage_bootstrap" : 0.1,
+                                   "percentage_cycles"    : 0.2,
+                                   "direction"            : "up",
+                                   "cutoff"               : 0.8,
+                                   "jobs"                 : 1})
+
+or from the command line as:
+   python runtests.py --in-process -m myfile.matrix ...
+
+config has the same keys of the runtests.py options, jobs, resume and legacy_rng
+are optional. With resume, bootstrap, y-randomization and optimization cycles skip
+the cycles saved in their checkpoint files by a previous run that did not complete.
+With legacy_rng, bootstrap bags are drawn with the random sequence of previous
+versions.
+
+@author: Zhen Cao, Luigi Cavallo
+--------------------------------------------------------------------------- """
+
+import functools
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Utilities'))
+
+from Utilities.set_variables    import GetVariables
+from Utilities.matrix_operation import read_matrix, round_matrix
+from Utilities.matrix_reorder   import reorder_matrix
+from Utilities.matrix_normalize import normalize_matrix
+from Utilities.mlr_engine       import *
+from Utilities.checkpoint       import *
+from Utilities.profiling        import span
+
+from Tests.mlr                 import GetR2, write_r2
+from Tests.loo                 import write_loo
+from Tests.y_randomization     import shuffle_systems, solve_shuffles, analysis_yrand
+from Tests.bootstrap           import run_bootstrap
+from Tests.prediction          import run_prediction
+from Tests.optimization_cycles import run_optimization_cycles
+from Tests.pcs                 import write_pcs
+
+
+# ---------------------
+
+def write_info(MatrixFile, config):
+
+  # prints input data into basename.info, as runtests.py
+
+    BASE_INFO = MatrixFile.replace(".matrix", "")
+
+    with open(BASE_INFO+".info", "w") as f:
+         f.write("CSV file                                            : " + BASE_INFO + "\n")
+         f.write("No of randomizaiton/bootstrap/optimization cycles   : " + str(config["no_of_cycles"]) + "\n")
+         f.write("% of top/bottom systems to predict                  : " + str(config["percentage_top_preds"]) + "\n")
+         f.write("% of systems out of the bag in the bootstrap cycles : " + str(config["percentage_bootstrap"]) + "\n")
+         f.write("% of systems out in the optimization cycles         : " + str(config["percentage_cycles"]) + "\n")
+         f.write("Ranking systems upward or downward                  : " + str(config["direction"]) + "\n")
+         f.write("cutoff to define TP/TN                              : " + str(config["cutoff"]) + "\n")
+
+    return()
+
+
+# ---------------------
+
+def mlr_test(matrix, MatrixFile):
+
+  # runs MLR on matrix, writes the .mlr_out and .mlr_r2 files of MatrixFile
+  # and returns the matrix with the best grid point only, as the Rm- matrix
+  # written by MLR.x
+
+    title             , print_flag             , normalization_flag   , \
+    shift_flag        , skipped_systems        , no_of_systems        , \
+    no_of_electronics , no_of_sterics          , no_of_buried_volumes , \
+    system_tags       , experimental_tag       , experimental_data    , \
+    electronic_tags   , electronic_descriptors , radius_proximal      , \
+    radius_distal     , buried_volumes         = matrix
+
+    OutputFile = MatrixFile.replace("matrix","mlr_out")
+    R2File     = MatrixFile.replace("matrix","mlr_r2")
+
+    R2, point, rv, rr, coefficients, fitted, experiments, exp_av, exp_sd = run_mlr_cached(
+        normalization_flag , shift_flag             , skipped_systems ,
+        no_of_systems      , no_of_sterics          , experimental_data ,
+        electronic_descriptors , radius_proximal    , radius_distal ,
+        buried_volumes     )
+
+    write_mlr_output(OutputFile         , MatrixFile        , title             ,
+                     normalization_flag , shift_flag        , skipped_systems   ,
+                     no_of_systems      , no_of_electronics , no_of_sterics     ,
+                     system_tags        , R2                , rv                ,
+                     rr                 , coefficients      , fitted            ,
+                     experiments        , exp_av            , exp_sd            )
+
+
+  # R2 and MAE_fit as parsed by mlr.py from the output file
+
+    R2_out, MAE_fit = GetR2(OutputFile)[3:]
+    write_r2(R2File, no_of_systems, no_of_electronics, no_of_sterics, R2_out, MAE_fit)
+
+
+    return best_matrix(title             , normalization_flag , shift_flag        ,
+                       skipped_systems   , no_of_systems      , no_of_electronics ,
+                       no_of_sterics     , system_tags        , experimental_tag  ,
+                       experimental_data , electronic_tags    , electronic_descriptors ,
+                       rv                , rr                 , buried_volumes    ,
+                       point             )
+
+
+# ---------------------
+
+def loo_test(matrix, MatrixFile):
+
+  # runs the leave-one-out test on matrix, writes the .loo_dat and .loo_q2 files
+
+    title             , print_flag             , normalization_flag   , \
+    shift_flag        , skipped_systems        , no_of_systems        , \
+    no_of_electronics , no_of_sterics          , no_of_buried_volumes , \
+    system_tags       , experimental_tag       , experimental_data    , \
+    electronic_tags   , electronic_descriptors , radius_proximal      , \
+    radius_distal     , buried_volumes         = matrix
+
+    results    = run_mlr_loo(normalization_flag , shift_flag        , no_of_systems          ,
+                             no_of_sterics      , experimental_data , electronic_descriptors ,
+                             radius_proximal    , radius_distal     , buried_volumes         )
+    loo_values = list(round_significant(results[0]))
+
+    write_loo(MatrixFile.replace("matrix", "loo_dat"), MatrixFile.replace("matrix", "loo_q2"),
+              no_of_systems, system_tags, experimental_data, loo_values)
+
+    return()
+
+
+# ---------------------
+
+def yrand_test(matrix, MatrixFile, no_of_shuffles, resume):
+
+  # runs the y-randomization test on matrix, writes the .yrand_dat and .yrand_yr2 files.
+  # R2 of completed cycles are saved in the .yrand_ckpt file while running.
+
+    title             , print_flag             , normalization_flag   , \
+    shift_flag        , skipped_systems        , no_of_systems        , \
+    no_of_electronics , no_of_sterics          , no_of_buried_volumes , \
+    system_tags       , experimental_tag       , experimental_data    , \
+    electronic_tags   , electronic_descriptors , radius_proximal      , \
+    radius_distal     , buried_volumes         = matrix
+
+    shuffled_indices = shuffle_systems(no_of_shuffles, no_of_systems)
+
+    CheckFile = MatrixFile.replace("matrix", "yrand_ckpt")
+    key       = checkpoint_key("y-randomization", matrix, no_of_shuffles, "numpy")
+    r2_values = run_checkpointed(functools.partial(solve_shuffles, matrix=matrix,
+                                                   shuffled_indices=shuffled_indices),
+                                 no_of_shuffles+1, CheckFile, key, resume)
+
+    analysis_yrand(MatrixFile.replace("matrix", "yrand_dat"), MatrixFile.replace("matrix", "yrand_yr2"),
+                   no_of_shuffles    , no_of_systems    , experimental_data ,
+                   shuffled_indices  , np.array(r2_values))
+
+    remove_checkpoint(CheckFile)
+
+    return()
+
+
+# ---------------------
+
+def run_all(MatrixFile, config):
+
+  # runs all tests on MatrixFile, as runtests.py with the numpy engine.
+  # Output files are written in the current directory, with the names of runtests.py
+
+  # Input:
+    # MatrixFile := matrix file name, i.e., myfile.matrix
+    # config     := dictionary with no_of_cycles, percentage_top_preds,
+    #               percentage_bootstrap, percentage_cycles, direction, cutoff
+    #               and, optionally, jobs, resume and legacy_rng
+  # ---------------------
+
+    MLRBinary, PYTHONHOME = GetVariables()
+
+    no_of_cycles = int(config["no_of_cycles"])
+    updown_flag  = str(config["direction"])
+    cutoff       = float(config["cutoff"])
+    no_of_jobs   = int(config.get("jobs", 1))
+    resume       = bool(config.get("resume", False))
+    legacy_rng   = bool(config.get("legacy_rng", False))
+
+    NORMALIZED_MATRIX = "NM-" + MatrixFile
+    R2MIN_MATRIX      = "Rm-" + MatrixFile
+    R2MIN_NM_MATRIX   = "Rm-NM-" + MatrixFile
+
+    write_info(MatrixFile, config)
+
+
+  # read the matrix once, reorder and normalize it
+
+    print(' Reordering and normalizing matrix...')
+
+    with span("stage", "reorder"):
+         title             , print_flag             , normalization_flag   , \
+         shift_flag        , skipped_systems        , no_of_systems        , \
+         no_of_electronics , no_of_sterics          , no_of_buried_volumes , \
+         system_tags       , experimental_tag       , experimental_data    , \
+         electronic_tags   , electronic_descriptors , radius_proximal      , \
+         radius_distal     , buried_volumes         = read_matrix(MatrixFile)
+
+         out_tag, out_exp, out_ele, out_vbu = reorder_matrix(
+         title             , print_flag             , normalization_flag   ,
+         shift_flag        , skipped_systems        , no_of_systems        ,
+         no_of_electronics , no_of_sterics          , no_of_buried_volumes ,
+         system_tags       , experimental_tag       , experimental_data    ,
+         electronic_tags   , electronic_descriptors , radius_proximal      ,
+         radius_distal     , buried_volumes         , 'up'                 )
+
+         reordered = round_matrix(title             , 1                      , normalization_flag   ,
+                                  shift_flag        , skipped_systems        , no_of_systems        ,
+                                  no_of_electronics , no_of_sterics          , no_of_buried_volumes ,
+                                  out_tag           , experimental_tag       , out_exp              ,
+                                  electronic_tags   , out_ele                , radius_proximal      ,
+                                  radius_distal     , out_vbu                )
+
+         NM_exp, NM_ele, NM_vbu = normalize_matrix(no_of_systems        , no_of_electronics , no_of_sterics ,
+                                                   no_of_buried_volumes , reordered[11]     , reordered[13] ,
+                                                   reordered[16]        )
+
+         normalized = round_matrix(title             , 1                      , normalization_flag   ,
+                                   shift_flag        , skipped_systems        , no_of_systems        ,
+                                   no_of_electronics , no_of_sterics          , no_of_buried_volumes ,
+                                   out_tag           , experimental_tag       , NM_exp               ,
+                                   electronic_tags   , NM_ele                 , radius_proximal      ,
+                                   radius_distal     , NM_vbu                 )
+
+
+  # run all tests passing the matrices in memory
+
+    print(' Running MLR...')
+    with span("stage", "MLR"):
+         best_point    = mlr_test(reordered, MatrixFile)
+         best_point_NM = mlr_test(normalized, NORMALIZED_MATRIX)
+
+    print(' Running LOO...')
+    with span("stage", "LOO"):
+         loo_test(best_point, R2MIN_MATRIX)
+         loo_test(best_point_NM, R2MIN_NM_MATRIX)
+
+    print(' Running Y-randomization...')
+    with span("stage", "Y-randomization"):
+         yrand_test(best_point_NM, R2MIN_NM_MATRIX, no_of_cycles, resume)
+
+    print(' Running bootstrap...')
+    with span("stage", "bootstrap"):
+         run_bootstrap(best_point_NM , R2MIN_NM_MATRIX ,
+                       R2MIN_NM_MATRIX.replace("matrix", "tmp")       ,
+                       R2MIN_NM_MATRIX.replace("matrix", "boot_dat")  ,
+                       R2MIN_NM_MATRIX.replace("matrix", "boot_pred") ,
+                       R2MIN_NM_MATRIX.replace("matrix", "boot_coef") ,
+                       R2MIN_NM_MATRIX.replace("matrix", "boot_r2")   ,
+                       R2MIN_NM_MATRIX.replace("matrix", "boot_mae")  ,
+                       R2MIN_NM_MATRIX.replace("matrix", "boot_ckpt") ,
+                       no_of_cycles  , float(config["percentage_bootstrap"]) ,
+                       "numpy"       , no_of_jobs      , MLRBinary , resume ,
+                       legacy_rng    )
+
+    print(' Running top systems predictions...')
+    with span("stage", "predictions"):
+         run_prediction(normalized ,
+                        NORMALIZED_MATRIX.replace("matrix", "tmp")      ,
+                        NORMALIZED_MATRIX.replace("matrix", "pred_out") ,
+                        NORMALIZED_MATRIX.replace("matrix", "pred_mae") ,
+                        NORMALIZED_MATRIX.replace("matrix", "pred_pre") ,
+                        NORMALIZED_MATRIX.replace("matrix", "pred_dat") ,
+                        float(config["percentage_top_preds"]) , updown_flag ,
+                        "numpy"    , MLRBinary )
+
+    print(' Running optimization cycles...')
+    with span("stage", "optimization cycles"):
+         run_optimization_cycles(reordered  ,
+                                 MatrixFile.replace("matrix", "tmp")         ,
+                                 MatrixFile.replace("matrix", "cycles_dat")  ,
+                                 MatrixFile.replace("matrix", "cycles_stat") ,
+                                 MatrixFile.replace("matrix", "cycles_ckpt") ,
+                                 float(config["percentage_cycles"]) , updown_flag ,
+                                 no_of_cycles , cutoff , "numpy" , no_of_jobs , False , MLRBinary ,
+                                 resume )
+
+
+  # summary of all tests
+
+    Basename = os.path.splitext(MatrixFile)[0]
+
+    with span("stage", "pcs"):
+         write_pcs(Basename ,
+                   "NM-"    + Basename + ".mlr_r2"    ,
+                   "Rm-NM-" + Basename + ".loo_q2"    ,
+                   "Rm-NM-" + Basename + ".yrand_yr2" ,
+                   "Rm-NM-" + Basename + ".boot_mae"  ,
+                   "NM-"    + Basename + ".pred_mae"  ,
+                              Basename + ".cycles_stat" ,
+                   MatrixFile.replace("matrix", "pcs"))
+
+    return()
+
+# --- End of run_all ----------------------------------------------------------
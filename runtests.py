@@ -7,12 +7,17 @@ cavolo
 To be run as:
    python RunMLR.py -m sys08.matrix
 
+or, for many datasets on a shared pool of -s/--stages workers, as:
+   python runtests.py -l/--batch manifest.txt -w/--workdir runs ...
+
 Input:   
-   MatrixFile : = myfile.matrix       Matrix describing the dataset to be learned
+   MatrixFile   : = myfile.matrix       Matrix describing the dataset to be learned
+   ManifestFile : = manifest.txt        Matrix files of the batch, one per line
 
 Output:
    OutputFile : = myfile.out          Output file with all training informations
    R2File     : = myfile.r2           Outputfile having inside R2 and R2-adj 
+   PCSTable   : = manifest.pcs        pcs metrics and wall time of each dataset of the batch
 
 @author: Zhen Cao, Luigi Cavallo  - September 2022
 --------------------------------------------------------------------------- """
@@ -26,6 +31,12 @@ import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), 'Utilities'))
 from set_variables import *
+from parallel import *
+from matrix_operation import read_matrix, write_matrix, is_binary_matrix
+from profiling import start_profiling, profiling, record_span, merge_trace
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from Tests.pcs import write_batch_pcs
 
 MLRBinary, PYTHONHOME = GetVariables()
 
@@ -41,109 +52,415 @@ RUN_BAGS  = PYTHONHOME + "Tests/optimization_cycles.py"
 RUN_PCS   = PYTHONHOME + "Tests/pcs.py"
 
 
-# get command line parameters
+# ---------------------
+
+def prepare_dataset(MatrixFile, args):
+
+  # saves the original matrix, sets its print flag and writes basename.info,
+  # in the current directory. Resuming an interrupted run, the matrix has been
+  # already reordered in place: start again from the original matrix saved in
+  # backup-myfile.matrix, one per dataset so that datasets can share a directory
+
+    BACKUP_MATRIX = "backup-" + MatrixFile
+
+    if args.resume and os.path.exists(BACKUP_MATRIX):
+       subprocess.run(["cp", BACKUP_MATRIX, MatrixFile])
+    else:
+       subprocess.run(["cp", MatrixFile, BACKUP_MATRIX])
+
+
+  # Set in matrix that 2nd line = 1 for writing best matrix
+
+    if is_binary_matrix(BACKUP_MATRIX):
+       matrix    = list(read_matrix(BACKUP_MATRIX))
+       matrix[1] = 1
+       write_matrix(MatrixFile, *matrix, binary = True)
+    else:
+       file = open(BACKUP_MATRIX, "r")
+       file_lines = ( file.readlines() )
+       file.close()
+
+       file_lines[1] = "1  \n"
+
+       file = open(MatrixFile, "w") 
+       file.write("".join(file_lines)) 
+       file.close()
+
+
+  # Print input data into basename.info
+
+    BASE_INFO = MatrixFile.replace(".matrix", "")
+
+    file = open(BASE_INFO+".info", "w")
+    file.write("CSV file                                            : " + BASE_INFO + "\n")
+    file.write("No of randomizaiton/bootstrap/optimization cycles   : " + args.no_of_cycles + "\n")  
+    file.write("% of top/bottom systems to predict                  : " + args.percentage_top_preds + "\n")
+    file.write("% of systems out of the bag in the bootstrap cycles : " + args.percentage_bootstrap + "\n")
+    file.write("% of systems out in the optimization cycles         : " + args.percentage_cycles + "\n")
+    file.write("Ranking systems upward or downward                  : " + args.direction + "\n")
+    file.write("cutoff to define TP/TN                              : " + args.cutoff + "\n")
+    file.close()  
+
+    return()
+
+
+# ---------------------
+
+def dataset_stages(MatrixFile, args, Directory=None):
+
+  # declares tests as stages, with the files they read and write. A stage waits for
+  # the stages writing its inputs. Tests write their temporary files in scratch
+  # directories of their own, see Utilities/scratch.py, so that independent stages
+  # run at the same time on up to args.stages workers,
+  # pcs.py runs last, after all tests, collecting their results.
+  # With Directory, commands are run in Directory, stage names start with the
+  # dataset name and files are given with their full path, so that stages of
+  # datasets in different directories do not depend on each other.
+
+    MATRIX            =  MatrixFile
+    NORMALIZED_MATRIX = "NM-" + MatrixFile
+    REORDERED_MATRIX  = "NM-" + MatrixFile
+    R2MIN_MATRIX      = "Rm-" + MatrixFile
+    R2MIN_NM_MATRIX   = "Rm-NM-" + MatrixFile
+
+  # bootstrap, y-randomization and optimization cycles skip cycles saved in their
+  # checkpoint files by the interrupted run
+
+    RESUME = ["-r"] if args.resume else []
+
+  # bootstrap bags drawn with the random sequence of previous versions
+
+    LEGACY_RNG = ["-g"] if args.legacy_rng else []
+
+    BASE_NAME = os.path.splitext(MATRIX)[0]
+
+    STAGES = [
+       {"name"    : "reorder",
+        "commands": [["python", REORDER_MATRIX, "-m", MatrixFile, "-d", "up", "-o", MatrixFile]],
+        "inputs"  : [MATRIX],
+        "outputs" : [MATRIX]},
+
+       {"name"    : "normalize",
+        "commands": [["python", NORMALIZE_MATRIX, "-m", MatrixFile,"-o", NORMALIZED_MATRIX]],
+        "inputs"  : [MATRIX],
+        "outputs" : [NORMALIZED_MATRIX]},
+
+       {"name"    : "MLR",
+        "commands": [["python", RUN_MLR,   "-m", MatrixFile, "-e", args.engine]],
+        "inputs"  : [MATRIX],
+        "outputs" : [R2MIN_MATRIX, BASE_NAME + ".mlr_out", BASE_NAME + ".mlr_r2"]},
+
+       {"name"    : "MLR NM",
+        "commands": [["python", RUN_MLR,   "-m", NORMALIZED_MATRIX, "-e", args.engine]],
+        "inputs"  : [NORMALIZED_MATRIX],
+        "outputs" : [R2MIN_NM_MATRIX, "NM-" + BASE_NAME + ".mlr_out", "NM-" + BASE_NAME + ".mlr_r2"]},
+
+       {"name"    : "LOO",
+        "commands": [["python", RUN_LOO,   "-m", R2MIN_MATRIX, "-e", args.engine]],
+        "inputs"  : [R2MIN_MATRIX],
+        "outputs" : ["Rm-" + BASE_NAME + ".loo_dat", "Rm-" + BASE_NAME + ".loo_q2"]},
+
+       {"name"    : "LOO NM",
+        "commands": [["python", RUN_LOO,   "-m", R2MIN_NM_MATRIX, "-e", args.engine]],
+        "inputs"  : [R2MIN_NM_MATRIX],
+        "outputs" : ["Rm-NM-" + BASE_NAME + ".loo_dat", "Rm-NM-" + BASE_NAME + ".loo_q2"]},
+
+       {"name"    : "Y-randomization",
+        "commands": [["python", RUN_YRAND, "-m", R2MIN_NM_MATRIX, "-n", args.no_of_cycles, "-e", args.engine] + RESUME],
+        "inputs"  : [R2MIN_NM_MATRIX],
+        "outputs" : ["Rm-NM-" + BASE_NAME + ".yrand_dat", "Rm-NM-" + BASE_NAME + ".yrand_yr2"]},
+
+       {"name"    : "bootstrap",
+        "commands": [["python", RUN_BOOT,  "-m", R2MIN_NM_MATRIX, "-n", args.no_of_cycles, "-b", args.percentage_bootstrap, "-e", args.engine, "-j", args.jobs] + RESUME + LEGACY_RNG],
+        "inputs"  : [R2MIN_NM_MATRIX],
+        "outputs" : ["Rm-NM-" + BASE_NAME + ext for ext in [".boot_dat", ".boot_pred", ".boot_coef", ".boot_r2", ".boot_mae"]]},
+
+       {"name"    : "predictions",
+        "commands": [["python", RUN_PRED,  "-m", NORMALIZED_MATRIX, "-t", args.percentage_top_preds, "-d", args.direction, "-e", args.engine]],
+        "inputs"  : [NORMALIZED_MATRIX],
+        "outputs" : ["NM-" + BASE_NAME + ext for ext in [".pred_out", ".pred_mae", ".pred_pre", ".pred_dat"]]},
+
+       {"name"    : "optimization cycles",
+        "commands": [["python", RUN_BAGS,  "-m",            MATRIX, "-o", args.percentage_cycles, "-d", args.direction, "-c", args.cutoff, "-n", args.no_of_cycles, "-e", args.engine, "-j", args.jobs] + RESUME],
+        "inputs"  : [MATRIX],
+        "outputs" : [BASE_NAME + ".cycles_dat", BASE_NAME + ".cycles_stat"]}
+    ]
+
+    STAGES.append(
+       {"name"    : "pcs",
+        "commands": [["python", RUN_PCS,   "-m", MatrixFile]],
+        "inputs"  : [f for stage in STAGES for f in stage["outputs"]],
+        "outputs" : [BASE_NAME + ".pcs", BASE_NAME + ".radar_pcs"]})
+
+
+  # stages of a dataset in Directory
+
+    if Directory is not None:
+       dataset = os.path.splitext(os.path.basename(MatrixFile))[0]
+       for stage in STAGES:
+           stage["name"]    = dataset + ": " + stage["name"]
+           stage["cwd"]     = Directory
+           stage["inputs"]  = [os.path.join(Directory, f) for f in stage["inputs"]]
+           stage["outputs"] = [os.path.join(Directory, f) for f in stage["outputs"]]
+
+    return STAGES
+
+
+# ---------------------
+
+def read_manifest(ManifestFile, WorkDir=None):
+
+  # reads the matrix files listed in ManifestFile, one per line, relative to the
+  # directory of ManifestFile. Empty lines and lines starting with # are skipped.
+  # Each dataset is run in the directory of its matrix file or, with WorkDir, in
+  # WorkDir/basename, where the matrix is copied.
+
+  # Output:
+    # datasets := list of (dataset name, working directory, matrix file name)
+  # ---------------------
+
+    if not os.path.exists(ManifestFile):
+       print(' Error:  manifest ' + ManifestFile + ' not found')
+       exit()
+
+    with open(ManifestFile, "r") as f:
+         lines = [line.strip() for line in f]
+
+    datasets = []
+    for line in lines:
+        if (not line) or line.startswith("#"):
+           continue
+
+        MatrixPath = os.path.join(os.path.dirname(os.path.abspath(ManifestFile)), line)
+        if not os.path.exists(MatrixPath):
+           print(' Error:  matrix ' + line + ' of ' + ManifestFile + ' not found')
+           exit()
+
+        MatrixFile = os.path.basename(MatrixPath)
+        dataset    = os.path.splitext(MatrixFile)[0]
+        if WorkDir:
+           Directory = os.path.join(os.path.abspath(WorkDir), dataset)
+           os.makedirs(Directory, exist_ok=True)
+           subprocess.run(["cp", MatrixPath, os.path.join(Directory, MatrixFile)])
+        else:
+           Directory = os.path.dirname(MatrixPath)
+
+        datasets.append((dataset, Directory, MatrixFile))
+
+
+    if not datasets:
+       print(' Error:  no matrix files in ' + ManifestFile)
+       exit()
+
+
+  # names must be unique in the table of results. Datasets in the same directory
+  # write files of different names, temporary files are in scratch directories
+
+    if len(set(d[0] for d in datasets)) < len(datasets):
+       print(' Error:  matrix files of ' + ManifestFile + ' must have different names')
+       exit()
+
+    return datasets
+
+
+# ---------------------
+
+def record_stages(STAGES, times):
+
+  # records the time of each stage in the trace
+
+    for s in range(len(STAGES)):
+        record_span(STAGES[s]["name"], "stage", int(times[s][0]*1.0e6), int(times[s][1]*1.0e6),
+                    stage = STAGES[s]["name"])
+
+    return()
+
+
+# ---------------------
+
+def GetFiles():
+
+  # get command line parameters
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-m", "--matrix",               help = "Missing Matrix file")
+    parser.add_argument("-n", "--no_of_cycles",         help = "Missing No of optimization cycles")
+    parser.add_argument("-t", "--percentage_top_preds", help = "Missing Percentage of predicted systems: 0.1 = 10% predicted")
+    parser.add_argument("-b", "--percentage_bootstrap", help = "Missing Percentage of predicted systems: 0.2 = 20% predicted")
+    parser.add_argument("-o", "--percentage_cycles",    help = "Missing Percentage of top systems in the optimizatino cycles: 0.3 = 30% predicted")
+    parser.add_argument("-d", "--direction",            help = "Missing if up or down reordering:  keywords up/dw")
+    parser.add_argument("-c", "--cutoff",               help = "Missing cutoff on top value in training dataset: 0.8 = Max experimental performance * 0.8")
+    parser.add_argument("-e", "--engine",               default = "fortran", help = "MLR engine: fortran (MLR.x) or numpy (in-memory)")
+    parser.add_argument("-j", "--jobs",                 default = "1",       help = "Number of worker processes for bootstrap and optimization cycles")
+    parser.add_argument("-s", "--stages",               default = "1",       help = "Number of tests run at the same time")
+    parser.add_argument("-i", "--in-process",           action = "store_true", help = "Run all tests in this process with the numpy engine, see cobra.py")
+    parser.add_argument("-k", "--cache_dir",            default = None,      help = "Directory of the cache of numpy fits, see Utilities/fit_cache.py")
+    parser.add_argument("-x", "--no-cache",             action = "store_true", help = "Do not read or write fits in the cache")
+    parser.add_argument("-r", "--resume",               action = "store_true", help = "Skip bootstrap, y-randomization and optimization cycles saved in checkpoint files")
+    parser.add_argument("-g", "--legacy_rng",           action = "store_true", help = "Draw bootstrap bags with the random sequence of previous versions, as in published results")
+    parser.add_argument("-p", "--profile",              action = "store_true", help = "Write time of stages and cycles to myfile.trace.json, see Utilities/profiling.py")
+    parser.add_argument("-l", "--batch",                default = None,      help = "Manifest file listing matrix files, one per line, run on a shared pool of -s/--stages workers")
+    parser.add_argument("-w", "--workdir",              default = None,      help = "With -l/--batch, run each dataset in workdir/basename instead of the directory of its matrix")
+
+    args = parser.parse_args()
+
+    if (not args.matrix and not args.batch) \
+    or (not args.no_of_cycles)  \
+    or (not args.percentage_top_preds) \
+    or (not args.percentage_bootstrap) \
+    or (not args.percentage_cycles) \
+    or (not args.direction)  \
+    or (not args.cutoff)  :
+       print(' Usage:  run_reorder.py -m/--matrix file.matrix')
+       print('                        -n/--no_of_cycles  No of randomization/bootstrap/optimization cycles ')
+       print('                        -t/--precentage_top_preds fraction of top/bottom systems to predict: 0.1 = 10% predicted')
+       print('                        -b/--precentage_bootstrap fraction of systems out of the bags:  0.2 = 20% held out')
+       print('                        -o/--precentage_cycles fraction of systems out in the optimization cycles:  0.3 = 30% held out')
+       print('                        -d/--direction up or down: keywords up/dw')
+       print('                        -c/--cutoff cutoff to define TP/TN: 0.8 = Max experimental performance * 0.8')
+       print('                        -e/--engine fortran/numpy: MLR.x or in-memory MLR engine, default fortran')
+       print('                        -j/--jobs No of worker processes for bootstrap and optimization cycles, default 1')
+       print('                        -s/--stages No of tests run at the same time, default 1')
+       print('                        -i/--in-process run all tests in this process with the numpy engine, writing output files only')
+       print('                        -k/--cache_dir directory of the cache of numpy fits, default set in Utilities/set_variables.py')
+       print('                        -x/--no-cache do not read or write fits in the cache')
+       print('                        -r/--resume skip cycles of an interrupted run saved in checkpoint files')
+       print('                        -g/--legacy_rng draw bootstrap bags with the random sequence of previous versions')
+       print('                        -p/--profile write time of stages, cycles and fits to myfile.trace.json')
+       print('                        -l/--batch manifest.txt listing matrix files, instead of -m/--matrix: all datasets')
+       print('                                   share -s/--stages workers, pcs metrics are collected in manifest.pcs')
+       print('                        -w/--workdir with -l/--batch, run each dataset in workdir/basename')
+       exit()
+
+    if (args.engine != 'fortran') and (args.engine != 'numpy'):
+       print(' Error:  -e/--engine flag must be fortran/numpy')
+       exit()
+
+    if (not args.stages.isdigit()) or (int(args.stages) < 1):
+       print(' Error:  -s/--stages flag must be a positive integer')
+       exit()
+
+    if args.batch and args.in_process:
+       print(' Error:  -l/--batch cannot be used with -i/--in-process')
+       exit()
+
+    if args.matrix and (args.engine == 'fortran') and (not args.in_process) and is_binary_matrix(args.matrix):
+       print(' Error:  binary matrix files can be used only with -e/--engine numpy')
+       exit()
+
+    return args
+
+
+# ---------------------
+
+def main():
+
+    args = GetFiles()
+
+
+  # cache of numpy fits: passed to the tests through the environment, so that
+  # it is seen by the tests run as subprocesses too
 
-parser = argparse.ArgumentParser()
+    if args.cache_dir:
+       os.environ["COBRA_CACHE_DIR"] = os.path.abspath(args.cache_dir)
 
-parser.add_argument("-m", "--matrix",               help = "Missing Matrix file")
-parser.add_argument("-n", "--no_of_cycles",         help = "Missing No of optimization cycles")
-parser.add_argument("-t", "--percentage_top_preds", help = "Missing Percentage of predicted systems: 0.1 = 10% predicted")
-parser.add_argument("-b", "--percentage_bootstrap", help = "Missing Percentage of predicted systems: 0.2 = 20% predicted")
-parser.add_argument("-o", "--percentage_cycles",    help = "Missing Percentage of top systems in the optimizatino cycles: 0.3 = 30% predicted")
-parser.add_argument("-d", "--direction",            help = "Missing if up or down reordering:  keywords up/dw")
-parser.add_argument("-c", "--cutoff",               help = "Missing cutoff on top value in training dataset: 0.8 = Max experimental performance * 0.8")
+    if args.no_cache:
+       os.environ["COBRA_NO_CACHE"] = "1"
 
-args = parser.parse_args()
 
-if (not args.matrix)        \
-or (not args.no_of_cycles)  \
-or (not args.percentage_top_preds) \
-or (not args.percentage_bootstrap) \
-or (not args.percentage_cycles) \
-or (not args.direction)  \
-or (not args.cutoff)  :
-   print(' Usage:  run_reorder.py -m/--matrix file.matrix')
-   print('                        -n/--no_of_cycles  No of randomization/bootstrap/optimization cycles ')
-   print('                        -t/--precentage_top_preds fraction of top/bottom systems to predict: 0.1 = 10% predicted')
-   print('                        -b/--precentage_bootstrap fraction of systems out of the bags:  0.2 = 20% held out')
-   print('                        -o/--precentage_cycles fraction of systems out in the optimization cycles:  0.3 = 30% held out')
-   print('                        -d/--direction up or down: keywords up/dw')
-   print('                        -c/--cutoff cutoff to define TP/TN: 0.8 = Max experimental performance * 0.8')
-   exit()
+  # profiling: also on when COBRA_PROFILE is set. The trace is written next to
+  # the .info file, or to basename.trace.json of the manifest in batch mode,
+  # and passed to the tests through the environment
 
+    if args.batch:
+       TRACE_FILE = os.path.splitext(os.path.basename(args.batch))[0] + ".trace.json"
+    else:
+       TRACE_FILE = args.matrix.replace(".matrix", "") + ".trace.json"
 
-# set system dependent variables
+    if args.profile or profiling():
+       start_profiling(TRACE_FILE)
 
-MATRIX            =  args.matrix
-BACKUP_MATRIX     = "backup.matrix"
-NORMALIZED_MATRIX = "NM-" + args.matrix
-REORDERED_MATRIX  = "NM-" + args.matrix
-R2MIN_MATRIX      = "Rm-" + args.matrix
-R2MIN_NM_MATRIX   = "Rm-NM-" + args.matrix
-TMP_MATRIX        = "tmp.matrix"
 
+  # run all tests in this process: the matrix is read once and passed in memory
+  # from one test to the other, the input matrix is left untouched
 
-# save original matrix
+    if args.in_process:
+       from cobra import run_all
+       run_all(args.matrix, vars(args))
+       if profiling():
+          merge_trace(TRACE_FILE)
+       exit()
 
-subprocess.run(["cp", args.matrix, BACKUP_MATRIX])
 
+    CURRENT_DIR = os.getcwd()
 
-# Set in matrix that 2nd line = 1 for writing best matrix
 
-file = open(BACKUP_MATRIX, "r")
-file_lines = ( file.readlines() )
-file.close()
+  # batch mode: all stages of all datasets share the pool of args.stages workers.
+  # Each dataset is prepared in its own directory, then the pcs metrics of all
+  # datasets are collected in basename.pcs of the manifest. The .pcs file of a
+  # previous run is removed, so that datasets whose tests fail show as failed
 
-file_lines[1] = "1  \n"
+    if args.batch:
+       datasets = read_manifest(args.batch, args.workdir)
 
-file = open(args.matrix, "w") 
-file.write("".join(file_lines)) 
-file.close()
+       STAGES = []
+       for dataset, Directory, MatrixFile in datasets:
+           if (args.engine == 'fortran') and is_binary_matrix(os.path.join(Directory, MatrixFile)):
+              print(' Error:  binary matrix files can be used only with -e/--engine numpy: ' + MatrixFile)
+              exit()
+           os.chdir(Directory)
+           prepare_dataset(MatrixFile, args)
+           if os.path.exists(MatrixFile.replace("matrix", "pcs")):
+              os.remove(MatrixFile.replace("matrix", "pcs"))
+           os.chdir(CURRENT_DIR)
+           STAGES = STAGES + dataset_stages(MatrixFile, args, Directory)
 
+       times, dependencies, codes = run_stages(STAGES, int(args.stages))
 
-# Print input data into basename.info
+       wall_times = []
+       for dataset, Directory, MatrixFile in datasets:
+           dataset_times = [times[s] for s in range(len(STAGES)) if STAGES[s]["name"].startswith(dataset + ": ")]
+           wall_times.append(max(t[1] for t in dataset_times) - min(t[0] for t in dataset_times))
 
-BASE_INFO = MATRIX.replace(".matrix", "")
+       PCS_TABLE = os.path.splitext(os.path.basename(args.batch))[0] + ".pcs"
+       write_batch_pcs(PCS_TABLE, [d[0] for d in datasets],
+                       [os.path.join(d[1], d[2].replace("matrix", "pcs")) for d in datasets], wall_times)
 
-file = open(BASE_INFO+".info", "w")
-file.write("CSV file                                            : " + BASE_INFO + "\n")
-file.write("No of randomizaiton/bootstrap/optimization cycles   : " + args.no_of_cycles + "\n")  
-file.write("% of top/bottom systems to predict                  : " + args.percentage_top_preds + "\n")
-file.write("% of systems out of the bag in the bootstrap cycles : " + args.percentage_bootstrap + "\n")
-file.write("% of systems out in the optimization cycles         : " + args.percentage_cycles + "\n")
-file.write("Ranking systems upward or downward                  : " + args.direction + "\n")
-file.write("cutoff to define TP/TN                              : " + args.cutoff + "\n")
-file.close()  
+       print('')
+       print(' ' + str(len(datasets)) + ' datasets, results in ' + PCS_TABLE)
+       print(' Total wall time ' + "{:9.2f}".format(max(t[1] for t in times) - min(t[0] for t in times)))
+       failed = print_failed_stages(STAGES, codes)
 
-# normalize and reorder matrix
+       if profiling():
+          record_stages(STAGES, times)
+          merge_trace(TRACE_FILE)
+          print(' Profile written to ' + TRACE_FILE)
+       exit(1 if failed else 0)
 
-print(' Reordering and normalizing matrix...')
-subprocess.run(["python", REORDER_MATRIX, "-m", args.matrix, "-d", "up", "-o", TMP_MATRIX])
-subprocess.run(["cp", TMP_MATRIX, args.matrix])
-subprocess.run(["python", NORMALIZE_MATRIX, "-m", TMP_MATRIX,"-o", NORMALIZED_MATRIX])
 
+  # single dataset in the current directory
 
-print(' Running MLR...')
-subprocess.run(["python", RUN_MLR,   "-m", args.matrix])
-subprocess.run(["python", RUN_MLR,   "-m", NORMALIZED_MATRIX])
+    prepare_dataset(args.matrix, args)
 
+    STAGES = dataset_stages(args.matrix, args)
 
-print(' Running LOO...')
-subprocess.run(["python", RUN_LOO,   "-m", R2MIN_MATRIX])
-subprocess.run(["python", RUN_LOO,   "-m", R2MIN_NM_MATRIX])
+    times, dependencies, codes = run_stages(STAGES, int(args.stages))
+    print_stage_times(STAGES, times, dependencies, codes)
 
+    if profiling():
+       record_stages(STAGES, times)
+       merge_trace(TRACE_FILE)
+       print(' Profile written to ' + TRACE_FILE)
 
-print(' Running Y-randomization...')
-subprocess.run(["python", RUN_YRAND, "-m", R2MIN_NM_MATRIX, "-n", args.no_of_cycles])
 
-print(' Running bootstrap...')
-subprocess.run(["python", RUN_BOOT,  "-m", R2MIN_NM_MATRIX, "-n", args.no_of_cycles, "-b", args.percentage_bootstrap])
+  # exit code 1 if any stage failed or was skipped
 
-print(' Running top systems predictions...')
-subprocess.run(["python", RUN_PRED,  "-m", NORMALIZED_MATRIX, "-t", args.percentage_top_preds, "-d", args.direction])
+    if any(code != 0 for code in codes):
+       exit(1)
 
-print(' Running optimization cycles...')
-subprocess.run(["python", RUN_BAGS,  "-m",            MATRIX, "-o", args.percentage_cycles, "-d", args.direction, "-c", args.cutoff, "-n", args.no_of_cycles])
+    return()
 
 
-subprocess.run(["python", RUN_PCS,   "-m", args.matrix])
+if __name__ == '__main__':
+    main()